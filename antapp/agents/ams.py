@@ -1,12 +1,16 @@
 from agents import Agent, Runner, function_tool
 from pydantic import BaseModel, Field
 import os
-import base64
+import asyncio
 import json
 import logging
 from datetime import datetime
 from typing import Optional
 from antapp.agents.utils.bank_tools import BankTools
+from antapp.metrics import agent_run_seconds
+from antapp.openai.admission import admission, agent_model
+from antapp.openai.images import image_pipeline
+from antapp.tracing import current_span, record_usage, start_span, traced
 
 logger = logging.getLogger(__name__)
 
@@ -51,42 +55,45 @@ class LicenseInfo(BaseModel):
 
 # 定义工具
 @function_tool
+@traced("tool.verify_business_license")
 def verify_business_license(license_info: LicenseInfo) -> bool:
     """验证营业执照信息的有效性"""
-    logger.info(f"开始验证营业执照: {license_info.acctName}")
+    logger.info("开始验证营业执照: %s", license_info.acctName)
     result = bank_tools.verify_business_license(license_info.dict())
-    logger.info(f"验证结果: {result}")
+    logger.info("验证结果: %s", result)
     return result["verified"]
 
 @function_tool
+@traced("tool.check_blacklist")
 def check_blacklist(license_info: LicenseInfo) -> bool:
     """检查企业是否在黑名单中"""
     try:
-        logger.info(f"开始检查黑名单: {license_info.acctName}")
+        logger.info("开始检查黑名单: %s", license_info.acctName)
         result = bank_tools.check_blacklist(
             license_info.acctName,  # 使用 acctName 作为企业名称
             license_info.uscc       # 使用 uscc 作为统一社会信用代码
         )
-        logger.info(f"黑名单检查结果: {result}")
+        logger.info("黑名单检查结果: %s", result)
         return result
     except Exception as e:
-        logger.error(f"黑名单检查出错: {str(e)}")
+        logger.error("黑名单检查出错: %s", str(e))
         raise Exception(f"黑名单检查失败: {str(e)}")
 
 @function_tool
+@traced("tool.create_account")
 def create_account(license_info: LicenseInfo) -> str:
     """执行开户操作，返回账号"""
     try:
-        logger.info(f"开始创建账户: {license_info.acctName}")
-        logger.info(f"开户请求数据: {license_info.dict()}")
+        logger.info("开始创建账户: %s", license_info.acctName)
+        logger.info("开户请求数据: %s", license_info)
         result = bank_tools.open_account(license_info.dict())
-        logger.info(f"开户结果: {result}")
+        logger.info("开户结果: %s", result)
         if result["success"]:
             return result["account_info"]["account_number"]
         else:
             raise Exception(f"开户失败: {result.get('message', '未知错误')}")
     except Exception as e:
-        logger.error(f"创建账户出错: {str(e)}")
+        logger.error("创建账户出错: %s", str(e))
         raise Exception(f"创建账户失败: {str(e)}")
 
 # 营业执照解析Agent
@@ -211,6 +218,7 @@ account_open_agent = Agent(
     tools=[verify_business_license, check_blacklist, create_account]
 )
 
+@traced("ams.main")
 async def main(input_data, images):
     # 创建上下文
     class Context:
@@ -218,13 +226,11 @@ async def main(input_data, images):
             self.context = {}
     ctx = Context()
     
-    # 构建图片消息
-    image_base64_list = []
-    for image in images:
-        image_data = image.read()
-        base64_data = base64.b64encode(image_data).decode('utf-8')
-        image_base64_list.append(base64_data)
-        logger.info(f"图片 {image.name} 已转换为base64")
+    # 构建图片消息（预处理：识别格式、缩小、去 EXIF、去重）
+    with start_span("ams.encode_images", images=len(images),
+                    input_bytes=sum(getattr(image, "size", 0) or 0 for image in images)) as span:
+        image_urls = await asyncio.to_thread(image_pipeline.data_urls, images)
+        span.set(output_bytes=sum(len(url) for url in image_urls))
     
     # 构建消息
     messages = [
@@ -232,52 +238,63 @@ async def main(input_data, images):
             "role": "user",
             "content": [
                 {"type": "input_text", "text": input_data},
-                *[{"type": "input_image", "image_url": f"data:image/jpeg;base64,{base64_data}"} 
-                for base64_data in image_base64_list]
+                *[{"type": "input_image", "image_url": url} for url in image_urls]
             ]
         }
     ]
     
     # 解析营业执照
-    license_result = await Runner.run(license_analysis_agent, messages, context=ctx.context)
+    async with admission.aslot(agent_model(license_analysis_agent)):
+        with agent_run_seconds.time(agent=license_analysis_agent.name, stage="license"), \
+                start_span("ams.license_agent", agent=license_analysis_agent.name) as span:
+            license_result = await Runner.run(license_analysis_agent, messages, context=ctx.context)
+            record_usage(span, license_result)
     if not license_result or not license_result.final_output:
+        current_span().set(outcome="license_empty")
         return "营业执照解析失败，请重试"
     
-    logger.info(f"营业执照解析结果: {license_result.final_output}")
+    logger.info("营业执照解析结果: %s", license_result.final_output)
     
     try:
-        # 如果输出已经是字典，直接使用
-        if isinstance(license_result.final_output, dict):
-            license_info_dict = license_result.final_output
-        else:
-            # 清理输出中的 Markdown 格式
-            output_text = license_result.final_output
-            if "```json" in output_text:
-                # 提取 JSON 部分
-                output_text = output_text.split("```json")[-1].split("```")[0].strip()
-            
-            # 尝试解析 JSON 字符串
-            license_info_dict = json.loads(output_text)
-        
+        with start_span("ams.extract_json") as span:
+            # 如果输出已经是字典，直接使用
+            if isinstance(license_result.final_output, dict):
+                license_info_dict = license_result.final_output
+            else:
+                # 清理输出中的 Markdown 格式
+                output_text = license_result.final_output
+                span.set(output_chars=len(output_text))
+                if "```json" in output_text:
+                    # 提取 JSON 部分
+                    output_text = output_text.split("```json")[-1].split("```")[0].strip()
+
+                # 尝试解析 JSON 字符串
+                license_info_dict = json.loads(output_text)
+
         # 创建 LicenseInfo 实例
-        license_info = LicenseInfo(**license_info_dict)
-        logger.info(f"处理后的营业执照信息: {license_info}")
+        with start_span("ams.validate", fields=len(license_info_dict)):
+            license_info = LicenseInfo(**license_info_dict)
+        logger.info("处理后的营业执照信息: %s", license_info)
         
         # 处理开户
-        account_result = await Runner.run(
-            account_open_agent, 
-            json.dumps(license_info.dict()),
-            context=ctx.context
-        )
+        async with admission.aslot(agent_model(account_open_agent)):
+            with agent_run_seconds.time(agent=account_open_agent.name, stage="account"), \
+                    start_span("ams.account_agent", agent=account_open_agent.name) as span:
+                account_result = await Runner.run(
+                    account_open_agent,
+                    json.dumps(license_info.dict()),
+                    context=ctx.context
+                )
+                record_usage(span, account_result)
         
-        logger.info(f"开户结果: {account_result.final_output}")
+        logger.info("开户结果: %s", account_result.final_output)
         return account_result.final_output
             
     except (json.JSONDecodeError, KeyError, ValueError) as e:
-        logger.error(f"处理营业执照信息失败: {str(e)}")
-        logger.error(f"原始输出: {license_result.final_output}")
+        logger.error("处理营业执照信息失败: %s", str(e))
+        logger.error("原始输出: %s", license_result.final_output)
+        current_span().set(outcome="invalid_license", error=str(e))
         return "处理营业执照信息失败，请重试"
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main()) 
\ No newline at end of file
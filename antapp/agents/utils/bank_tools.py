@@ -3,7 +3,9 @@ import random
 import string
 from datetime import datetime
 import requests
-import json
+
+from antapp.metrics import bank_tool_errors, bank_tool_seconds, track_call
+from antapp.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,8 @@ class BankTools:
         self.api_key = api_key
         # 在实际项目中，这里会初始化与行内系统的连接
     
+    @track_call(bank_tool_seconds, bank_tool_errors, method="call_remote_api")
+    @traced("bank.call_remote_api")
     def call_remote_api(self, data):
         """
         调用远程开户接口
@@ -36,8 +40,8 @@ class BankTools:
                 'Content-Type': 'application/json'
             }
             
-            logger.info(f"发送开户请求到: {url}")
-            logger.info(f"请求数据: {json.dumps(data, ensure_ascii=False)}")
+            logger.info("发送开户请求到: %s", url)
+            logger.info("请求数据: %s", data)
             
             response = requests.post(
                 url=url,
@@ -48,13 +52,14 @@ class BankTools:
             
             response.raise_for_status()
             response_data = response.json()
-            logger.info(f"开户接口响应: {response_data}")
+            logger.info("开户接口响应: %s", response_data)
             return response_data
             
         except Exception as e:
-            logger.error(f"调用远程接口失败: {str(e)}")
+            logger.error("调用远程接口失败: %s", str(e))
             raise Exception(f"调用远程接口失败: {str(e)}")
     
+    @track_call(bank_tool_seconds, bank_tool_errors, method="verify_business_license")
     def verify_business_license(self, license_info):
         """
         调用行内系统验证营业执照信息
@@ -65,7 +70,7 @@ class BankTools:
         Returns:
             dict: 验证结果
         """
-        logger.info(f"验证营业执照信息: {license_info.get('depositorName', '未知企业')}")
+        logger.info("验证营业执照信息: %s", license_info.get('depositorName', '未知企业'))
         
         # 实际项目中应调用行内验证接口
         # 这里模拟验证结果
@@ -74,6 +79,7 @@ class BankTools:
             "message": "营业执照信息验证通过"
         }
     
+    @track_call(bank_tool_seconds, bank_tool_errors, method="check_blacklist")
     def check_blacklist(self, depositorName, fileNo1):
         """
         检查企业是否在黑名单中
@@ -85,16 +91,17 @@ class BankTools:
         Returns:
             bool: 是否在黑名单中
         """
-        logger.info(f"检查企业黑名单: {depositorName}")
+        logger.info("检查企业黑名单: %s", depositorName)
         
         # 实际项目中应调用行内黑名单查询接口
         # 这里模拟查询结果
         return False
     
+    @track_call(bank_tool_seconds, bank_tool_errors, method="open_account")
     def open_account(self, business_info):
         """执行开户操作"""
         try:
-            logger.info(f"开户请求数据: {business_info}")
+            logger.info("开户请求数据: %s", business_info)
             # 生成账号
             account_number = self._generate_account_number()
             # 添加账号到业务数据中
@@ -116,11 +123,11 @@ class BankTools:
             if(remote_result.get("rtncode") == "000000"):
                 result["success"] = True
                 result["message"] = "开户成功"
-                logger.info(f"开户成功: {result}")
+                logger.info("开户成功: %s", result)
             else:
                 result["success"] = False
                 result["message"] = remote_result.get("rtnmsg", "开户失败，未知错误")
-                logger.error(f"开户失败: {result}")
+                logger.error("开户失败: %s", result)
             return result
             
         except Exception as e:
@@ -128,9 +135,10 @@ class BankTools:
                 "success": False,
                 "message": f"开户失败：{str(e)}"
             }
-            logger.error(f"开户操作异常: {error_result}")
+            logger.error("开户操作异常: %s", error_result)
             return error_result
     
+    @track_call(bank_tool_seconds, bank_tool_errors, method="close_account")
     def close_account(self, account_info):
         """
         调用行内销户系统接口（当前未实现，为未来扩展预留）
@@ -141,7 +149,7 @@ class BankTools:
         Returns:
             dict: 销户结果
         """
-        logger.info(f"调用销户接口: {account_info.get('account_number', '未知账号')}")
+        logger.info("调用销户接口: %s", account_info.get('account_number', '未知账号'))
         
         # 实际项目中应调用行内销户接口
         # 当前未实现
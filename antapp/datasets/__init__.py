@@ -0,0 +1,4 @@
+from .cache import DatasetCache, dataset_cache, load_dataset
+from .text_index import NgramIndex, text_index
+
+__all__ = ['DatasetCache', 'dataset_cache', 'load_dataset', 'NgramIndex', 'text_index']
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from antapp.loggingMy import get_logger
+from .paths import file_version, resolve_path
+from .sidecar import read_dataset
+
+logger = get_logger(__name__)
+
+# 默认内存预算：256MB
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def frame_nbytes(df):
+    """估算 DataFrame 占用的内存字节数"""
+    try:
+        return int(df.memory_usage(deep=True).sum())
+    except Exception:
+        return 0
+
+
+class CacheEntry:
+    """缓存条目：同一文件版本的 DataFrame 以及由它派生出的数据（索引、排序等）"""
+
+    def __init__(self, path, version, frame, nbytes):
+        self.path = path
+        self.version = version
+        self.frame = frame
+        self.nbytes = nbytes
+        self.derived = {}
+
+
+class DatasetCache:
+    """
+    进程内数据集缓存
+
+    每个文件保留一个版本，以 (mtime, size) 判断版本，每个 worker 进程只解析一次工作簿，
+    文件被替换后版本变化会自动重新加载。总内存超过预算时按 LRU 淘汰。
+    """
+
+    def __init__(self, max_bytes=None, loader=None):
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(
+            settings, "DATASET_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+        self.loader = loader or read_dataset
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._builders = {}
+        # 由文件监听器开启：文件变化后先返回旧版本，on_stale(path) 负责安排后台重新加载
+        self.serve_stale = False
+        self.on_stale = None
+        self.stale_hits = 0
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+
+    def get_entry(self, path):
+        """
+        获取数据集缓存条目，未命中时加载
+
+        开启 serve_stale 后（由文件监听器设置），文件已变化但缓存中还有旧版本时直接返回旧版本，
+        并通过 on_stale 通知后台重新加载，请求不会阻塞在解析上。
+
+        Args:
+            path: 相对 datas/ 的路径或绝对路径
+
+        Returns:
+            CacheEntry: 当前文件版本对应的缓存条目
+        """
+        path = resolve_path(path)
+        version = file_version(path)
+        name = str(path)
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and (entry.version == version or self._serve_stale(path)):
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # 同一文件只允许一个线程解析，其余线程等待结果
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+            return self._load(path, version)
+
+    def _serve_stale(self, path):
+        if not self.serve_stale or self.on_stale is None:
+            return False
+        self.stale_hits += 1
+        self.on_stale(path)
+        return True
+
+    def refresh(self, path):
+        """
+        在当前线程重新加载数据集，并预先构建旧版本上用过的派生数据，完成后原子替换缓存条目
+
+        Args:
+            path: 数据集路径
+
+        Returns:
+            CacheEntry: 新版本的缓存条目
+        """
+        path = resolve_path(path)
+        name = str(path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            version = file_version(path)
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry.version == version:
+                    return entry
+            return self._load(path, version, warm=True)
+
+    def is_cached(self, path):
+        """数据集是否已有缓存（任意版本）"""
+        with self._lock:
+            return str(resolve_path(path)) in self._entries
+
+    def get(self, path):
+        """获取数据集 DataFrame（调用方不应原地修改返回值）"""
+        return self.get_entry(path).frame
+
+    def get_derived(self, path, name, builder):
+        """
+        获取与数据集版本绑定的派生数据，文件变化时随缓存条目一同失效
+
+        Args:
+            path: 数据集路径
+            name: 派生数据名称，如 ("ngram", "姓名")
+            builder: 接收 DataFrame 返回派生数据的函数
+
+        Returns:
+            builder 的返回值
+        """
+        entry = self.get_entry(path)
+        with self._lock:
+            if name in entry.derived:
+                return entry.derived[name]
+        value = builder(entry.frame)
+        with self._lock:
+            self._builders.setdefault(entry.path, {})[name] = builder
+            return entry.derived.setdefault(name, value)
+
+    def _load(self, path, version, warm=False):
+        start = time.perf_counter()
+        frame = self.loader(path)
+        entry = CacheEntry(str(path), version, frame, frame_nbytes(frame))
+        if warm:
+            with self._lock:
+                builders = dict(self._builders.get(entry.path, {}))
+            for name, builder in builders.items():
+                try:
+                    entry.derived[name] = builder(frame)
+                except Exception as e:
+                    logger.warning("预构建派生数据失败: %s %s, %s", path.name, name, str(e))
+        elapsed = time.perf_counter() - start
+        logger.info("数据集已加载: %s，耗时 %.3fs，占用 %d 字节", path.name, elapsed, entry.nbytes)
+
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+            # 同一文件只保留一个版本，新版本直接替换旧版本
+            if entry.path in self._entries:
+                self._remove(entry.path)
+            self._entries[entry.path] = entry
+            self.total_bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def _remove(self, name):
+        entry = self._entries.pop(name)
+        self.total_bytes -= entry.nbytes
+
+    def _evict(self):
+        # 至少保留最近使用的一个条目，避免单个大文件反复加载
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            name = next(iter(self._entries))
+            self._remove(name)
+            self.evictions += 1
+            logger.info("数据集缓存超出预算，淘汰: %s", name)
+
+    def invalidate(self, path=None):
+        """清除指定数据集或全部数据集的缓存"""
+        with self._lock:
+            names = list(self._entries) if path is None else [str(resolve_path(path))]
+            for name in names:
+                if name in self._entries:
+                    self._remove(name)
+
+    def stats(self):
+        """返回缓存计数器"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "load_seconds": round(self.load_seconds, 6),
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# 进程级共享缓存
+dataset_cache = DatasetCache()
+
+
+def load_dataset(path):
+    """读取 datas/ 下的数据集（带缓存）"""
+    return dataset_cache.get(path)
@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+RESULT_CACHE_SIZE = 256
+MAX_POINTS = 5000
+
+
+def lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+
+    保留首尾两点，其余数据均分为 n-2 个桶，每个桶选出与前一个已选点、
+    下一个桶平均点构成三角形面积最大的点，能较好地保留曲线的峰谷形状。
+
+    Args:
+        x: 升序排列的横坐标（float64）
+        y: 纵坐标（float64）
+        n: 目标点数
+
+    Returns:
+        numpy.ndarray: 选中点的下标
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size) if n >= size else np.linspace(0, size - 1, num=max(n, 0), dtype=np.int64)
+
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    # 桶边界：中间 size-2 个点均分为 n-2 个桶
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    prev = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < n - 1:
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        px, py = x[prev], y[prev]
+        areas = np.abs((px - avg_x) * (y[lo:hi] - py) - (px - x[lo:hi]) * (avg_y - py))
+        prev = lo + int(np.argmax(areas))
+        selected[i + 1] = prev
+    return selected
+
+
+class _ResultCache:
+    """降采样结果的 LRU 缓存，重复刷新图表只需一次字典查找"""
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_results = _ResultCache()
+
+
+class TimeSeries:
+    """数据集中的一条数值序列，按横坐标升序排列，去掉了缺失值"""
+
+    def __init__(self, x, y, is_datetime):
+        self.x = x
+        self.y = y
+        self.is_datetime = is_datetime
+
+    @classmethod
+    def build(cls, df, x_column, y_column):
+        if x_column not in df.columns or y_column not in df.columns:
+            raise KeyError(x_column if x_column not in df.columns else y_column)
+        x = df[x_column]
+        is_datetime = not pd.api.types.is_numeric_dtype(x.dtype)
+        if is_datetime:
+            x = pd.to_datetime(x, errors="coerce")
+        y = pd.to_numeric(df[y_column], errors="coerce")
+        frame = pd.DataFrame({"x": x, "y": y}).dropna().sort_values("x", kind="stable")
+        x_values = frame["x"].to_numpy(dtype="datetime64[ns]").astype(np.int64) if is_datetime \
+            else frame["x"].to_numpy(dtype=np.float64)
+        return cls(x_values.astype(np.float64), frame["y"].to_numpy(dtype=np.float64), is_datetime)
+
+    def _bound(self, value):
+        if not value:
+            return None
+        try:
+            return float(pd.Timestamp(value).value) if self.is_datetime else float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"无法解析区间边界: {value}")
+
+    def slice(self, start=None, end=None):
+        start, end = self._bound(start), self._bound(end)
+        lo = 0 if start is None else np.searchsorted(self.x, start, side="left")
+        hi = len(self.x) if end is None else np.searchsorted(self.x, end, side="right")
+        return self.x[lo:hi], self.y[lo:hi]
+
+
+def downsample(path, x_column, y_column, n, start=None, end=None):
+    """
+    对数据集中的序列做 LTTB 降采样，结果按 (数据集版本, 序列, 区间, n) 缓存
+
+    Args:
+        path: 数据集路径
+        x_column: 横坐标列（日期或数值）
+        y_column: 数值列
+        n: 目标点数，不小于 3，超过 MAX_POINTS 时按 MAX_POINTS 处理
+        start: 区间起点（含）
+        end: 区间终点（含）
+
+    Returns:
+        dict: {"x": [...], "y": [...], "total": 区间内原始点数}
+
+    Raises:
+        ValueError: n 不是整数或小于 3，区间边界无法解析
+    """
+    try:
+        n = int(n)
+    except (TypeError, ValueError):
+        raise ValueError(f"n 必须是整数: {n}")
+    if n < 3:
+        # LTTB 至少保留首尾两点和一个桶
+        raise ValueError(f"n 不能小于 3: {n}")
+    n = min(n, MAX_POINTS)
+    entry = dataset_cache.get_entry(path)
+    key = (entry.path, entry.version, x_column, y_column, start, end, n)
+    result = _results.get(key)
+    if result is not None:
+        return result
+
+    series = dataset_cache.get_derived(path, ("series", x_column, y_column),
+                                       lambda df: TimeSeries.build(df, x_column, y_column))
+    x, y = series.slice(start, end)
+    index = lttb(x, y, n)
+    xs = x[index]
+    if series.is_datetime:
+        xs = pd.to_datetime(xs.astype(np.int64)).strftime("%Y-%m-%d %H:%M:%S").tolist()
+    else:
+        xs = xs.tolist()
+    result = {"x": xs, "y": y[index].tolist(), "total": len(x)}
+    _results.put(key, result)
+    return result
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from django.core.paginator import Paginator
+
+from .cache import dataset_cache
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+def _mixed_order(values):
+    """数字和文字混在同一列时：数字按数值排在前面，其余按文本排序，缺失值最后"""
+    series = pd.Series(values)
+    numeric = pd.to_numeric(series, errors="coerce")
+    keys = pd.DataFrame({
+        "group": np.where(numeric.notna(), 0, np.where(series.isna(), 2, 1)),
+        "number": numeric.fillna(0),
+        "text": series.where(numeric.isna() & series.notna(), "").astype(str),
+    })
+    return keys.sort_values(["group", "number", "text"], kind="mergesort").index.to_numpy()
+
+
+def _build_rank(column):
+    def build(df):
+        values = df[column].to_numpy()
+        try:
+            order = np.argsort(values, kind="stable")
+        except TypeError:
+            order = _mixed_order(values)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        # 降序不能直接反转升序结果：缺失值会排到最前，相同值的先后也会颠倒。
+        # 相同值共用一个分组号，降序按分组号倒序、组内保持原有先后，缺失值仍排在最后
+        ordered = pd.Series(values[order])
+        missing = ordered.isna().to_numpy()
+        group = np.cumsum(~ordered.eq(ordered.shift()).to_numpy(dtype=bool))
+        desc_key = np.where(missing, len(order) + 1, -group)
+        desc_order = order[np.lexsort((order, desc_key))]
+        desc_rank = np.empty(len(order), dtype=np.int64)
+        desc_rank[desc_order] = np.arange(len(order))
+        return order, rank, desc_order, desc_rank
+    return build
+
+
+def sort_rank(path, column):
+    """
+    获取列排序结果 (order, rank, desc_order, desc_rank)：order/desc_order 为升序/降序排序后的行位置，
+    rank/desc_rank 为每一行在升序/降序中的名次。两个方向都保持相同值的原有先后，缺失值排在最后
+
+    每个数据集版本只计算一次。
+    """
+    return dataset_cache.get_derived(path, ("rank", column), _build_rank(column))
+
+
+def sorted_positions(path, column, rows=None, descending=False):
+    """
+    按列排序后的行位置，排序结果每个数据集版本只计算一次
+
+    Args:
+        path: 数据集路径
+        column: 排序列
+        rows: 需要排序的行位置子集（如关键字过滤结果），为空表示全部行
+        descending: 是否降序
+
+    Returns:
+        numpy.ndarray: 排好序的行位置
+    """
+    order, rank, desc_order, desc_rank = sort_rank(path, column)
+    if descending:
+        order, rank = desc_order, desc_rank
+    if rows is None:
+        return order
+    rows = np.asarray(rows, dtype=np.int64)
+    return rows[np.argsort(rank[rows], kind="stable")]
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def paginate(df, positions, page, page_size):
+    """
+    对行位置分页，只把当前页的行转换为记录
+
+    Args:
+        df: 数据集 DataFrame
+        positions: 需要展示的行位置（已过滤、已排序）
+        page: 页码，从 1 开始，非法值按第一页/最后一页处理
+        page_size: 每页行数
+
+    Returns:
+        tuple: (Page 对象, 当前页记录列表)
+    """
+    page_obj = Paginator(positions, page_size).get_page(page)
+    records = df.iloc[page_obj.object_list].to_dict("records")
+    return page_obj, records
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from django.conf import settings
+
+
+def datas_dir():
+    """数据文件目录，默认为项目下的 datas/"""
+    return Path(getattr(settings, "DATASETS_DIR", settings.BASE_DIR / "datas"))
+
+
+def resolve_path(path):
+    """
+    把相对路径解析为 datas/ 下的绝对路径
+
+    Args:
+        path: 相对 datas/ 的路径或绝对路径
+
+    Returns:
+        Path: 解析后的绝对路径
+    """
+    path = Path(path)
+    if not path.is_absolute():
+        path = datas_dir() / path
+    return path.resolve()
+
+
+def file_version(path):
+    """返回文件版本标识 (mtime_ns, size)，文件改动后版本随之变化"""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from antapp.loggingMy import get_logger
+from .paths import file_version, resolve_path
+from .sidecar import read_dataset
+
+logger = get_logger(__name__)
+
+PRODUCTS_DIR = "产品统计表"
+CATEGORY_COLUMN = "品类"
+AGG_FUNCS = {"sum", "mean", "min", "max", "count", "median"}
+
+
+class AggregationError(ValueError):
+    """聚合参数不合法"""
+
+
+def category_of(path):
+    """从文件名中取出品类，如 产品统计表-背包.xlsx -> 背包"""
+    return path.stem.rsplit("-", 1)[-1]
+
+
+class ProductCatalog:
+    """
+    产品统计表合并数据
+
+    每个品类一个工作簿，首次加载时用常驻线程池并行读取，之后只重新读取新增或改动过的文件，
+    合并后的 DataFrame 带有品类列，并缓存到文件集合发生变化为止。
+    不用进程池：在多线程的 Django 进程里 fork 可能带着日志队列、SQLite 的锁进入子进程而死锁，
+    每次调用启动进程池的开销也抵消了并行的收益；sidecar 读取（内存映射 + Arrow 转换）大部分时间不持有 GIL。
+    """
+
+    def __init__(self, directory=PRODUCTS_DIR, max_workers=None):
+        self.directory = directory
+        self.max_workers = max_workers or min(os.cpu_count() or 1, 8)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="product-loader")
+        self._frames = {}
+        self._merged = None
+        self._merged_key = None
+        self._results = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # 由文件监听器开启：文件变化后先返回旧的合并结果，on_stale() 负责安排后台重新加载
+        self.serve_stale = False
+        self.on_stale = None
+
+    def _scan(self):
+        root = resolve_path(self.directory)
+        return {path.resolve(): file_version(path)
+                for path in sorted(root.glob("*.xlsx")) if not path.name.startswith("~$")}
+
+    def _load(self, paths):
+        start = time.perf_counter()
+        if len(paths) == 1:
+            frames = [read_dataset(paths[0])]
+        else:
+            frames = list(self._executor.map(read_dataset, paths))
+        logger.info("产品统计表已加载 %d 个文件，耗时 %.3fs", len(paths), time.perf_counter() - start)
+        return frames
+
+    def merged(self, refresh=False):
+        """
+        获取合并后的产品数据，新增/修改的文件会被增量加载，删除的文件会被移除
+
+        Args:
+            refresh: 为 True 时总是同步加载最新数据（供后台刷新使用）
+
+        Returns:
+            DataFrame: 所有品类的数据，带品类列
+        """
+        versions = self._scan()
+        key = tuple(sorted((str(p), v) for p, v in versions.items()))
+        with self._lock:
+            if key == self._merged_key:
+                return self._merged
+            if not refresh and self.serve_stale and self.on_stale and self._merged is not None:
+                self.on_stale()
+                return self._merged
+
+        # 文件读取在锁外进行，同一时间只有一个线程执行加载
+        with self._load_lock:
+            with self._lock:
+                if key == self._merged_key:
+                    return self._merged
+                frames = dict(self._frames)
+            changed = [p for p, v in versions.items() if frames.get(p, (None,))[0] != v]
+            if changed:
+                for path, df in zip(changed, self._load(changed)):
+                    df = df.copy()
+                    df.insert(0, CATEGORY_COLUMN, category_of(path))
+                    frames[path] = (versions[path], df)
+            frames = {p: frames[p] for p in frames if p in versions}
+            parts = [frames[p][1] for p in sorted(frames)]
+            merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=[CATEGORY_COLUMN])
+
+            with self._lock:
+                self._frames = frames
+                self._merged = merged
+                self._merged_key = key
+                self._results = {}
+            return merged
+
+    def _cached(self, name, compute):
+        df = self.merged()
+        if df.empty:
+            raise AggregationError(f"{PRODUCTS_DIR} 下没有可汇总的数据")
+        with self._lock:
+            results = self._results
+            if self._merged is df and name in results:
+                return results[name]
+        result = compute(df)
+        with self._lock:
+            if self._merged is df:
+                self._results[name] = result
+        return result
+
+    @staticmethod
+    def _check(df, columns, agg):
+        unknown = [c for c in columns if c not in df.columns]
+        if unknown:
+            raise AggregationError(f"未知列: {', '.join(unknown)}")
+        if agg not in AGG_FUNCS:
+            raise AggregationError(f"不支持的聚合函数: {agg}")
+
+    def aggregate(self, by, values, agg="sum"):
+        """
+        分组聚合
+
+        Args:
+            by: 分组列列表
+            values: 聚合列列表
+            agg: 聚合函数
+
+        Returns:
+            DataFrame: 以分组列为列的聚合结果
+        """
+        by, values = list(by), list(values)
+
+        def compute(df):
+            self._check(df, by + values, agg)
+            return df.groupby(by, sort=True)[values].agg(agg).reset_index()
+
+        return self._cached(("aggregate", tuple(by), tuple(values), agg), compute)
+
+    def pivot(self, index, columns, values, agg="sum"):
+        """
+        透视表
+
+        Args:
+            index: 行分组列
+            columns: 列分组列，为空时不拆分列，每个聚合列一列（如各品类的销量、收入、利润）
+            values: 聚合列或聚合列列表
+            agg: 聚合函数
+
+        Returns:
+            DataFrame: 透视结果，缺失组合填 0
+        """
+        values = [values] if isinstance(values, str) else list(values)
+
+        def compute(df):
+            self._check(df, [index, *([columns] if columns else []), *values], agg)
+            if not columns:
+                # pivot_table 会按名称重排聚合列，这里保持请求的顺序
+                return df.pivot_table(index=index, values=values, aggfunc=agg, fill_value=0)[values]
+            return df.pivot_table(index=index, columns=columns, values=values if len(values) > 1 else values[0],
+                                  aggfunc=agg, fill_value=0)
+
+        return self._cached(("pivot", index, columns, tuple(values), agg), compute)
+
+
+# 进程级共享实例
+product_catalog = ProductCatalog()
@@ -0,0 +1,194 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+from .pagination import sort_rank
+from .text_index import text_index
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# 查询参数中的保留字，其余参数按 列名__操作符=值 解析为过滤条件
+RESERVED_PARAMS = {"columns", "sort", "limit", "offset", "orient"}
+OPERATORS = {"eq", "ne", "gt", "gte", "lt", "lte", "in", "between", "contains"}
+
+
+class QueryError(ValueError):
+    """查询参数不合法"""
+
+
+def parse_query_params(params):
+    """
+    把 GET 参数解析为查询描述
+
+    例如 ?数学__gte=80&姓名__contains=伟&columns=学号,姓名&sort=-数学&limit=10&orient=columns
+
+    Args:
+        params: request.GET
+
+    Returns:
+        dict: 查询描述，结构与 POST JSON 请求体一致
+    """
+    spec = {"filters": {}}
+    for key in params:
+        value = params.get(key)
+        if key in RESERVED_PARAMS:
+            spec[key] = value.split(",") if key in ("columns", "sort") else value
+        else:
+            spec["filters"][key] = value
+    return spec
+
+
+def parse_query_body(body):
+    """解析 POST JSON 请求体"""
+    try:
+        spec = json.loads(body or b"{}")
+    except ValueError:
+        raise QueryError("请求体不是合法的 JSON")
+    if not isinstance(spec, dict):
+        raise QueryError("请求体必须是 JSON 对象")
+    return spec
+
+
+def _coerce(series, value):
+    """把字符串形式的条件值转换为列的类型"""
+    if isinstance(value, str) and pd.api.types.is_numeric_dtype(series.dtype):
+        try:
+            return float(value)
+        except ValueError:
+            raise QueryError(f"列 {series.name} 需要数值条件: {value}")
+    return value
+
+
+def _comparable(series, values):
+    """
+    大小比较前统一类型：数字和文字混在一列（object 列）而条件值都是数字时，按数值比较，
+    非数字的单元格视为不满足条件
+    """
+    if series.dtype != object:
+        return series, values
+    try:
+        numbers = [float(v) for v in values]
+    except (TypeError, ValueError):
+        return series, values
+    return pd.to_numeric(series, errors="coerce"), numbers
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return value.split(",")
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    raise QueryError(f"条件值应为列表或逗号分隔的字符串: {value}")
+
+
+def _filter_mask(path, df, key, value):
+    column, _, op = key.partition("__")
+    op = op or "eq"
+    if column not in df.columns:
+        raise QueryError(f"未知列: {column}")
+    if op not in OPERATORS:
+        raise QueryError(f"不支持的操作符: {op}")
+
+    series = df[column]
+    if op == "contains":
+        # 字面量子串匹配，走 n-gram 索引
+        mask = np.zeros(len(df), dtype=bool)
+        mask[text_index(path, column).search(str(value))] = True
+        return mask
+    if op in ("in", "between"):
+        values = [_coerce(series, v) for v in _as_list(value)]
+        if op == "in":
+            return series.isin(values).to_numpy()
+        if len(values) != 2:
+            raise QueryError("between 需要两个值")
+        series, values = _comparable(series, values)
+        try:
+            return series.between(values[0], values[1]).to_numpy(dtype=bool)
+        except TypeError:
+            raise QueryError(f"列 {column} 的值类型不一致，不支持 between={value}")
+
+    value = _coerce(series, value)
+    if op in ("gt", "gte", "lt", "lte"):
+        series, (value,) = _comparable(series, [value])
+    ops = {
+        "eq": series.__eq__, "ne": series.__ne__,
+        "gt": series.__gt__, "gte": series.__ge__,
+        "lt": series.__lt__, "lte": series.__le__,
+    }
+    try:
+        return ops[op](value).fillna(False).to_numpy(dtype=bool)
+    except TypeError:
+        raise QueryError(f"列 {column} 不支持条件 {op}={value}")
+
+
+def _sort(path, df, positions, sort):
+    if isinstance(sort, str):
+        sort = [sort]
+    keys = []
+    for item in sort or []:
+        descending = item.startswith("-")
+        column = item.lstrip("-")
+        if column not in df.columns:
+            raise QueryError(f"未知排序列: {column}")
+        # 复用缓存的全表名次，子集排序只需比较整数；降序用降序名次，缺失值仍排在最后
+        _, rank, _, desc_rank = sort_rank(path, column)
+        keys.append((desc_rank if descending else rank)[positions])
+    if not keys:
+        return positions
+    return positions[np.lexsort(keys[::-1])]
+
+
+def _parse_int(value, default, name):
+    if value in (None, ""):
+        return default
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} 必须是整数")
+
+
+def run_query(path, spec):
+    """
+    在缓存的数据集上执行查询
+
+    Args:
+        path: 工作簿路径
+        spec: 查询描述，包含 filters / columns / sort / limit / offset / orient
+
+    Returns:
+        dict: 可直接序列化为 JSON 的查询结果
+
+    Raises:
+        QueryError: 查询参数不合法
+    """
+    df = dataset_cache.get(path)
+
+    filters = spec.get("filters") or {}
+    if not isinstance(filters, dict):
+        raise QueryError("filters 必须是 {列名__操作符: 值} 形式的对象")
+    mask = np.ones(len(df), dtype=bool)
+    for key, value in filters.items():
+        mask &= _filter_mask(path, df, key, value)
+    positions = np.flatnonzero(mask)
+    positions = _sort(path, df, positions, spec.get("sort"))
+
+    columns = spec.get("columns") or list(df.columns)
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise QueryError(f"未知列: {', '.join(map(str, unknown))}")
+
+    offset = _parse_int(spec.get("offset"), 0, "offset")
+    limit = min(_parse_int(spec.get("limit"), DEFAULT_LIMIT, "limit"), MAX_LIMIT)
+    page = df.iloc[positions[offset:offset + limit]][columns]
+    # NaN 不是合法 JSON，转换为 null
+    page = page.astype(object).where(page.notna(), None)
+
+    result = {"total": len(positions), "offset": offset, "limit": limit, "columns": columns}
+    if spec.get("orient") == "columns":
+        result["data"] = {column: page[column].tolist() for column in columns}
+    else:
+        result["rows"] = page.values.tolist()
+    return result
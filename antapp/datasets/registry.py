@@ -0,0 +1,40 @@
+from django.conf import settings
+
+from .paths import datas_dir, resolve_path
+from .sidecar import iter_workbooks
+
+
+class DatasetNotFound(KeyError):
+    """数据集未注册"""
+
+
+def registered_datasets():
+    """
+    已注册的数据集：名称 -> 工作簿路径
+
+    datas/ 下每个工作簿按文件名（不含扩展名）自动注册，重名时使用相对路径；
+    settings.DATASET_ALIASES 中可以配置额外的别名。
+    """
+    root = datas_dir()
+    datasets = {}
+    for path in iter_workbooks(root):
+        name = path.stem
+        if name in datasets:
+            name = path.relative_to(root).with_suffix("").as_posix()
+        datasets[name] = path
+    for alias, relpath in getattr(settings, "DATASET_ALIASES", {}).items():
+        datasets[alias] = resolve_path(relpath)
+    return datasets
+
+
+def dataset_path(name):
+    """
+    根据数据集名称获取工作簿路径
+
+    Raises:
+        DatasetNotFound: 数据集未注册
+    """
+    path = registered_datasets().get(name)
+    if path is None or not path.exists():
+        raise DatasetNotFound(name)
+    return path
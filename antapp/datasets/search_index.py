@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from django.conf import settings
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from antapp.loggingMy import get_logger
+from .paths import datas_dir, file_version, resolve_path
+from .sidecar import iter_workbooks
+
+logger = get_logger(__name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# trigram 分词器对中文按字切分，支持任意子串查询（需要 SQLite 3.34+）
+MIN_MATCH_LENGTH = 3
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class CellSearchIndex:
+    """
+    datas/ 下所有工作簿单元格的全文索引，保存在本地 SQLite FTS5 数据库中
+
+    以文件 mtime/size 判断是否需要重建，每次只重新索引发生变化的工作簿。
+    文件监听器运行时由它逐个文件增量更新（watched 为 True），搜索请求不再检查索引。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = str(db_path or getattr(settings, "DATASET_SEARCH_DB",
+                                              settings.BASE_DIR / "dataset_search.sqlite3"))
+        self._write_lock = threading.Lock()
+        self._initialized = False
+        # 上次同步时各工作簿的版本，为空表示还没有同步过
+        self._synced = None
+        self.watched = False
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_schema(self, conn):
+        if self._initialized:
+            return
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cells USING fts5("
+                         "value, path UNINDEXED, sheet UNINDEXED, row UNINDEXED, col UNINDEXED, "
+                         "tokenize='trigram')")
+        except sqlite3.OperationalError:
+            # 旧版本 SQLite 不支持 trigram，短语查询仍可用
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS cells USING fts5("
+                         "value, path UNINDEXED, sheet UNINDEXED, row UNINDEXED, col UNINDEXED)")
+        conn.commit()
+        self._initialized = True
+
+    @staticmethod
+    def _iter_cells(path):
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                for row, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    for col, value in enumerate(values, start=1):
+                        if value is None or value == "":
+                            continue
+                        yield str(value), sheet.title, row, get_column_letter(col)
+        finally:
+            workbook.close()
+
+    def _relative(self, path):
+        root = datas_dir().resolve()
+        return path.relative_to(root).as_posix() if path.is_relative_to(root) else str(path)
+
+    def update_file(self, path):
+        """
+        重新索引单个工作簿，文件已删除时移除其索引
+
+        Args:
+            path: 工作簿路径
+
+        Returns:
+            bool: 是否重新建立了索引
+        """
+        path = resolve_path(path)
+        name = self._relative(path)
+        with self._write_lock, closing(self._connect()) as conn:
+            self._init_schema(conn)
+            if not path.exists():
+                conn.execute("DELETE FROM cells WHERE path = ?", (name,))
+                conn.execute("DELETE FROM files WHERE path = ?", (name,))
+                conn.commit()
+                return False
+
+            version = file_version(path)
+            if conn.execute("SELECT mtime_ns, size FROM files WHERE path = ?", (name,)).fetchone() == version:
+                return False
+
+            start = time.perf_counter()
+            conn.execute("DELETE FROM cells WHERE path = ?", (name,))
+            conn.executemany("INSERT INTO cells (value, path, sheet, row, col) VALUES (?, ?, ?, ?, ?)",
+                             ((value, name, sheet, row, col) for value, sheet, row, col in self._iter_cells(path)))
+            conn.execute("INSERT OR REPLACE INTO files (path, mtime_ns, size) VALUES (?, ?, ?)", (name, *version))
+            conn.commit()
+            logger.info("单元格索引已更新: %s，耗时 %.3fs", name, time.perf_counter() - start)
+            return True
+
+    def update(self):
+        """
+        增量更新索引：只重新索引新增或修改过的工作簿，并清理已删除的工作簿
+
+        Returns:
+            int: 重新索引的文件数
+        """
+        current = {self._relative(path): path for path in iter_workbooks()}
+        with closing(self._connect()) as conn:
+            self._init_schema(conn)
+            indexed = {path: (mtime_ns, size) for path, mtime_ns, size in
+                       conn.execute("SELECT path, mtime_ns, size FROM files")}
+        updated = 0
+        for name, path in current.items():
+            if indexed.get(name) != file_version(path):
+                updated += self.update_file(path)
+        for name in set(indexed) - set(current):
+            self.update_file(datas_dir() / name)
+        return updated
+
+    def refresh(self):
+        """
+        搜索前调用：只在工作簿发生变化时更新索引
+
+        监听器运行时只需首次同步；否则比较各工作簿的 mtime/size，与上次同步时一致则不访问数据库。
+
+        Returns:
+            int: 重新索引的文件数
+        """
+        if self.watched and self._synced is not None:
+            return 0
+        versions = {path: file_version(path) for path in iter_workbooks()}
+        if versions == self._synced:
+            return 0
+        updated = self.update()
+        self._synced = versions
+        return updated
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        查询包含关键字的单元格
+
+        Args:
+            query: 关键字，按字面量子串匹配
+            limit: 最多返回的条数
+
+        Returns:
+            list: [{"file", "sheet", "row", "column", "value"}]
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        limit = min(max(int(limit), 1), MAX_LIMIT)
+        with closing(self._connect()) as conn:
+            self._init_schema(conn)
+            if len(query) >= MIN_MATCH_LENGTH:
+                # 整体作为短语查询，避免用户输入被解析为 FTS 语法
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = conn.execute("SELECT path, sheet, row, col, value FROM cells WHERE cells MATCH ? "
+                                    "ORDER BY rank LIMIT ?", (phrase, limit)).fetchall()
+            else:
+                rows = conn.execute("SELECT path, sheet, row, col, value FROM cells WHERE value LIKE ? ESCAPE '\\' "
+                                    "LIMIT ?", (f"%{_escape_like(query)}%", limit)).fetchall()
+        return [{"file": path, "sheet": sheet, "row": row, "column": col, "value": value}
+                for path, sheet, row, col, value in rows]
+
+
+# 进程级共享实例
+cell_index = CellSearchIndex()
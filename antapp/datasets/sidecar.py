@@ -0,0 +1,149 @@
+import os
+import time
+
+import pandas as pd
+from django.conf import settings
+
+from antapp.loggingMy import get_logger
+from .paths import datas_dir, file_version, resolve_path
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow 未安装时退回直接读取 Excel
+    pa = None
+
+logger = get_logger(__name__)
+
+SIDECAR_SUFFIX = ".arrow"
+# 写入 Arrow schema 元数据中的源文件版本
+_META_MTIME = b"antapp.source_mtime_ns"
+_META_SIZE = b"antapp.source_size"
+
+
+def sidecars_enabled():
+    return pa is not None and getattr(settings, "DATASET_SIDECARS", True)
+
+
+def sidecar_path(path):
+    """工作簿对应的列式 sidecar 文件路径，与工作簿放在同一目录"""
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def iter_workbooks(root=None):
+    """遍历 datas/ 下的所有工作簿（忽略 Excel 的临时锁文件）"""
+    root = root or datas_dir()
+    for path in sorted(root.rglob("*.xlsx")):
+        if not path.name.startswith("~$"):
+            yield path.resolve()
+
+
+def _read_version(sidecar):
+    with pa.memory_map(str(sidecar)) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    try:
+        return int(metadata[_META_MTIME]), int(metadata[_META_SIZE])
+    except (KeyError, ValueError):
+        return None
+
+
+def is_fresh(path):
+    """sidecar 是否存在且与源工作簿版本一致"""
+    path = resolve_path(path)
+    sidecar = sidecar_path(path)
+    if not sidecar.exists():
+        return False
+    try:
+        return _read_version(sidecar) == file_version(path)
+    except (OSError, pa.ArrowInvalid):
+        return False
+
+
+def build_sidecar(path, df=None):
+    """
+    把工作簿转换为 Arrow IPC（Feather v2）sidecar 文件
+
+    文件不压缩，以便读取时可以直接内存映射；先写临时文件再原子替换，
+    并发读取的请求不会读到写了一半的文件。
+
+    Args:
+        path: 工作簿路径
+        df: 已解析的 DataFrame，为空时从工作簿读取
+
+    Returns:
+        DataFrame: 工作簿内容
+    """
+    path = resolve_path(path)
+    version = file_version(path)
+    if df is None:
+        df = pd.read_excel(path)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_META_MTIME] = str(version[0]).encode()
+    metadata[_META_SIZE] = str(version[1]).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    sidecar = sidecar_path(path)
+    tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        with pa.OSFile(str(tmp), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, sidecar)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    logger.info("sidecar 已生成: %s", sidecar.name)
+    return df
+
+
+def read_sidecar(path):
+    """以内存映射方式读取 sidecar"""
+    with pa.memory_map(str(sidecar_path(path))) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+
+def read_dataset(path):
+    """
+    读取数据集：sidecar 最新时直接内存映射读取，否则解析工作簿并顺带重建 sidecar
+
+    Args:
+        path: 工作簿路径
+
+    Returns:
+        DataFrame: 工作簿第一个工作表的内容
+    """
+    path = resolve_path(path)
+    if not sidecars_enabled():
+        return pd.read_excel(path)
+    if is_fresh(path):
+        return read_sidecar(path)
+
+    df = pd.read_excel(path)
+    try:
+        build_sidecar(path, df)
+    except (OSError, pa.ArrowException) as e:
+        # 目录不可写、混合类型的列无法转换为 Arrow 等情况不影响本次读取
+        logger.warning("生成 sidecar 失败，直接使用工作簿: %s, %s", path.name, str(e))
+    return df
+
+
+def build_all(force=False):
+    """
+    为 datas/ 下所有工作簿生成或更新 sidecar
+
+    Args:
+        force: 为 True 时忽略版本检查强制重建
+
+    Returns:
+        list: (工作簿路径, 是否重建, 耗时秒) 列表
+    """
+    results = []
+    for path in iter_workbooks():
+        start = time.perf_counter()
+        rebuilt = force or not is_fresh(path)
+        if rebuilt:
+            build_sidecar(path)
+        results.append((path, rebuilt, time.perf_counter() - start))
+    return results
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+
+class NgramIndex:
+    """
+    文本列的 n-gram 倒排索引
+
+    对每个单元格文本建立长度 1..n 的 gram 到行号的倒排表（中文默认 n=2，即双字索引）。
+    查询时按字面量匹配（不当作正则），先用倒排表求交得到候选行，再做一次子串校验，
+    查询代价只与命中的倒排表长度有关，而不是整张表的行数。
+    """
+
+    def __init__(self, values, n=2):
+        self.n = n
+        self.values = ["" if pd.isna(v) else str(v) for v in values]
+        postings = {}
+        for row, text in enumerate(self.values):
+            for gram in self._grams(text):
+                postings.setdefault(gram, []).append(row)
+        self.postings = {gram: np.asarray(rows, dtype=np.int64) for gram, rows in postings.items()}
+
+    @classmethod
+    def from_series(cls, series, n=2):
+        return cls(series.tolist(), n=n)
+
+    def _grams(self, text):
+        grams = set()
+        for size in range(1, self.n + 1):
+            for i in range(len(text) - size + 1):
+                grams.add(text[i:i + size])
+        return grams
+
+    def search(self, keyword):
+        """
+        查找包含关键字的行
+
+        Args:
+            keyword: 查询关键字，按字面量匹配
+
+        Returns:
+            numpy.ndarray: 升序排列的匹配行位置
+        """
+        keyword = keyword or ""
+        if not keyword:
+            return np.arange(len(self.values))
+        if len(keyword) <= self.n:
+            return self.postings.get(keyword, np.empty(0, dtype=np.int64))
+
+        grams = {keyword[i:i + self.n] for i in range(len(keyword) - self.n + 1)}
+        lists = sorted((self.postings.get(g) for g in grams), key=lambda p: -1 if p is None else len(p))
+        if lists[0] is None:
+            return np.empty(0, dtype=np.int64)
+        candidates = lists[0]
+        for rows in lists[1:]:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if not len(candidates):
+                break
+        # gram 都出现不代表连续出现，需要再校验一次
+        return np.asarray([row for row in candidates if keyword in self.values[row]], dtype=np.int64)
+
+
+def text_index(path, column, n=2):
+    """
+    获取数据集某个文本列的 n-gram 索引，每个数据集版本只构建一次
+
+    Args:
+        path: 数据集路径
+        column: 文本列名，如 "姓名"、"学号"
+        n: gram 长度
+
+    Returns:
+        NgramIndex: 索引实例
+    """
+    return dataset_cache.get_derived(path, ("ngram", column, n),
+                                     lambda df: NgramIndex.from_series(df[column], n=n))
@@ -0,0 +1,254 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from antapp.loggingMy import get_logger
+from . import sidecar
+from .cache import dataset_cache
+from .paths import datas_dir, file_version
+from .products import PRODUCTS_DIR, product_catalog
+from .search_index import cell_index
+
+logger = get_logger(__name__)
+
+# inotify 事件掩码
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 文件写入通常持续一段时间，收到事件后等待文件稳定再处理
+DEBOUNCE_SECONDS = 1.0
+POLL_INTERVAL = 2.0
+
+
+def is_workbook(path):
+    return path.endswith(".xlsx") and not os.path.basename(path).startswith("~$")
+
+
+class _Inotify:
+    """基于 ctypes 的最小 inotify 封装，只在 Linux 上可用"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._dirs = {}
+
+    def add_tree(self, root):
+        for dirpath, _, _ in os.walk(root):
+            self.add(dirpath)
+
+    def add(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch 失败: {directory}")
+        self._dirs[wd] = directory
+
+    def read(self, timeout):
+        """等待事件，返回 [(完整路径, 掩码)]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if wd in self._dirs:
+                events.append((os.path.join(self._dirs[wd], os.fsdecode(name)), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DatasetWatcher:
+    """
+    监听 datas/ 目录，文件变化后在后台线程重建 sidecar 和缓存
+
+    优先使用 inotify，不可用时退回定时轮询。重新加载在单独的工作线程中完成，
+    完成前请求继续使用缓存中的旧版本（DatasetCache.serve_stale），新版本就绪后原子替换。
+    """
+
+    def __init__(self, root=None, poll_interval=POLL_INTERVAL, debounce=DEBOUNCE_SECONDS):
+        self.root = str(root or datas_dir())
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.listeners = []
+        self._pending = {}
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dataset-reload")
+        self.mode = None
+
+    def add_listener(self, callback):
+        """注册文件变化回调 callback(path)，在工作线程中调用"""
+        self.listeners.append(callback)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        dataset_cache.on_stale = self.schedule
+        dataset_cache.serve_stale = True
+        product_catalog.on_stale = lambda: self.schedule(os.path.join(self.root, PRODUCTS_DIR))
+        product_catalog.serve_stale = True
+        self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        dataset_cache.serve_stale = False
+        product_catalog.serve_stale = False
+        cell_index.watched = False
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        try:
+            inotify = _Inotify()
+            inotify.add_tree(self.root)
+        except (OSError, AttributeError) as e:
+            logger.info("inotify 不可用，改为轮询 datas/: %s", str(e))
+            self.mode = "poll"
+            self._poll_loop()
+            return
+
+        self.mode = "inotify"
+        logger.info("开始监听数据目录: %s", self.root)
+        try:
+            while not self._stop.is_set():
+                for path, mask in inotify.read(timeout=min(self.debounce, 1.0)):
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            inotify.add_tree(path)
+                    elif is_workbook(path):
+                        self._touch(path)
+                self._flush()
+        finally:
+            inotify.close()
+
+    def _poll_loop(self):
+        versions = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            for path in set(versions) | set(current):
+                if versions.get(path) != current.get(path):
+                    self._touch(path)
+            versions = current
+            self._flush()
+
+    def _snapshot(self):
+        versions = {}
+        for path in sidecar.iter_workbooks(datas_dir()):
+            try:
+                versions[str(path)] = file_version(path)
+            except FileNotFoundError:
+                pass
+        return versions
+
+    def _touch(self, path):
+        with self._lock:
+            self._pending[path] = time.monotonic()
+
+    def _flush(self):
+        """把已稳定（超过防抖时间没有新事件）的文件交给工作线程"""
+        now = time.monotonic()
+        with self._lock:
+            ready = [p for p, t in self._pending.items() if now - t >= self.debounce]
+            for path in ready:
+                del self._pending[path]
+        for path in ready:
+            self.schedule(path)
+
+    def schedule(self, path):
+        """安排后台重新加载，同一路径同一时间只排队一次"""
+        path = str(path)
+        with self._lock:
+            if path in self._scheduled:
+                return
+            self._scheduled.add(path)
+        self._executor.submit(self._reload, path)
+
+    def _reload(self, path):
+        with self._lock:
+            self._scheduled.discard(path)
+        try:
+            if os.path.isdir(path):
+                product_catalog.merged(refresh=True)
+                return
+            exists = os.path.exists(path)
+            if exists and sidecar.sidecars_enabled() and not sidecar.is_fresh(path):
+                sidecar.build_sidecar(path)
+            if exists and dataset_cache.is_cached(path):
+                dataset_cache.refresh(path)
+            elif not exists:
+                dataset_cache.invalidate(path)
+            if os.path.dirname(path) == os.path.join(self.root, PRODUCTS_DIR):
+                product_catalog.merged(refresh=True)
+            for listener in self.listeners:
+                listener(path)
+            logger.info("数据文件已重新加载: %s", path)
+        except Exception as e:
+            logger.error("重新加载数据文件失败: %s, %s", path, str(e))
+
+
+watcher = None
+
+
+def _reset_after_fork():
+    """
+    fork 出的子进程里没有监听线程和重新加载线程，关闭"先返回旧数据、后台重新加载"的模式，
+    缓存退回按文件版本同步校验
+    """
+    global watcher
+    if watcher is not None:
+        watcher = None
+        dataset_cache.serve_stale = False
+        product_catalog.serve_stale = False
+        cell_index.watched = False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_watcher():
+    """
+    启动进程级文件监听器
+
+    只由处理请求的入口 antproject/wsgi.py、asgi.py 调用（runserver 也经由 wsgi.py 加载应用），
+    管理命令、测试和其他导入 Django 的脚本不会启动；settings.DATASET_WATCHER 为 False 时不启动。
+    """
+    global watcher
+    if watcher is None and getattr(settings, "DATASET_WATCHER", True):
+        watcher = DatasetWatcher()
+        # 单元格全文索引随文件变化增量更新
+        watcher.add_listener(cell_index.update_file)
+        cell_index.watched = True
+        watcher.start()
+    return watcher
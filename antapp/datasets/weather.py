@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from .cache import dataset_cache
+
+WEATHER_DATASET = "北京10年天气数据.xlsx"
+FREQUENCIES = {"daily": None, "monthly": "MS", "yearly": "YS"}
+ROLLING_WINDOWS = (7, 30)
+
+
+def _parse_date(value):
+    """把查询参数中的日期（2015、2015-06、2015-06-01）转换为 datetime64"""
+    if not value:
+        return None
+    try:
+        return np.datetime64(pd.Timestamp(value))
+    except (ValueError, TypeError):
+        raise ValueError(f"无法解析日期: {value}")
+
+
+class WeatherRollups:
+    """
+    北京天气数据的日/月/年汇总
+
+    所有汇总在数据集版本变化时只计算一次；每个粒度保存一份升序的日期数组，
+    区间查询用二分查找定位切片边界，不需要对整张表做布尔过滤。
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.dates = {freq: df["日期"].to_numpy(dtype="datetime64[ns]") for freq, df in frames.items()}
+
+    @classmethod
+    def build(cls, df):
+        daily = pd.DataFrame({
+            "日期": pd.to_datetime(df["日期"], format="%Y-%m-%d", errors="coerce"),
+            "最高温": df["最高温"].astype(float),
+            "最低温": df["最低温"].astype(float),
+        }).dropna(subset=["日期"]).sort_values("日期", kind="stable")
+        daily["平均温"] = (daily["最高温"] + daily["最低温"]) / 2
+
+        # 基于时间的滚动窗口，缺失日期不会让窗口错位
+        indexed = daily.set_index("日期")
+        for window in ROLLING_WINDOWS:
+            daily[f"平均温_{window}日"] = indexed["平均温"].rolling(f"{window}D").mean().to_numpy()
+
+        frames = {"daily": daily.reset_index(drop=True)}
+        for freq, rule in FREQUENCIES.items():
+            if rule is None:
+                continue
+            grouped = indexed.resample(rule)
+            rollup = pd.DataFrame({
+                "最高温": grouped["最高温"].max(),
+                "最低温": grouped["最低温"].min(),
+                "平均最高温": grouped["最高温"].mean(),
+                "平均最低温": grouped["最低温"].mean(),
+                "平均温": grouped["平均温"].mean(),
+                "天数": grouped["平均温"].count(),
+            })
+            # 按日期标签对齐求同比，缺失的月份/年份不会错位
+            period = 12 if freq == "monthly" else 1
+            previous = rollup["平均温"].shift(period, freq=rule).reindex(rollup.index)
+            rollup["平均温同比"] = rollup["平均温"] - previous
+            frames[freq] = rollup.rename_axis("日期").reset_index()
+        return cls(frames)
+
+    def range(self, freq, start=None, end=None):
+        """
+        按日期区间取出汇总数据
+
+        Args:
+            freq: daily / monthly / yearly
+            start: 起始日期（含），为空表示不限
+            end: 结束日期（含），为空表示不限
+
+        Returns:
+            DataFrame: 区间内的汇总行
+        """
+        if freq not in self.frames:
+            raise ValueError(f"不支持的粒度: {freq}")
+        dates = self.dates[freq]
+        start, end = _parse_date(start), _parse_date(end)
+        lo = 0 if start is None else np.searchsorted(dates, start, side="left")
+        hi = len(dates) if end is None else np.searchsorted(dates, end, side="right")
+        return self.frames[freq].iloc[lo:hi]
+
+
+def weather_rollups():
+    """获取当前版本天气数据的汇总（带缓存）"""
+    return dataset_cache.get_derived(WEATHER_DATASET, "weather_rollups", WeatherRollups.build)
@@ -1,14 +1,322 @@
+import atexit
+import itertools
 import logging
+import numbers
+import os
+import queue
+import random
+import re
+import reprlib
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # 创建logs目录
 log_dir = Path("logs")
 log_dir.mkdir(exist_ok=True)
 log_file = log_dir / "openai_api.log"
 
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# 为 1 时日志先进入队列，由后台线程写文件和标准输出，请求线程不阻塞在 I/O 上
+LOG_ASYNC = os.getenv('LOG_ASYNC', '1') == '1'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# 队列满时的处理：drop_oldest 丢弃最早的记录，block 等待后台线程写出
+LOG_OVERFLOW = os.getenv('LOG_OVERFLOW', 'drop_oldest')
+# 日志文件按大小轮转；为 0 时不在进程内轮转，交给 logrotate 等外部工具
+LOG_ROTATE = os.getenv('LOG_ROTATE', '1') == '1'
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+
+# 单个参数格式化后的最大字符数，超出部分截断
+LOG_MAX_ARG_CHARS = int(os.getenv('LOG_MAX_ARG_CHARS', '1000'))
+# DEBUG 记录的采样率（0-1），高频的调试日志只保留一部分
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+# 日志中需要脱敏的字段
+SENSITIVE_FIELDS = frozenset(
+    field.strip() for field in os.getenv('LOG_SENSITIVE_FIELDS', 'legalIdcardNo,uscc').split(',') if field.strip())
+
 # 日志是否已初始化的标志
 _log_initialized = False
+_queue_handler = None
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    多个进程共用的按大小轮转的日志文件
+
+    每个进程都可能轮转：写入前在 <日志文件>.lock 上加 flock，文件已被其他进程轮转时先重新打开，
+    再按文件实际大小判断是否轮转，锁只在检查和轮转期间持有。哪个进程先写到上限就由哪个进程轮转，
+    不会出现几个进程各自对旧文件句柄轮转、互相覆盖的情况。
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding=None):
+        self._identity = None
+        self._lock_fd = None
+        self._lock_pid = None
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def _rotation_lock(self):
+        # flock 属于打开的文件描述，fork 继承的描述与父进程共用，子进程需要自己重新打开
+        pid = os.getpid()
+        if self._lock_pid != pid:
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+            self._lock_fd = os.open(f"{self.baseFilename}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = pid
+        return self._lock_fd
+
+    def _follow(self):
+        # 其他进程轮转后，路径指向新文件，关闭旧句柄
+        if self.stream is None:
+            return
+        try:
+            stat = os.stat(self.baseFilename)
+            current = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            current = None
+        if current != self._identity:
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record):
+        try:
+            if fcntl is None:
+                if self.shouldRollover(record):
+                    self.doRollover()
+            else:
+                fd = self._rotation_lock()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    self._follow()
+                    if self.shouldRollover(record):
+                        self.doRollover()
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = self._lock_pid = None
+
+def build_handlers(path=log_file, stream=None):
+    """
+    创建实际写出日志的处理器：文件和标准输出
+
+    文件按大小轮转，多个进程写同一个文件时由先写到上限的进程轮转（见 SharedRotatingFileHandler）；
+    LOG_ROTATE=0 时使用 WatchedFileHandler，由 logrotate 等外部工具轮转
+
+    Args:
+        path: 日志文件路径
+        stream: 输出流，默认为标准输出
+
+    Returns:
+        list: 处理器列表
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    if LOG_ROTATE:
+        file_handler = SharedRotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                                 encoding='utf-8')
+    else:
+        file_handler = WatchedFileHandler(path, encoding='utf-8')
+    handlers = [
+        file_handler,
+        logging.StreamHandler(stream or sys.stdout),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def mask(value):
+    """脱敏：只保留首尾各两位"""
+    text = str(value)
+    if len(text) <= 4:
+        return "*" * len(text)
+    return text[:2] + "*" * (len(text) - 4) + text[-2:]
+
+class _BoundedRepr(reprlib.Repr):
+    """有长度上限的 repr：容器只展开前几项，字符串截断，敏感字段脱敏"""
+
+    def __init__(self, max_chars):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxdict = 16
+        self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdeque = 8
+        self.maxstring = max_chars
+        self.maxother = max_chars
+        self.maxlong = 64
+
+    def repr_dict(self, obj, level):
+        # reprlib 会先对全部键排序；这里按插入顺序只取前 maxdict 项，也只对这些项脱敏，开销与字典大小无关
+        if not obj:
+            return "{}"
+        if level <= 0:
+            return "{" + self.fillvalue + "}"
+        pieces = []
+        for key, value in itertools.islice(obj.items(), self.maxdict):
+            if isinstance(key, str) and key in SENSITIVE_FIELDS:
+                value = mask(value)
+            pieces.append(f"{self.repr1(key, level - 1)}: {self.repr1(value, level - 1)}")
+        if len(obj) > self.maxdict:
+            pieces.append(self.fillvalue)
+        return "{" + ", ".join(pieces) + "}"
+
+    def repr_instance(self, obj, level):
+        # OrderedDict、defaultdict 等字典子类同样只展开前几项
+        if isinstance(obj, dict):
+            return self.repr_dict(obj, level)
+        # Pydantic 模型按字段展开，才能对其中的敏感字段脱敏
+        dump = getattr(obj, "model_dump", None)
+        if callable(dump):
+            return f"{type(obj).__name__}({self.repr1(dump(), level)})"
+        return super().repr_instance(obj, level)
+
+class PayloadFilter(logging.Filter):
+    """
+    按需截断、采样和脱敏
+
+    挂在处理器上，只有真正会输出的记录才会经过这里：DEBUG 记录按采样率丢弃，
+    参数换成有长度上限的表示（容器只展开前几项、字符串截断），同时对敏感字段脱敏。
+    每条记录的格式化开销与参数大小无关。
+    """
+
+    _pattern = None
+
+    def __init__(self, max_chars=LOG_MAX_ARG_CHARS, debug_sample_rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.max_chars = max_chars
+        self.debug_sample_rate = debug_sample_rate
+        self._repr = _BoundedRepr(max_chars)
+        # 已经格式化成字符串（如 json.dumps 的结果）的敏感字段
+        fields = "|".join(re.escape(field) for field in sorted(SENSITIVE_FIELDS))
+        self._pattern = re.compile(
+            r"""(["']?(?:%s)["']?\s*[:=]\s*["']?)([^"',}\s]+)""" % fields) if fields else None
+
+    def _text(self, text):
+        if len(text) > self.max_chars:
+            text = f"{text[:self.max_chars]}...(共 {len(text)} 字符)"
+        if self._pattern is not None:
+            text = self._pattern.sub(lambda m: m.group(1) + mask(m.group(2)), text)
+        return text
+
+    def _arg(self, value):
+        # 数字（含 numpy 标量）原样保留，%d、%.3f 等格式仍然可用
+        if isinstance(value, numbers.Number) or value is None:
+            return value
+        if isinstance(value, str):
+            return self._text(value)
+        return self._text(self._repr.repr(value))
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0 \
+                and random.random() >= self.debug_sample_rate:
+            return False
+        if getattr(record, "_payload_filtered", False):
+            return True
+        record._payload_filtered = True
+        # 有参数时不能截断格式串，否则可能把 %s 截成一半；只截断渲染后的参数
+        if isinstance(record.msg, str) and not record.args:
+            record.msg = self._text(record.msg)
+        if isinstance(record.args, dict):
+            # 单个字典参数会被 logging 当作映射参数：消息里用了 %(key)s 时逐项处理，否则整体作为一个参数
+            if isinstance(record.msg, str) and "%(" in record.msg:
+                record.args = {key: mask(value) if key in SENSITIVE_FIELDS else self._arg(value)
+                               for key, value in record.args.items()}
+            else:
+                record.args = (self._arg(record.args),)
+        elif record.args:
+            record.args = tuple(self._arg(arg) for arg in record.args)
+        return True
+
+class _Listener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # 队列满时等后台线程腾出空位，而不是抛出 queue.Full
+        self.queue.put(self._sentinel)
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    写入有界队列的日志处理器，由 QueueListener 线程交给实际的处理器
+
+    队列满时按 overflow 处理：drop_oldest 丢弃最早的一条记录（请求线程永不阻塞），
+    block 等待队列有空位（不丢日志）。
+    """
+
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.targets = handlers
+        self.dropped = 0
+        self.listener = None
+        self.addFilter(PayloadFilter())
+        self.start()
+
+    def start(self):
+        self.listener = _Listener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """停止后台线程，队列中剩余的记录会先写完"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def reset_after_fork(self):
+        # 子进程没有父进程的后台线程，父进程队列的锁也可能处于持有状态，整个重建
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = None
+        self.start()
+
+    def enqueue(self, record):
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    oldest = self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.queue.task_done()
+                self.dropped += 1
+                if oldest is _Listener._sentinel:
+                    # 停止标记不能丢，否则 stop() 会一直等待后台线程；放回队列，丢弃本条记录
+                    self.queue.put(oldest)
+                    return
+
+def queue_handler():
+    """
+    进程内共享的队列日志处理器
+
+    也可以在 Django 的 LOGGING 中使用：{"()": "antapp.loggingMy.queue_handler"}
+
+    Returns:
+        BoundedQueueHandler: 处理器实例
+    """
+    global _queue_handler
+    if _queue_handler is None:
+        _queue_handler = BoundedQueueHandler(build_handlers())
+        atexit.register(_queue_handler.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_queue_handler.reset_after_fork)
+    return _queue_handler
 
 def setup_logging(level=logging.INFO):
     """
@@ -22,23 +330,27 @@ def setup_logging(level=logging.INFO):
     if _log_initialized:
         return
     
-    # 配置日志
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    root_logger = logging.getLogger()
+    if LOG_ASYNC:
+        # 已通过 Django LOGGING 配置时不会重复添加
+        handler = queue_handler()
+        if handler not in root_logger.handlers:
+            root_logger.addHandler(handler)
+        root_logger.setLevel(level)
+    else:
+        handlers = build_handlers()
+        payload_filter = PayloadFilter()
+        for handler in handlers:
+            handler.addFilter(payload_filter)
+        logging.basicConfig(level=level, handlers=handlers)
     
     # 设置标志为已初始化
     _log_initialized = True
     
     # 获取根日志器并记录初始化信息
-    root_logger = logging.getLogger()
-    root_logger.info("日志系统初始化完成，级别: %s", 
-                    {10: "DEBUG", 20: "INFO", 30: "WARNING", 40: "ERROR", 50: "CRITICAL"}.get(level, str(level)))
+    root_logger.info("日志系统初始化完成，级别: %s，队列模式: %s", 
+                    {10: "DEBUG", 20: "INFO", 30: "WARNING", 40: "ERROR", 50: "CRITICAL"}.get(level, str(level)),
+                    LOG_ASYNC)
 
 def get_logger(name):
     """
@@ -60,4 +372,4 @@ def get_logger(name):
 setup_logging()
 
 # 创建默认logger实例
-logger = get_logger(__name__) 
\ No newline at end of file
+logger = get_logger(__name__) 
@@ -0,0 +1,56 @@
+import itertools
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from openai import OpenAI
+
+from antapp.openai.aiClient import AiClient, build_http_client
+from antapp.openai.fake_server import FakeOpenAIServer
+
+
+# 每个请求的问题都不同，否则除第一次外都会命中回复缓存或合并到进行中的请求，测不到连接开销
+_ids = itertools.count()
+
+
+class Command(BaseCommand):
+    help = "在本地模拟接口上对比每次新建客户端与共享连接池的请求耗时和连接数"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="每种模式的请求次数")
+        parser.add_argument("--delay", type=float, default=0.0, help="模拟接口的响应延迟（秒）")
+
+    def _run(self, server, make_client, count):
+        samples = []
+        before = server.connections
+        for _ in range(count):
+            start = time.perf_counter()
+            content = "".join(AiClient(client=make_client()).get_stream_response(f"你好 #{next(_ids)}"))
+            samples.append((time.perf_counter() - start) * 1000)
+            assert content
+        samples.sort()
+        return {
+            "connections": server.connections - before,
+            "mean": statistics.mean(samples),
+            "p99": samples[int(len(samples) * 0.99) - 1],
+        }
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        with FakeOpenAIServer(delay=options["delay"]) as server:
+            def per_request():
+                # 旧行为：每个 AiClient 自带一个新的连接池
+                return OpenAI(api_key="fake", base_url=server.base_url)
+
+            shared = OpenAI(api_key="fake", base_url=server.base_url, http_client=build_http_client())
+            # 预热共享连接池
+            self._run(server, lambda: shared, 5)
+
+            results = {
+                "每次新建客户端": self._run(server, per_request, count),
+                "共享连接池": self._run(server, lambda: shared, count),
+            }
+
+        self.stdout.write(f"{'模式':<16}{'新建连接':>10}{'平均(ms)':>12}{'p99(ms)':>12}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<16}{r['connections']:>10}{r['mean']:>12.2f}{r['p99']:>12.2f}")
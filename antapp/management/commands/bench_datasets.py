@@ -0,0 +1,45 @@
+import statistics
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from antapp.datasets import sidecar
+from antapp.datasets.cache import DatasetCache
+from antapp.datasets.paths import datas_dir
+
+
+def _timeit(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "对比每个工作簿的冷加载（解析 xlsx）与热加载（内存映射 sidecar / 进程内缓存）耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="每项测量的重复次数，取中位数")
+
+    def handle(self, *args, **options):
+        if sidecar.pa is None:
+            raise CommandError("需要安装 pyarrow 才能测试 sidecar 读取")
+
+        repeat = options["repeat"]
+        root = datas_dir()
+        self.stdout.write(f"{'文件':<40}{'xlsx(ms)':>12}{'sidecar(ms)':>14}{'缓存命中(ms)':>14}{'加速比':>10}")
+        for path in sidecar.iter_workbooks():
+            sidecar.build_sidecar(path)
+            cold = _timeit(lambda: pd.read_excel(path), repeat)
+            warm = _timeit(lambda: sidecar.read_sidecar(path), repeat)
+
+            cache = DatasetCache()
+            cache.get(path)
+            cached = _timeit(lambda: cache.get(path), repeat)
+
+            speedup = cold / warm if warm else float("inf")
+            name = str(path.relative_to(root))
+            self.stdout.write(f"{name:<40}{cold:>12.2f}{warm:>14.2f}{cached:>14.4f}{speedup:>9.1f}x")
@@ -0,0 +1,101 @@
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from openai import OpenAI
+
+from antapp.loggingMy import BoundedQueueHandler, build_handlers
+from antapp.openai.aiClient import AiClient, build_http_client
+from antapp.openai.conversations import Conversation
+from antapp.openai.fake_server import FakeOpenAIServer
+
+
+class _SlowStream:
+    """模拟写入较慢的标准输出（终端、容器日志管道）"""
+
+    def __init__(self, path, delay):
+        self._file = open(path, "a", encoding="utf-8")
+        self._delay = delay
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            time.sleep(self._delay)
+            return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Command(BaseCommand):
+    help = "对比关闭日志、同步写日志和队列日志三种模式下的请求延迟（p50/p99）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400, help="每种模式的请求次数")
+        parser.add_argument("--threads", type=int, default=8, help="并发线程数")
+        parser.add_argument("--history", type=int, default=20, help="会话历史消息条数（每次请求都会整体写入日志）")
+        parser.add_argument("--payload", type=int, default=2000, help="每条历史消息的字符数")
+        parser.add_argument("--stream-delay", type=float, default=0.002, help="标准输出每次写入的延迟（秒）")
+
+    def _run(self, mode, client, options, workdir):
+        root = logging.getLogger()
+        saved = root.handlers[:]
+        for handler in saved:
+            root.removeHandler(handler)
+        stream = _SlowStream(workdir / f"{mode}.stdout", options["stream_delay"])
+        handlers = build_handlers(workdir / f"{mode}.log", stream)
+        queue_handler = None
+        if mode in ("off", "warmup"):
+            logging.disable(logging.CRITICAL)
+        elif mode == "sync":
+            for handler in handlers:
+                root.addHandler(handler)
+        else:
+            queue_handler = BoundedQueueHandler(handlers)
+            root.addHandler(queue_handler)
+
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": "历" * options["payload"]}
+                   for i in range(options["history"])]
+
+        def request(i):
+            start = time.perf_counter()
+            AiClient(client=client, conversation=Conversation(messages=list(history))).get_ai_response(f"{mode}问题{i}")
+            return time.perf_counter() - start
+
+        try:
+            with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+                samples = sorted(pool.map(request, range(options["requests"])))
+        finally:
+            logging.disable(logging.NOTSET)
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            if queue_handler is not None:
+                queue_handler.stop()
+            for handler in handlers:
+                handler.close()
+            stream.close()
+            for handler in saved:
+                root.addHandler(handler)
+        dropped = queue_handler.dropped if queue_handler is not None else 0
+        return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99) - 1] * 1000, dropped
+
+    def handle(self, *args, **options):
+        with FakeOpenAIServer() as server, tempfile.TemporaryDirectory() as tmp:
+            client = OpenAI(api_key="fake", base_url=server.base_url,
+                            http_client=build_http_client(max_connections=options["threads"]))
+            # 先预热连接池和线程，不计入结果
+            self._run("warmup", client, dict(options, requests=options["threads"] * 4), Path(tmp))
+            results = {mode: self._run(mode, client, options, Path(tmp)) for mode in ("off", "sync", "queue")}
+
+        self.stdout.write(f"{options['requests']} 个请求，{options['threads']} 线程，"
+                          f"每次记录约 {options['history'] * options['payload']} 字符的会话历史")
+        self.stdout.write(f"{'模式':<10}{'p50(ms)':>10}{'p99(ms)':>10}{'丢弃':>8}")
+        for mode, (p50, p99, dropped) in results.items():
+            self.stdout.write(f"{mode:<10}{p50:>10.2f}{p99:>10.2f}{dropped:>8}")
@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from openai import AsyncOpenAI, OpenAI
+
+from antapp.openai.aiClient import AiClient, build_async_http_client, build_http_client
+from antapp.openai.asyncAiClient import AsyncAiClient
+from antapp.openai.fake_server import FakeOpenAIServer
+
+
+class _Gauge:
+    """记录同时进行中的流数量峰值"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+# 每个流的问题都不同，否则除第一个外都会命中回复缓存或合并到进行中的请求
+_ids = itertools.count()
+
+
+class Command(BaseCommand):
+    help = "对比同步（线程池模拟 WSGI worker 线程）与异步（单事件循环）模式下可同时保持的流式连接数"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--streams", type=int, default=200, help="并发发起的流式请求数")
+        parser.add_argument("--threads", type=int, default=16, help="同步模式的 worker 线程数")
+        parser.add_argument("--chunks", type=int, default=20, help="每个流的片段数")
+        parser.add_argument("--chunk-delay", type=float, default=0.05, help="片段间隔（秒）")
+
+    def _sync(self, base_url, streams, threads):
+        client = OpenAI(api_key="fake", base_url=base_url, http_client=build_http_client(max_connections=streams))
+        gauge = _Gauge()
+
+        def consume(_):
+            with gauge:
+                return "".join(AiClient(client=client).get_stream_response(f"你好 #{next(_ids)}"))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(consume, range(streams)))
+        return time.perf_counter() - start, gauge.peak
+
+    def _async(self, base_url, streams):
+        gauge = _Gauge()
+
+        async def run():
+            client = AsyncOpenAI(api_key="fake", base_url=base_url,
+                                 http_client=build_async_http_client(max_connections=streams))
+
+            async def consume():
+                with gauge:
+                    chunks = AsyncAiClient(client=client).get_stream_response(f"你好 #{next(_ids)}")
+                    return "".join([c async for c in chunks])
+
+            start = time.perf_counter()
+            await asyncio.gather(*(consume() for _ in range(streams)))
+            elapsed = time.perf_counter() - start
+            await client.close()
+            return elapsed
+
+        return asyncio.run(run()), gauge.peak
+
+    def handle(self, *args, **options):
+        streams = options["streams"]
+        with FakeOpenAIServer(chunks=options["chunks"], chunk_delay=options["chunk_delay"]) as server:
+            results = {
+                f"同步({options['threads']}线程)": self._sync(server.base_url, streams, options["threads"]),
+                "异步(单事件循环)": self._async(server.base_url, streams),
+            }
+
+        single = options["chunks"] * options["chunk_delay"]
+        self.stdout.write(f"{streams} 个流，单个流约 {single:.2f}s")
+        self.stdout.write(f"{'模式':<20}{'总耗时(s)':>12}{'并发峰值':>10}{'流/秒':>10}")
+        for name, (elapsed, peak) in results.items():
+            self.stdout.write(f"{name:<20}{elapsed:>12.2f}{peak:>10}{streams / elapsed:>10.1f}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from antapp.datasets import sidecar
+from antapp.datasets.paths import datas_dir
+
+
+class Command(BaseCommand):
+    help = "为 datas/ 下的工作簿生成 Arrow 列式 sidecar，源文件变化时重建"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="忽略版本检查，强制重建所有 sidecar")
+
+    def handle(self, *args, **options):
+        if sidecar.pa is None:
+            raise CommandError("需要安装 pyarrow 才能生成 sidecar")
+
+        root = datas_dir()
+        for path, rebuilt, elapsed in sidecar.build_all(force=options["force"]):
+            status = "已重建" if rebuilt else "已是最新"
+            self.stdout.write(f"{path.relative_to(root)}: {status} ({elapsed * 1000:.1f} ms)")
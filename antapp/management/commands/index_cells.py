@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from antapp.datasets.search_index import cell_index
+
+
+class Command(BaseCommand):
+    help = "增量更新 datas/ 下所有工作簿的单元格全文索引"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        updated = cell_index.update()
+        self.stdout.write(f"已重新索引 {updated} 个文件，耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
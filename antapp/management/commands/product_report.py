@@ -0,0 +1,37 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from antapp.datasets.products import CATEGORY_COLUMN, AggregationError, product_catalog
+
+
+class Command(BaseCommand):
+    help = "汇总 datas/产品统计表/ 下所有品类的数据，输出分组聚合或透视结果"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--by", default=CATEGORY_COLUMN, help="分组列，多个用逗号分隔")
+        parser.add_argument("--values", default="销售数量,销售收入,销售利润", help="聚合列，多个用逗号分隔")
+        parser.add_argument("--agg", default="sum", help="聚合函数: sum/mean/min/max/count/median")
+        parser.add_argument("--pivot", metavar="COLUMN", help="按该列透视")
+
+    def handle(self, *args, **options):
+        by = options["by"].split(",")
+        values = options["values"].split(",")
+
+        start = time.perf_counter()
+        merged = product_catalog.merged()
+        if merged.empty:
+            raise CommandError("没有找到可汇总的产品统计表")
+        self.stdout.write(f"已加载 {merged[CATEGORY_COLUMN].nunique()} 个品类，共 {len(merged)} 行，"
+                          f"耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+        try:
+            if options["pivot"]:
+                result = product_catalog.pivot(by[0], options["pivot"], values, options["agg"])
+            else:
+                result = product_catalog.aggregate(by, values, options["agg"])
+        except AggregationError as e:
+            raise CommandError(str(e))
+
+        with pd.option_context("display.unicode.east_asian_width", True, "display.width", 200):
+            self.stdout.write(result.to_string())
@@ -0,0 +1,413 @@
+"""
+轻量的进程内指标注册表，/metrics 以 Prometheus 文本格式输出
+
+更新走线程本地的分片，热路径上不加锁，采集时再把各线程的分片相加。
+设置 METRICS_MULTIPROC_DIR 后为多进程模式：每个 worker 定期把自己的快照写到该目录下
+（metrics_<pid>.json，原子替换），任一 worker 的 /metrics 汇总目录中所有进程的数据。
+"""
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# 默认的延迟分桶（秒），覆盖毫秒级接口到分钟级的 Agent 运行
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _slot(self, labels):
+        """当前线程分片中该标签组合的数值列表"""
+        shard = self.registry._shard()
+        key = (self.name, self._key(labels))
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = self._empty()
+        return values
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def _empty(self):
+        return [0.0]
+
+    def inc(self, amount=1, **labels):
+        self._slot(labels)[0] += amount
+
+    def render(self, series):
+        for key, values in sorted(series.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(values[0])}"
+
+
+class Histogram(_Metric):
+    """分桶直方图，输出累计分桶、总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _empty(self):
+        # 各分桶计数（非累计）+ 超出最大分桶的计数 + 总和 + 次数
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value, **labels):
+        values = self._slot(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        values[index] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """计时上下文，异常时也记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, series):
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values[:-2]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_number(bound)))
+                yield f"{self.name}_bucket{labels} {_format_number(cumulative)}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_number(values[-2])}"
+            yield f"{self.name}_count{labels} {_format_number(values[-1])}"
+
+
+class _ShardOwner:
+    """放在线程本地存储里，线程结束时被回收，触发分片合并"""
+
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Registry:
+    """
+    指标注册表
+
+    每个线程一个分片，线程结束后分片并入共享的基础分片，流式请求的短命线程不会让分片无限增长。
+    """
+
+    def __init__(self, multiproc_dir=METRICS_MULTIPROC_DIR):
+        self._metrics = {}
+        self._shards = []
+        self._base = {}
+        self._generation = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.multiproc_dir = Path(multiproc_dir) if multiproc_dir else None
+        self._flusher = None
+
+    def _shard(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            owner = self._local.owner = _ShardOwner({})
+            with self._lock:
+                self._shards.append(owner.shard)
+            weakref.finalize(owner, self._retire, owner.shard, self._generation)
+        return owner.shard
+
+    def _retire(self, shard, generation):
+        """线程结束：把分片并入基础分片"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._shards.remove(shard)
+            for key, values in shard.items():
+                total = self._base.get(key)
+                self._base[key] = list(values) if total is None else [a + b for a, b in zip(total, values)]
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """当前进程的数据：{指标名: {标签值元组: 数值列表}}"""
+        merged = {}
+        # 持锁遍历，避免线程结束时分片同时出现在基础分片和分片列表里
+        with self._lock:
+            for shard in [self._base, *self._shards]:
+                for (name, key), values in list(shard.items()):
+                    self._merge(merged, name, key, values)
+        return merged
+
+    def _merge(self, merged, name, key, values):
+        series = merged.setdefault(name, {})
+        total = series.get(key)
+        series[key] = list(values) if total is None else [a + b for a, b in zip(total, values)]
+
+    def collect(self):
+        """汇总后的数据，多进程模式下包含其他 worker 最近写出的快照"""
+        merged = self.snapshot()
+        if self.multiproc_dir is None:
+            return merged
+        own = f"metrics_{os.getpid()}.json"
+        for path in self.multiproc_dir.glob("metrics_*.json"):
+            if path.name == own:
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            for name, series in data.items():
+                for key, values in series:
+                    self._merge(merged, name, tuple(key), values)
+        return merged
+
+    def render(self):
+        """Prometheus 文本格式"""
+        data = self.collect()
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(data.get(metric.name, {})))
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """多进程模式：把本进程的快照写到共享目录"""
+        if self.multiproc_dir is None:
+            return
+        self.multiproc_dir.mkdir(parents=True, exist_ok=True)
+        data = {name: [[list(key), values] for key, values in series.items()]
+                for name, series in self.snapshot().items()}
+        path = self.multiproc_dir / f"metrics_{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def start_flusher(self, interval=METRICS_FLUSH_INTERVAL):
+        """多进程模式下启动定期写出快照的后台线程"""
+        if self.multiproc_dir is None or self._flusher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        self._flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def reset_after_fork(self):
+        # 子进程从零开始计数，避免与父进程的快照重复累加
+        self._shards = []
+        self._base = {}
+        # 父进程线程的分片回收时不再并入
+        self._generation += 1
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.start_flusher()
+
+
+REGISTRY = Registry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY.reset_after_fork)
+REGISTRY.start_flusher()
+
+http_request_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "视图处理耗时（流式响应为返回响应头之前的耗时）", ("view", "method", "status"))
+http_requests = REGISTRY.counter("http_requests_total", "视图请求次数", ("view", "method", "status"))
+aiclient_seconds = REGISTRY.histogram(
+    "aiclient_call_duration_seconds", "AiClient 方法耗时（流式方法为整个流）", ("method", "model"))
+aiclient_errors = REGISTRY.counter("aiclient_errors_total", "AiClient 方法出错次数", ("method", "model"))
+llm_ttft_seconds = REGISTRY.histogram("llm_time_to_first_token_seconds", "流式方法的首个片段耗时", ("method", "model"))
+llm_tokens_per_second = REGISTRY.histogram(
+    "llm_output_tokens_per_second", "首个片段之后的输出速度（按流式片段数近似 token 数）", ("method", "model"),
+    buckets=RATE_BUCKETS)
+llm_output_chunks = REGISTRY.counter("llm_output_chunks_total", "流式输出的片段数", ("method", "model"))
+agent_run_seconds = REGISTRY.histogram("agent_run_duration_seconds", "Runner.run 耗时", ("agent", "stage"))
+bank_tool_seconds = REGISTRY.histogram("bank_tool_duration_seconds", "BankTools 方法耗时（含远程 AMS 接口）", ("method",))
+bank_tool_errors = REGISTRY.counter("bank_tool_errors_total", "BankTools 方法出错次数", ("method",))
+
+
+def track_stream(method, model=None):
+    """
+    AiClient 流式方法的装饰器：记录首个片段耗时、输出速度、总耗时和出错次数
+
+    model 为空时使用实例的 model 属性作为标签
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            labels = {"method": method, "model": model or getattr(self, "model", "")}
+            start = time.perf_counter()
+            first = None
+            chunks = 0
+            stream = func(self, *args, **kwargs)
+            try:
+                for chunk in stream:
+                    if first is None:
+                        first = time.perf_counter()
+                        llm_ttft_seconds.observe(first - start, **labels)
+                    chunks += 1
+                    yield chunk
+            except Exception:
+                aiclient_errors.inc(**labels)
+                raise
+            finally:
+                # 客户端断开时及时关闭上游的流
+                stream.close()
+                end = time.perf_counter()
+                aiclient_seconds.observe(end - start, **labels)
+                if chunks:
+                    llm_output_chunks.inc(chunks, **labels)
+                if first is not None and chunks > 1 and end > first:
+                    llm_tokens_per_second.observe((chunks - 1) / (end - first), **labels)
+        return wrapper
+    return decorator
+
+
+def track_response(method, model=None):
+    """AiClient 非流式方法的装饰器：记录耗时和出错次数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            labels = {"method": method, "model": model or getattr(self, "model", "")}
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            except Exception:
+                aiclient_errors.inc(**labels)
+                raise
+            finally:
+                aiclient_seconds.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def atrack_stream(method, model=None):
+    """track_stream 的异步生成器版本"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            labels = {"method": method, "model": model or getattr(self, "model", "")}
+            start = time.perf_counter()
+            first = None
+            chunks = 0
+            stream = func(self, *args, **kwargs)
+            try:
+                async for chunk in stream:
+                    if first is None:
+                        first = time.perf_counter()
+                        llm_ttft_seconds.observe(first - start, **labels)
+                    chunks += 1
+                    yield chunk
+            except Exception:
+                aiclient_errors.inc(**labels)
+                raise
+            finally:
+                await stream.aclose()
+                end = time.perf_counter()
+                aiclient_seconds.observe(end - start, **labels)
+                if chunks:
+                    llm_output_chunks.inc(chunks, **labels)
+                if first is not None and chunks > 1 and end > first:
+                    llm_tokens_per_second.observe((chunks - 1) / (end - first), **labels)
+        return wrapper
+    return decorator
+
+
+def atrack_response(method, model=None):
+    """track_response 的协程版本"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            labels = {"method": method, "model": model or getattr(self, "model", "")}
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            except Exception:
+                aiclient_errors.inc(**labels)
+                raise
+            finally:
+                aiclient_seconds.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def track_call(histogram, errors=None, **fixed):
+    """普通函数/方法的计时装饰器，fixed 为固定的标签值"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**fixed)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, **fixed)
+        return wrapper
+    return decorator
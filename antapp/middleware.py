@@ -0,0 +1,50 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from antapp.metrics import http_request_seconds, http_requests
+
+
+def _view_label(request):
+    """用路由模板作为标签，避免路径参数带来的高基数"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.route or match.view_name
+
+
+class MetricsMiddleware:
+    """
+    记录每个视图的请求次数和处理耗时
+
+    流式响应只统计到返回响应头为止，模型首个片段耗时见 llm_time_to_first_token_seconds。
+    同时支持 WSGI 和 ASGI。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, start):
+        labels = {"view": _view_label(request), "method": request.method, "status": response.status_code}
+        http_request_seconds.observe(time.perf_counter() - start, **labels)
+        http_requests.inc(**labels)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, start)
+        return response
@@ -0,0 +1,314 @@
+"""
+上游模型调用的准入控制
+
+每个模型一个限流器：限制同时进行的请求数，超出的请求排队等待（有排队时间上限），
+队列已满时立即拒绝。并发上限按 AIMD 调整：收到 429 时减半，响应变慢时小幅下调，
+其余情况每完成一个请求加 1/上限（大约每一轮并发加一）。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from antapp.loggingMy import get_logger
+from antapp.openai.timings import LatencyStats
+
+logger = get_logger('admission')
+
+# 同步 / 异步调用各自的默认并发上限，部署时在 settings.py 中设置（见其中的说明）
+OPENAI_MAX_IN_FLIGHT = int(os.getenv('OPENAI_MAX_IN_FLIGHT', '16'))
+OPENAI_ASYNC_MAX_IN_FLIGHT = int(os.getenv('OPENAI_ASYNC_MAX_IN_FLIGHT', '256'))
+OPENAI_MIN_IN_FLIGHT = int(os.getenv('OPENAI_MIN_IN_FLIGHT', '1'))
+OPENAI_MAX_QUEUE = int(os.getenv('OPENAI_MAX_QUEUE', '64'))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv('OPENAI_QUEUE_TIMEOUT', '10'))
+# 首个响应超过该时间（秒）视为上游变慢
+OPENAI_LATENCY_TARGET = float(os.getenv('OPENAI_LATENCY_TARGET', '5'))
+# 按模型单独设置并发上限，如 "gpt-4.1-mini=32,o4-mini=4"
+OPENAI_MODEL_LIMITS = os.getenv('OPENAI_MODEL_LIMITS', '')
+
+# 两次乘性下调之间的最小间隔（秒），同一波 429 只下调一次
+DECREASE_COOLDOWN = 1.0
+
+
+class AdmissionRejected(Exception):
+    """队列已满或排队超时，调用方应返回 503"""
+
+
+def parse_model_limits(value):
+    limits = {}
+    for item in value.split(","):
+        model, sep, limit = item.strip().rpartition("=")
+        if sep and model:
+            limits[model] = int(limit)
+    return limits
+
+
+def default_max_in_flight(asynchronous=False):
+    """settings 中同步 / 异步调用的默认并发上限"""
+    if asynchronous:
+        return getattr(settings, "OPENAI_ASYNC_MAX_IN_FLIGHT", OPENAI_ASYNC_MAX_IN_FLIGHT)
+    return getattr(settings, "OPENAI_MAX_IN_FLIGHT", OPENAI_MAX_IN_FLIGHT)
+
+
+def agent_model(agent):
+    """Agent 使用的模型名称，未指定时归入 agents 默认模型"""
+    model = getattr(agent, "model", None)
+    if model is None:
+        return "agents-default"
+    return model if isinstance(model, str) else getattr(model, "model", "agents-default")
+
+
+def is_throttled(error):
+    """上游限流（HTTP 429）"""
+    return getattr(error, "status_code", None) == 429
+
+
+class Ticket:
+    """一次准入：记录首个响应到达的时间，用于调整并发上限"""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.start = time.perf_counter()
+        self.latency = None
+
+    def responded(self):
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.start
+
+
+class _AsyncWaiter:
+    """排队中的协程：名额在持锁时直接交给它，再通过所属事件循环唤醒"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.start = time.perf_counter()
+        self.ticket = None
+
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ModelLimiter:
+    """单个模型的并发限制和等待队列"""
+
+    def __init__(self, model, max_in_flight=OPENAI_MAX_IN_FLIGHT, min_in_flight=OPENAI_MIN_IN_FLIGHT,
+                 max_queue=OPENAI_MAX_QUEUE, queue_timeout=OPENAI_QUEUE_TIMEOUT,
+                 latency_target=OPENAI_LATENCY_TARGET):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min(min_in_flight, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.throttled = 0
+        self.wait_time = LatencyStats("queue_wait")
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = deque()
+
+    def _has_room(self):
+        return self.in_flight < max(self.min_in_flight, int(self.limit))
+
+    def acquire(self):
+        """
+        获取一个并发名额，必要时排队
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if not self._has_room():
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise AdmissionRejected(f"模型 {self.model} 请求过多，排队已满，请稍后重试")
+                self.waiting += 1
+                try:
+                    if not self._cond.wait_for(self._has_room, timeout=self.queue_timeout):
+                        self.timeouts += 1
+                        raise AdmissionRejected(
+                            f"模型 {self.model} 排队超过 {self.queue_timeout:g} 秒，请稍后重试")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+        self.wait_time.observe(time.perf_counter() - start)
+        return Ticket(self)
+
+    async def aacquire(self):
+        """
+        acquire 的协程版本：在事件循环上等待，不占用线程
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        start = time.perf_counter()
+        with self._cond:
+            if self._has_room() and not self._async_waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                self.wait_time.observe(time.perf_counter() - start)
+                return Ticket(self)
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(f"模型 {self.model} 请求过多，排队已满，请稍后重试")
+            waiter = _AsyncWaiter(asyncio.get_running_loop())
+            self.waiting += 1
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except BaseException as e:
+            with self._cond:
+                ticket = waiter.ticket
+                if ticket is None:
+                    self._async_waiters.remove(waiter)
+                    self.waiting -= 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.timeouts += 1
+            if ticket is not None:
+                # 超时/取消与分配名额同时发生：名额已经给出，立即归还
+                self.release(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected(
+                    f"模型 {self.model} 排队超过 {self.queue_timeout:g} 秒，请稍后重试") from None
+            raise
+        return waiter.ticket
+
+    def _grant_async(self):
+        """持锁调用：有空位时按排队顺序把名额分给等待中的协程"""
+        while self._async_waiters and self._has_room():
+            waiter = self._async_waiters.popleft()
+            self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.ticket = Ticket(self)
+            self.wait_time.observe(time.perf_counter() - waiter.start)
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.wake)
+            except RuntimeError:
+                # 事件循环已关闭，等待方不会再取走名额
+                self.in_flight -= 1
+
+    def release(self, ticket, error=None):
+        """
+        归还名额，并根据结果调整并发上限
+
+        只有调用过 ticket.responded() 的请求才参与延迟判断；整段 Agent 运行等没有首个响应
+        时间的调用只看是否出错，避免把整段耗时当成上游变慢。
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if error is not None and is_throttled(error):
+                self.throttled += 1
+                self._decrease(now, 0.5)
+            elif ticket.latency is not None and ticket.latency > self.latency_target:
+                self._decrease(now, 0.9)
+            elif error is None:
+                self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+            self._grant_async()
+            self._cond.notify_all()
+
+    def _decrease(self, now, factor):
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_in_flight, self.limit * factor)
+        logger.warning("模型 %s 并发上限下调为 %.1f", self.model, self.limit)
+
+    def stats(self):
+        with self._cond:
+            data = {
+                "limit": round(self.limit, 2),
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "throttled": self.throttled,
+            }
+        data["queue_wait"] = self.wait_time.stats()
+        return data
+
+
+class AdmissionController:
+    """进程级准入控制，按模型名称分别限流"""
+
+    def __init__(self, model_limits=None, **defaults):
+        self.model_limits = model_limits if model_limits is not None else parse_model_limits(OPENAI_MODEL_LIMITS)
+        self.defaults = defaults
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model, asynchronous=False):
+        """
+        获取模型的限流器
+
+        同步和异步调用各用一个限流器：同步视图的并发本来就受 worker 线程数限制，默认上限为
+        settings.OPENAI_MAX_IN_FLIGHT；ASGI 异步视图每个流只占一个协程，默认上限为
+        settings.OPENAI_ASYNC_MAX_IN_FLIGHT。OPENAI_MODEL_LIMITS 中的按模型上限对两者都生效。
+        """
+        model = model or "default"
+        name = f"{model}:async" if asynchronous else model
+        with self._lock:
+            limiter = self._limiters.get(name)
+            if limiter is None:
+                options = dict(self.defaults)
+                if model in self.model_limits:
+                    options["max_in_flight"] = self.model_limits[model]
+                elif "max_in_flight" not in options:
+                    options["max_in_flight"] = default_max_in_flight(asynchronous)
+                limiter = self._limiters[name] = ModelLimiter(name, **options)
+            return limiter
+
+    @contextmanager
+    def slot(self, model):
+        """同步调用使用：with admission.slot(model) as ticket: ..."""
+        limiter = self.limiter(model)
+        ticket = limiter.acquire()
+        try:
+            yield ticket
+        except BaseException as e:
+            limiter.release(ticket, e)
+            raise
+        else:
+            limiter.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, model):
+        """
+        异步调用使用：async with admission.aslot(model) as ticket: ...
+
+        在事件循环上排队，不占用线程；不同请求可以运行在各自的事件循环里（asyncio.run）
+        """
+        limiter = self.limiter(model, asynchronous=True)
+        ticket = await limiter.aacquire()
+        try:
+            yield ticket
+        except BaseException as e:
+            limiter.release(ticket, e)
+            raise
+        else:
+            limiter.release(ticket)
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.model: limiter.stats() for limiter in limiters}
+
+
+# 进程级共享实例
+admission = AdmissionController()
@@ -6,6 +6,7 @@ import random
 from agents import Agent, ItemHelpers, Runner, function_tool
 from django.http import StreamingHttpResponse
 from asgiref.sync import sync_to_async
+from antapp.openai.admission import admission, agent_model
 
 # 使用function_tool装饰器定义一个工具函数
 @function_tool
@@ -13,17 +14,17 @@ def how_many_jokes() -> int:
     # 返回1到10之间的随机整数
     return "调用了工具接口how_many_jokes"
 
-def stream_generator(agent, input_text):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    async def async_stream():
+async def async_stream(agent, input_text):
+    """把 Agent 的流式事件转换为 SSE 文本的异步生成器（整个运行期间占用一个准入名额）"""
+    async with admission.aslot(agent_model(agent)) as ticket:
         result = Runner.run_streamed(
             agent,
             input=input_text
         )
-        
+
         async for event in result.stream_events():
+            # 第一个事件到达即视为上游已响应，并发上限按这个时间调整
+            ticket.responded()
             if event.type == "raw_response_event":
                 continue
             elif event.type == "agent_updated_stream_event":
@@ -35,8 +36,12 @@ def stream_generator(agent, input_text):
                     yield f"data: -- Tool output: {event.item.output}\n\n"
                 elif event.item.type == "message_output_item":
                     yield f"data: {ItemHelpers.text_message_output(event.item)}\n\n"
+
+def stream_generator(agent, input_text):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     
-    async_gen = async_stream()
+    async_gen = async_stream(agent, input_text)
     while True:
         try:
             chunk = loop.run_until_complete(async_gen.__anext__())
@@ -45,15 +50,23 @@ def stream_generator(agent, input_text):
             break
     loop.close()
 
-def main(input_text):
-    agent = Agent(
+def build_agent():
+    return Agent(
         name="Joker",
         instructions="首先调用 how_many_jokes 工具，然后讲更多笑话.用中文回答所有问题",
         tools=[how_many_jokes],
     )
-    
+
+def main(input_text):
+    return StreamingHttpResponse(
+        stream_generator(build_agent(), input_text),
+        content_type='text/event-stream'
+    )
+
+def async_main(input_text):
+    """ASGI 下使用：直接返回基于异步生成器的流式响应，不占用线程"""
     return StreamingHttpResponse(
-        stream_generator(agent, input_text),
+        async_stream(build_agent(), input_text),
         content_type='text/event-stream'
     )
 
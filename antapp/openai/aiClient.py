@@ -1,101 +1,263 @@
-from openai import OpenAI
+from openai import OpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+import httpx
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
 from antapp.loggingMy import get_logger
-import base64
+from antapp.metrics import track_response, track_stream
+from antapp.openai.admission import AdmissionRejected, admission
+from antapp.openai.conversations import Conversation
+from antapp.openai.endpoints import EndpointPool
+from antapp.openai.images import image_pipeline
+from antapp.openai.response_cache import ResponseCache, cache_key, response_cache
+from antapp.openai.similarity_cache import similarity_cache
+from antapp.openai.single_flight import single_flight
+from antapp.openai.timings import LatencyStats
 
 
 # 在模块级别初始化
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')  # 默认使用官方API
+# 多个 OpenAI 兼容地址（逗号分隔），按健康状况故障转移和对冲；未设置时只使用 OPENAI_API_BASE
+OPENAI_API_BASES = [base.strip() for base in os.getenv('OPENAI_API_BASES', '').split(',') if base.strip()] \
+    or [OPENAI_API_BASE]
 DEFAULT_MODEL = os.getenv('OPENAI_MODEL_41_MINI', 'gpt-4') 
+OPENAI_REASONING_MODEL = os.getenv('OPENAI_REASONING_MODEL', 'o4-mini')
+OPENAI_REASONING_EFFORT = os.getenv('OPENAI_REASONING_EFFORT', 'medium')
+
+# 连接池配置：每个 worker 进程共享一个 HTTP 连接池
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', '20'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '10'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '600'))
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', '1') == '1'
 
 # 获取logger
 logger = get_logger('aiClient')
 
+# 推理接口的首字节耗时
+reasoning_ttfb = LatencyStats("reasoning_ttfb")
+
+_shared_client_lock = threading.Lock()
+_endpoint_pool = None
+_endpoint_pool_pid = None
+
+def _http2_available():
+    """HTTP/2 需要安装 h2 包"""
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _http_client_options(max_connections=None):
+    return dict(
+        limits=httpx.Limits(
+            max_connections=max_connections or OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        http2=_http2_available(),
+    )
+
+def format_sse(data, event=None):
+    """格式化一条 SSE 事件，多行数据拆成多个 data 字段"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+def build_http_client(max_connections=None):
+    """创建带连接池、keep-alive 和超时配置的 HTTP 客户端"""
+    return DefaultHttpxClient(**_http_client_options(max_connections))
+
+def build_async_http_client(max_connections=None):
+    """创建异步版本的 HTTP 客户端，连接池配置与同步客户端一致"""
+    return DefaultAsyncHttpxClient(**_http_client_options(max_connections))
+
+def get_shared_client():
+    """
+    获取进程级共享的 OpenAI 客户端
+
+    所有 AiClient 复用同一个连接池，避免每个请求重新建立 TCP/TLS 连接。
+    fork 出的子进程会重新创建自己的客户端，不与父进程共享套接字。
+    配置了多个地址时返回当前得分最好的地址的客户端。
+
+    Returns:
+        OpenAI: 共享的客户端实例
+    """
+    return get_endpoint_pool().best().client
+
+def get_endpoint_pool():
+    """
+    获取进程级共享的接口地址池，每个地址一个客户端（各自的连接池）
+
+    Returns:
+        EndpointPool: 地址池
+    """
+    global _endpoint_pool, _endpoint_pool_pid
+    pid = os.getpid()
+    if _endpoint_pool is None or _endpoint_pool_pid != pid:
+        with _shared_client_lock:
+            if _endpoint_pool is None or _endpoint_pool_pid != pid:
+                _endpoint_pool = EndpointPool([
+                    (base, OpenAI(api_key=OPENAI_API_KEY, base_url=base, http_client=build_http_client()))
+                    for base in OPENAI_API_BASES
+                ])
+                _endpoint_pool_pid = pid
+                logger.info("OpenAI共享客户端已创建，地址数: %d，HTTP/2: %s，最大连接数: %d",
+                            len(OPENAI_API_BASES), _http2_available(), OPENAI_MAX_CONNECTIONS)
+    return _endpoint_pool
+
 class AiClient:
-    def __init__(self, model=DEFAULT_MODEL, messages=None):
+    """单个会话的轻量封装，底层 HTTP 连接池由进程内所有实例共享"""
+
+    def __init__(self, model=DEFAULT_MODEL, messages=None, client=None, conversation=None, cache=None,
+                 similar_cache=None, endpoints=None):
         self.model = model
-        self.messages = messages if messages is not None else []
-        self.client = OpenAI(
-            api_key=OPENAI_API_KEY,
-            base_url=OPENAI_API_BASE
+        # 未指定会话时使用不限长度的临时会话
+        self.conversation = conversation if conversation is not None else Conversation(messages=messages)
+        # 显式传入 client 时只使用该客户端，否则使用地址池
+        self.endpoints = None if client is not None else (endpoints or get_endpoint_pool())
+        self.client = client or self.endpoints.best().client
+        self.cache = cache if cache is not None else response_cache
+        self.similar_cache = similar_cache if similar_cache is not None else similarity_cache
+        logger.debug("AiClient实例化成功，模型: %s", model)
+
+    @property
+    def _failover(self):
+        return self.endpoints is not None and len(self.endpoints) > 1
+
+    def _create_stream(self, client, messages):
+        return client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
         )
-        logger.info("AiClient实例化成功，模型: %s", model)
 
+    def _stream_chat(self, messages):
+        """调用模型的流式接口，逐个产出文本片段（整个流期间占用一个准入名额）"""
+        with admission.slot(self.model) as ticket:
+            if self._failover:
+                # 多个地址：故障转移和对冲由地址池处理
+                chunks = self.endpoints.stream(lambda client: self._create_stream(client, messages))
+            else:
+                chunks = (chunk.choices[0].delta.content
+                          for chunk in self._create_stream(self.client, messages) if chunk.choices)
+            logger.info("开始接收流式响应")
+            for content in chunks:
+                if content:
+                    ticket.responded()
+                    yield content
+            logger.info("流式响应完成")
+
+    def _cached_stream(self, messages, prompt=None):
+        """
+        带回复缓存的流式调用：命中时回放缓存文本，未命中时调用模型并在完整结束后写入缓存
+
+        传入 prompt 时，精确缓存未命中后再按问题文本查找相似问题缓存
+        """
+        key = cache_key(self.model, messages) if self.cache is not None else None
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            logger.info("回复缓存命中: %s", key[:12])
+            yield from self.cache.replay(cached)
+            return
+
+        similar = self.similar_cache if prompt is not None else None
+        if similar is not None:
+            cached, score = similar.lookup(self.model, prompt)
+            if cached is not None:
+                logger.info("相似问题缓存命中，相似度: %.3f", score)
+                yield from ResponseCache.replay(cached)
+                return
+
+        def produce():
+            parts = []
+            for content in self._stream_chat(messages):
+                parts.append(content)
+                yield content
+            answer = "".join(parts)
+            if key:
+                self.cache.set(key, answer)
+            if similar is not None:
+                similar.add(self.model, prompt, answer)
+
+        if single_flight is None:
+            yield from produce()
+        else:
+            # 相同请求正在进行时直接订阅，不再重复请求上游
+            yield from single_flight.stream(key or cache_key(self.model, messages), produce)
+
+    @track_response("get_ai_response")
     def get_ai_response(self, user_content):
         logger.info("当前消息列表: %s", self.messages)
-        self.messages.append({"role": "user", "content": user_content})
+        self.conversation.append({"role": "user", "content": user_content})
         logger.info("用户消息: %s", user_content)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages = self.messages
-            )
-            ai_response = response.choices[0].message.content
-            self.messages.append({"role": "assistant", "content": ai_response})
+            messages = self.messages
+            key = cache_key(self.model, messages) if self.cache is not None else None
+            ai_response = self.cache.get(key) if key else None
+            if ai_response is None:
+                with admission.slot(self.model):
+                    if self._failover:
+                        response = self.endpoints.complete(
+                            lambda client: client.chat.completions.create(model=self.model, messages=messages))
+                    else:
+                        response = self.client.chat.completions.create(
+                            model=self.model,
+                            messages = messages
+                        )
+                ai_response = response.choices[0].message.content
+                if key:
+                    self.cache.set(key, ai_response)
+            self.conversation.append({"role": "assistant", "content": ai_response})
             logger.info("AI响应: %s", ai_response)
             return ai_response
         except Exception as e:
             logger.error("获取AI响应时出错: %s", str(e))
             raise
 
+    @track_stream("get_stream_response_old")
     def get_stream_response_old(self, user_content):
         logger.info("流式响应请求，用户消息: %s", user_content)
-        self.messages.append({"role": "user", "content": user_content})
+        self.conversation.append({"role": "user", "content": user_content})
         
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                stream=True
-            )
-            logger.info("开始接收流式响应")
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    logger.debug("流式响应片段: %s", content)
-                    yield content
-            logger.info("流式响应完成")
+            parts = []
+            for content in self._cached_stream(self.messages):
+                parts.append(content)
+                yield content
+            # 完整回复写回会话历史，下一轮对话才有上下文
+            self.conversation.append({"role": "assistant", "content": "".join(parts)})
         except Exception as e:
             logger.error("获取流式响应时出错: %s", str(e))
             raise
 
+    @track_stream("get_stream_response")
     def get_stream_response(self, user_content):
         logger.info("流式响应请求，用户消息: %s", user_content)
-        self.messages.append({"role": "user", "content": user_content})
+        self.conversation.append({"role": "user", "content": user_content})
         
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages = [{"role": "user", "content": user_content}],
-                stream=True
-            )
-            logger.info("开始接收流式响应")
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    logger.debug("流式响应片段: %s", content)
-                    yield content
-            logger.info("流式响应完成")
+            yield from self._cached_stream([{"role": "user", "content": user_content}], prompt=user_content)
         except Exception as e:
             logger.error("获取流式响应时出错: %s", str(e))
             raise
 
+    @track_stream("get_file_image")
     def get_file_image(self, user_content, images):
         logger.info("文件图片请求，用户消息: %s", user_content)
         try:
-            # 构建包含base64图片的消息
-            image_base64_list = []
-            for image in images:
-                # 读取图片数据并转换为base64
-                image_data = image.read()  # 读取文件内容为字节
-                base64_data = base64.b64encode(image_data).decode('utf-8')
-                image_base64_list.append(base64_data)
-                logger.info(f"图片 {image.name} 已转换为base64")
+            # 图片预处理（识别格式、缩小、去 EXIF、去重）后转成 data URL
+            image_urls = image_pipeline.data_urls(images)
             
             # 构建新的消息对象，只包含当前图片和问题
             messages = [
@@ -103,56 +265,81 @@ class AiClient:
                     "role": "user",
                     "content": [
                         {"type": "text", "text": user_content},
-                        *[{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_data}"}} 
-                        for base64_data in image_base64_list]
+                        *[{"type": "image_url", "image_url": {"url": url}} for url in image_urls]
                     ]
                 }
             ]
             
-            # 使用正确的API调用方式，不保存到历史消息中
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,  # 直接使用当前消息，不包含历史
-                stream=True
-            )
-            
-            logger.info("开始接收流式响应")
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    logger.debug("流式响应片段: %s", content)
-                    yield content
-            logger.info("流式响应完成")
+            # 直接使用当前消息，不保存到历史消息中
+            yield from self._stream_chat(messages)
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error("处理图片时出错: %s", str(e))
             yield f"处理图片时出错: {str(e)}"
         
-    def get_reasoning(self, user_content):
+    @track_stream("get_reasoning", model=OPENAI_REASONING_MODEL)
+    def get_reasoning(self, user_content, summary=False):
+        """
+        流式推理：消费 Responses API 的流式事件，输出文本增量一到就返回
+
+        Args:
+            user_content: 用户问题
+            summary: 为 True 时输出 SSE，正文为默认的 message 事件，推理摘要为 reasoning 事件
+
+        Yields:
+            str: 文本片段，summary 为 True 时为 SSE 事件文本
+        """
         logger.info("推理请求，用户消息: %s", user_content)
+        reasoning = {"effort": OPENAI_REASONING_EFFORT}
+        if summary:
+            reasoning["summary"] = "auto"
+        start = time.perf_counter()
+        first = True
         try:
-            stream = self.client.responses.create(
-                model="o4-mini",
-                reasoning={"effort": "medium"},
-                input=[
-                    {
-                        "role": "user", 
-                        "content": user_content
-                    }
-                ]
-            )
+            with admission.slot(OPENAI_REASONING_MODEL) as ticket:
+                stream = self.client.responses.create(
+                    model=OPENAI_REASONING_MODEL,
+                    reasoning=reasoning,
+                    input=[
+                        {
+                            "role": "user", 
+                            "content": user_content
+                        }
+                    ],
+                    stream=True
+                )
+                ticket.responded()
 
-            logger.info("开始接收流式响应")
-            for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    logger.debug("流式响应片段: %s", content)
-                    yield content
-            logger.info("流式响应完成")
+                logger.info("开始接收流式响应")
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        text = format_sse(event.delta) if summary else event.delta
+                    elif summary and event.type == "response.reasoning_summary_text.delta":
+                        text = format_sse(event.delta, event="reasoning")
+                    elif event.type == "error":
+                        raise RuntimeError(event.message)
+                    elif event.type == "response.failed":
+                        error = event.response.error
+                        raise RuntimeError(error.message if error else "推理请求失败")
+                    else:
+                        continue
+                    if first:
+                        first = False
+                        ttfb = time.perf_counter() - start
+                        reasoning_ttfb.observe(ttfb)
+                        logger.info("推理首字节耗时: %.3fs", ttfb)
+                    yield text
+                logger.info("流式响应完成")
         except Exception as e:
             logger.error("获取流式响应时出错: %s", str(e))
             raise
         
+    @property
+    def messages(self):
+        return self.conversation.messages
+
     def clear_messages(self):
-        self.messages = []
+        self.conversation.clear()
         logger.info("消息列表已清空")
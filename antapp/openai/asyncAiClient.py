@@ -0,0 +1,188 @@
+import asyncio
+import weakref
+
+from openai import AsyncOpenAI
+
+from antapp.loggingMy import get_logger
+from antapp.metrics import atrack_response, atrack_stream
+from antapp.openai.admission import AdmissionRejected, admission
+from antapp.openai.conversations import Conversation
+from antapp.openai.images import image_pipeline
+from antapp.openai.response_cache import ResponseCache, cache_key, response_cache
+from antapp.openai.similarity_cache import similarity_cache
+from antapp.openai.aiClient import DEFAULT_MODEL, OPENAI_API_BASE, OPENAI_API_KEY, build_async_http_client
+
+logger = get_logger('asyncAiClient')
+
+# 异步连接池绑定在创建它的事件循环上，每个事件循环各用一个共享客户端
+_loop_clients = weakref.WeakKeyDictionary()
+
+async def _offload(blocking, func, *args):
+    """会访问 SQLite 的缓存操作放到线程中执行，不阻塞事件循环；纯内存操作直接调用"""
+    if blocking:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+def get_shared_async_client():
+    """
+    获取当前事件循环共享的 AsyncOpenAI 客户端
+
+    ASGI 下每个 worker 只有一个事件循环，相当于进程级共享。
+
+    Returns:
+        AsyncOpenAI: 共享的异步客户端
+    """
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_API_BASE,
+            http_client=build_async_http_client()
+        )
+        _loop_clients[loop] = client
+        logger.info("AsyncOpenAI共享客户端已创建")
+    return client
+
+class AsyncAiClient:
+    """
+    AiClient 的异步版本
+
+    流式方法返回异步生成器，可以直接交给 StreamingHttpResponse，在 ASGI 下
+    等待模型输出时不占用线程，一个 worker 可以同时保持大量流式连接。
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, messages=None, client=None, conversation=None, cache=None,
+                 similar_cache=None):
+        self.model = model
+        self.cache = cache if cache is not None else response_cache
+        self.similar_cache = similar_cache if similar_cache is not None else similarity_cache
+        # 未指定会话时使用不限长度的临时会话
+        self.conversation = conversation if conversation is not None else Conversation(messages=messages)
+        self._client = client
+
+    @property
+    def client(self):
+        # 延迟到事件循环中再获取共享客户端
+        return self._client or get_shared_async_client()
+
+    async def _stream(self, messages):
+        async with admission.aslot(self.model) as ticket:
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True
+            )
+            ticket.responded()
+            logger.info("开始接收流式响应")
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+            logger.info("流式响应完成")
+
+    async def _cached_stream(self, messages, prompt=None):
+        """带回复缓存的流式调用，与 AiClient 共用同一个精确缓存和相似问题缓存"""
+        key = cache_key(self.model, messages) if self.cache is not None else None
+        cached = await _offload(self.cache.blocking, self.cache.get, key) if key else None
+        if cached is not None:
+            logger.info("回复缓存命中: %s", key[:12])
+            for content in self.cache.replay(cached):
+                yield content
+            return
+
+        similar = self.similar_cache if prompt is not None else None
+        if similar is not None:
+            cached, score = similar.lookup(self.model, prompt)
+            if cached is not None:
+                logger.info("相似问题缓存命中，相似度: %.3f", score)
+                for content in ResponseCache.replay(cached):
+                    yield content
+                return
+
+        parts = []
+        async for content in self._stream(messages):
+            parts.append(content)
+            yield content
+        answer = "".join(parts)
+        if key:
+            await _offload(self.cache.blocking, self.cache.set, key, answer)
+        if similar is not None:
+            await _offload(similar.path is not None, similar.add, self.model, prompt, answer)
+
+    @atrack_response("get_ai_response")
+    async def get_ai_response(self, user_content):
+        self.conversation.append({"role": "user", "content": user_content})
+        logger.info("用户消息: %s", user_content)
+        try:
+            async with admission.aslot(self.model):
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.messages
+                )
+            ai_response = response.choices[0].message.content
+            self.conversation.append({"role": "assistant", "content": ai_response})
+            logger.info("AI响应: %s", ai_response)
+            return ai_response
+        except Exception as e:
+            logger.error("获取AI响应时出错: %s", str(e))
+            raise
+
+    @atrack_stream("get_stream_response_old")
+    async def get_stream_response_old(self, user_content):
+        logger.info("流式响应请求，用户消息: %s", user_content)
+        self.conversation.append({"role": "user", "content": user_content})
+        try:
+            parts = []
+            async for content in self._cached_stream(self.messages):
+                parts.append(content)
+                yield content
+            self.conversation.append({"role": "assistant", "content": "".join(parts)})
+        except Exception as e:
+            logger.error("获取流式响应时出错: %s", str(e))
+            raise
+
+    @atrack_stream("get_stream_response")
+    async def get_stream_response(self, user_content):
+        logger.info("流式响应请求，用户消息: %s", user_content)
+        self.conversation.append({"role": "user", "content": user_content})
+        try:
+            async for content in self._cached_stream([{"role": "user", "content": user_content}], prompt=user_content):
+                yield content
+        except Exception as e:
+            logger.error("获取流式响应时出错: %s", str(e))
+            raise
+
+    @atrack_stream("get_file_image")
+    async def get_file_image(self, user_content, images):
+        logger.info("文件图片请求，用户消息: %s", user_content)
+        try:
+            # 图片预处理在线程池中进行，不阻塞事件循环
+            image_urls = await asyncio.to_thread(image_pipeline.data_urls, images)
+
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_content},
+                        *[{"type": "image_url", "image_url": {"url": url}} for url in image_urls]
+                    ]
+                }
+            ]
+            async for content in self._stream(messages):
+                yield content
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.error("处理图片时出错: %s", str(e))
+            yield f"处理图片时出错: {str(e)}"
+
+    @property
+    def messages(self):
+        return self.conversation.messages
+
+    def clear_messages(self):
+        self.conversation.clear()
+        logger.info("消息列表已清空")
@@ -0,0 +1,158 @@
+"""
+流式输出的片段合并
+
+模型每个 token 单独产出一个片段，直接交给 StreamingHttpResponse 时几乎每个 token 都是一次 socket 写入。
+这里在两者之间合并片段：缓冲区达到字节阈值或距缓冲开始超过时间期限（以先到者为准）时一次性输出。
+第一个片段总是立即输出，不影响首字时间。
+"""
+import asyncio
+import os
+import time
+
+STREAM_COALESCE_BYTES = int(os.getenv('STREAM_COALESCE_BYTES', '1024'))
+# 时间期限（毫秒），0 表示关闭合并
+STREAM_COALESCE_MS = float(os.getenv('STREAM_COALESCE_MS', '20'))
+# 异步版本中读取任务最多领先下游的片段数
+STREAM_COALESCE_QUEUE = int(os.getenv('STREAM_COALESCE_QUEUE', '256'))
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class _Buffer:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.size = 0
+        self.deadline = None
+
+    def add(self, chunk, max_delay):
+        if not self.parts:
+            self.deadline = time.monotonic() + max_delay
+        self.parts.append(chunk)
+        self.size += len(chunk.encode("utf-8")) if isinstance(chunk, str) else len(chunk)
+        return self.size >= self.max_bytes
+
+    def timeout(self):
+        return None if not self.parts else max(0.0, self.deadline - time.monotonic())
+
+    def at_boundary(self):
+        # 缓冲以换行结尾（SSE 事件结束或一行文本结束）
+        last = self.parts[-1] if self.parts else ""
+        return last[-1:] in ("\n", b"\n")
+
+    def flush(self):
+        parts = self.parts
+        self.parts = []
+        self.size = 0
+        return parts[0][:0].join(parts)
+
+
+def coalesce(chunks, max_bytes=STREAM_COALESCE_BYTES, max_delay_ms=STREAM_COALESCE_MS):
+    """
+    合并同步生成器的片段
+
+    在调用方的生成器里直接合并，不开线程：每收到一个片段检查字节阈值和时间期限。
+    同步读取无法在上游停顿时按期限唤醒，因此缓冲以换行结尾（SSE 事件结束或一行文本结束）时也立即输出，
+    推理模型两段输出之间的停顿不会把上一段的结尾压住；不以换行结尾的缓冲等到下一个片段或上游结束时输出。
+    下游写得慢时上游也随之放慢，不会在服务端堆积整段回复。
+
+    Args:
+        chunks: 上游片段生成器（str 或 bytes）
+        max_bytes: 字节阈值
+        max_delay_ms: 时间期限（毫秒），不大于 0 时原样返回
+
+    Returns:
+        generator: 合并后的片段
+    """
+    if max_delay_ms <= 0:
+        return chunks
+    return _coalesce(chunks, max_bytes, max_delay_ms / 1000)
+
+
+def _coalesce(chunks, max_bytes, max_delay):
+    buffer = _Buffer(max_bytes)
+    first = True
+    try:
+        try:
+            for chunk in chunks:
+                if first:
+                    first = False
+                    yield chunk
+                    continue
+                # 缓冲已过期限时先输出旧内容，新片段重新计时
+                if buffer.timeout() == 0:
+                    yield buffer.flush()
+                if buffer.add(chunk, max_delay) or buffer.at_boundary():
+                    yield buffer.flush()
+        except Exception:
+            if buffer.parts:
+                yield buffer.flush()
+            raise
+        if buffer.parts:
+            yield buffer.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def acoalesce(chunks, max_bytes=STREAM_COALESCE_BYTES, max_delay_ms=STREAM_COALESCE_MS):
+    """coalesce 的异步版本，上游在同一事件循环的任务中读取，上游停顿时也能按时间期限输出"""
+    if max_delay_ms <= 0:
+        return chunks
+    return _acoalesce(chunks, max_bytes, max_delay_ms / 1000)
+
+
+async def _acoalesce(chunks, max_bytes, max_delay):
+    # 有界队列：下游写得慢时读取任务等待，不在服务端堆积整段回复
+    items = asyncio.Queue(STREAM_COALESCE_QUEUE)
+
+    async def read():
+        # 被取消（下游已断开）时不再放入结束标记：队列满时 put 会一直等待
+        try:
+            async for chunk in chunks:
+                await items.put(chunk)
+        except Exception as e:
+            await items.put(_Failure(e))
+        else:
+            await items.put(_DONE)
+
+    reader = asyncio.create_task(read())
+    buffer = _Buffer(max_bytes)
+    try:
+        item = await items.get()
+        if item is _DONE:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+        while True:
+            try:
+                item = await asyncio.wait_for(items.get(), buffer.timeout())
+            except asyncio.TimeoutError:
+                yield buffer.flush()
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                if buffer.parts:
+                    yield buffer.flush()
+                raise item.error
+            if buffer.add(item, max_delay):
+                yield buffer.flush()
+        if buffer.parts:
+            yield buffer.flush()
+    finally:
+        reader.cancel()
+        try:
+            await reader
+        except asyncio.CancelledError:
+            if not reader.cancelled():
+                raise
+        # 读取任务停在 put 上时上游生成器仍处于挂起状态，需要显式关闭以释放连接和准入名额
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from antapp.loggingMy import get_logger
+
+logger = get_logger('conversations')
+
+# 每个会话保留的历史消息 token 上限、空闲过期时间（秒）和最多保留的会话数
+CONVERSATION_MAX_TOKENS = int(os.getenv('CONVERSATION_MAX_TOKENS', '4000'))
+CONVERSATION_TTL = float(os.getenv('CONVERSATION_TTL', '1800'))
+CONVERSATION_MAX_COUNT = int(os.getenv('CONVERSATION_MAX_COUNT', '1000'))
+
+# 图片按固定 token 数估算
+IMAGE_TOKENS = 85
+
+
+def estimate_tokens(message):
+    """
+    粗略估算一条消息的 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token
+
+    Args:
+        message: {"role": ..., "content": str 或多模态列表}
+
+    Returns:
+        int: 估算的 token 数
+    """
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        total = 0
+        for part in content:
+            if part.get("type") in ("text", "input_text"):
+                total += estimate_tokens({"content": part.get("text", "")})
+            else:
+                total += IMAGE_TOKENS
+        return total
+    wide = sum(1 for ch in content if ord(ch) > 0x2E80)
+    return wide + (len(content) - wide + 3) // 4 + 4
+
+
+class Conversation:
+    """
+    单个会话的消息历史
+
+    system 消息固定保留，其余消息超过 token 预算时从最早的开始丢弃，
+    最新的一条消息总是保留。
+    """
+
+    def __init__(self, conversation_id=None, max_tokens=None, messages=None):
+        self.conversation_id = conversation_id
+        self.max_tokens = max_tokens
+        self.pinned = []
+        self.history = []
+        self.history_tokens = 0
+        self.last_access = time.monotonic()
+        self._lock = threading.Lock()
+        for message in messages or []:
+            self.append(message)
+
+    @property
+    def messages(self):
+        """发送给模型的消息列表（快照）"""
+        with self._lock:
+            return [message for message, _ in self.pinned] + [message for message, _ in self.history]
+
+    def append(self, message):
+        tokens = estimate_tokens(message)
+        with self._lock:
+            if message.get("role") == "system":
+                self.pinned.append((message, tokens))
+                return
+            self.history.append((message, tokens))
+            self.history_tokens += tokens
+            self._trim()
+
+    def _trim(self):
+        if self.max_tokens is None:
+            return
+        budget = self.max_tokens - sum(tokens for _, tokens in self.pinned)
+        dropped = 0
+        while self.history_tokens > budget and len(self.history) > 1:
+            _, tokens = self.history.pop(0)
+            self.history_tokens -= tokens
+            dropped += 1
+        if dropped:
+            logger.debug("会话 %s 超出 token 预算，丢弃 %d 条最早的消息", self.conversation_id, dropped)
+
+    def clear(self):
+        """清空历史消息，保留 system 消息"""
+        with self._lock:
+            self.history = []
+            self.history_tokens = 0
+
+
+class ConversationStore:
+    """
+    进程内会话存储
+
+    按 Django session ID 或显式的会话 ID 区分用户，空闲超过 TTL 的会话被清理，
+    会话数超过上限时淘汰最久未使用的会话，内存占用与并发用户数无关地保持有界。
+    """
+
+    def __init__(self, max_tokens=CONVERSATION_MAX_TOKENS, ttl=CONVERSATION_TTL,
+                 max_conversations=CONVERSATION_MAX_COUNT, system_prompt=None):
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.system_prompt = system_prompt
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, conversation_id):
+        """
+        获取会话，不存在或已过期时新建
+
+        Args:
+            conversation_id: 会话 ID
+
+        Returns:
+            Conversation: 会话对象
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                initial = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else None
+                conversation = Conversation(conversation_id, self.max_tokens, initial)
+                self._conversations[conversation_id] = conversation
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._conversations.move_to_end(conversation_id)
+            conversation.last_access = now
+            return conversation
+
+    def _expire(self, now):
+        # 按最近使用排序，最旧的在前，遇到未过期的会话即可停止
+        while self._conversations:
+            conversation_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_access < self.ttl:
+                break
+            del self._conversations[conversation_id]
+            self.expired += 1
+
+    def clear(self, conversation_id):
+        """清空会话历史"""
+        with self._lock:
+            conversation = self._conversations.pop(conversation_id, None)
+        if conversation is not None:
+            logger.info("会话已清空: %s", conversation_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+# 进程级共享实例
+conversation_store = ConversationStore()
+
+
+def conversation_id_for(request):
+    """
+    获取请求对应的会话 ID
+
+    以 Django session ID 区分用户；请求参数 conversation_id 或请求头 X-Conversation-Id 可以在同一个 session
+    内再区分多个会话。显式的会话 ID 限定在当前 session 下，其他用户即使带上相同的 ID 也拿不到这段历史。
+    """
+    if not request.session.session_key:
+        request.session.save()
+    session = request.session.session_key
+    explicit = (request.POST.get("conversation_id") or request.GET.get("conversation_id")
+                or request.headers.get("X-Conversation-Id"))
+    if explicit:
+        return f"session:{session}:explicit:{explicit}"
+    return f"session:{session}"
@@ -0,0 +1,294 @@
+"""
+多个 OpenAI 兼容接口地址之间的故障转移与对冲请求
+
+每个地址按首字节耗时和错误率的指数加权移动平均（EWMA）打分，请求总是先发给得分最好的地址；
+首个片段到达前出错时自动换下一个地址。开启对冲后，如果首个片段在最近首字节耗时的分位数期限内
+还没有到达，就向另一个地址再发一次同样的请求，先出结果的一方胜出，另一方被取消。
+"""
+import os
+import queue
+import threading
+import time
+
+from antapp.loggingMy import get_logger
+from antapp.openai.timings import LatencyStats
+
+logger = get_logger('endpoints')
+
+OPENAI_HEDGE = os.getenv('OPENAI_HEDGE', '1') == '1'
+# 对冲期限取最近首字节耗时的该分位数
+OPENAI_HEDGE_PERCENTILE = float(os.getenv('OPENAI_HEDGE_PERCENTILE', '0.95'))
+# 样本不足时使用的对冲期限（秒）
+OPENAI_HEDGE_DELAY = float(os.getenv('OPENAI_HEDGE_DELAY', '2'))
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv('OPENAI_HEDGE_MIN_DELAY', '0.2'))
+HEDGE_MIN_SAMPLES = 20
+
+# EWMA 平滑系数
+EWMA_ALPHA = 0.2
+# 错误率折算成的延迟惩罚（秒）
+ERROR_PENALTY = 10.0
+# 连续失败达到该次数后冷却一段时间，期间只作为最后的备选
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30.0
+
+
+class Endpoint:
+    """一个接口地址及其健康状况"""
+
+    def __init__(self, base_url, client, index=0):
+        self.base_url = base_url
+        self.client = client
+        self.index = index
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.requests = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self.latency = seconds if self.latency is None else \
+                (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * seconds
+
+    def record_success(self, seconds):
+        self.observe_latency(seconds)
+        with self._lock:
+            self.requests += 1
+            self.failures = 0
+            self.error_rate *= 1 - EWMA_ALPHA
+
+    def record_failure(self):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.failures += 1
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+            if self.failures >= FAILURE_THRESHOLD:
+                self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+                logger.warning("接口 %s 连续失败 %d 次，冷却 %.0f 秒", self.base_url, self.failures, COOLDOWN_SECONDS)
+
+    def rank_key(self):
+        with self._lock:
+            cooling = time.monotonic() < self.cooldown_until
+            return cooling, (self.latency or 0.0) + ERROR_PENALTY * self.error_rate, self.index
+
+    def stats(self):
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "latency_ewma": round(self.latency, 6) if self.latency is not None else None,
+                "error_rate": round(self.error_rate, 4),
+                "requests": self.requests,
+                "errors": self.errors,
+                "cooling": time.monotonic() < self.cooldown_until,
+            }
+
+
+class _Attempt:
+    """在后台线程中向一个地址发起流式请求，片段写入自己的队列"""
+
+    def __init__(self, endpoint, create, events, hedged=False):
+        self.endpoint = endpoint
+        self.hedged = hedged
+        self.chunks = queue.Queue()
+        self.cancelled = False
+        self.start = time.perf_counter()
+        self._create = create
+        self._events = events
+        self._stream = None
+        threading.Thread(target=self._run, name="openai-attempt", daemon=True).start()
+
+    def _run(self):
+        first = True
+        try:
+            self._stream = self._create(self.endpoint.client)
+            for chunk in self._stream:
+                if self.cancelled:
+                    break
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first:
+                    first = False
+                    self._events.put((self, "chunk"))
+                self.chunks.put(chunk.choices[0].delta.content)
+            if first:
+                self._events.put((self, "done"))
+        except Exception as e:
+            if first:
+                self._events.put((self, e))
+            else:
+                self.chunks.put(e)
+        finally:
+            self.chunks.put(None)
+            if self._stream is not None:
+                self._stream.close()
+
+    def cancel(self):
+        """对冲中落败：取消请求"""
+        # 落败的一方至少比胜出方慢，按已等待时间计入它的延迟
+        self.endpoint.observe_latency(time.perf_counter() - self.start)
+        self.stop()
+
+    def stop(self):
+        self.cancelled = True
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+
+    def drain(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                self.endpoint.record_failure()
+                raise item
+            yield item
+
+
+class EndpointPool:
+    """
+    按健康状况排序的接口地址集合
+
+    Args:
+        endpoints: [(base_url, client), ...]，client 为 OpenAI 同步客户端
+        hedge: 是否开启对冲请求
+    """
+
+    def __init__(self, endpoints, hedge=OPENAI_HEDGE, hedge_percentile=OPENAI_HEDGE_PERCENTILE,
+                 hedge_delay=OPENAI_HEDGE_DELAY, hedge_min_delay=OPENAI_HEDGE_MIN_DELAY):
+        self.endpoints = [Endpoint(base_url, client, i) for i, (base_url, client) in enumerate(endpoints)]
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_default = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.ttfb = LatencyStats("endpoint_ttfb")
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def ranked(self):
+        """按得分从好到差排列的地址"""
+        return sorted(self.endpoints, key=Endpoint.rank_key)
+
+    def best(self):
+        return self.ranked()[0]
+
+    def hedge_delay(self):
+        """对冲期限：最近首字节耗时的分位数，样本不足时用默认值"""
+        if self.ttfb.count < HEDGE_MIN_SAMPLES:
+            return self.hedge_delay_default
+        return max(self.hedge_min_delay, self.ttfb.percentile(self.hedge_percentile))
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def complete(self, create):
+        """
+        非流式调用，失败时依次换下一个地址
+
+        Args:
+            create: 接收客户端、返回响应的函数
+
+        Returns:
+            create 的返回值
+        """
+        error = None
+        for i, endpoint in enumerate(self.ranked()):
+            if i:
+                self._count("failovers")
+                logger.warning("切换到备用接口: %s", endpoint.base_url)
+            start = time.perf_counter()
+            try:
+                result = create(endpoint.client)
+            except Exception as e:
+                endpoint.record_failure()
+                error = e
+                continue
+            endpoint.record_success(time.perf_counter() - start)
+            return result
+        raise error
+
+    def stream(self, create):
+        """
+        流式调用：首个片段到达前出错则故障转移，超过对冲期限则对冲
+
+        首个片段到达后就固定在胜出的地址上，之后出错直接抛出，避免输出重复内容。
+
+        Args:
+            create: 接收客户端、返回 chat.completions 流的函数
+
+        Yields:
+            str: 文本片段
+        """
+        events = queue.Queue()
+        candidates = self.ranked()
+        active = []
+        error = None
+        start = time.perf_counter()
+
+        def launch(hedged=False):
+            endpoint = candidates.pop(0)
+            active.append(_Attempt(endpoint, create, events, hedged))
+            return endpoint
+
+        launch()
+        winner = None
+        while winner is None:
+            can_hedge = self.hedge and candidates and len(active) == 1
+            timeout = max(0.0, start + self.hedge_delay() - time.perf_counter()) if can_hedge else None
+            try:
+                attempt, result = events.get(timeout=timeout)
+            except queue.Empty:
+                endpoint = launch(hedged=True)
+                self._count("hedges")
+                logger.info("首字节超过对冲期限，向 %s 发起对冲请求", endpoint.base_url)
+                continue
+            if isinstance(result, Exception):
+                attempt.endpoint.record_failure()
+                active.remove(attempt)
+                error = result
+                if not active:
+                    if not candidates:
+                        raise error
+                    endpoint = launch()
+                    self._count("failovers")
+                    logger.warning("接口出错，切换到备用接口 %s: %s", endpoint.base_url, str(error))
+                continue
+            winner = attempt
+
+        elapsed = time.perf_counter() - start
+        winner.endpoint.record_success(time.perf_counter() - winner.start)
+        self.ttfb.observe(elapsed)
+        for attempt in active:
+            if attempt is not winner:
+                attempt.cancel()
+        if winner.hedged:
+            self._count("hedge_wins")
+        finished = False
+        try:
+            yield from winner.drain()
+            finished = True
+        finally:
+            if not finished:
+                # 下游断开时停止读取上游
+                winner.stop()
+
+    def stats(self):
+        with self._lock:
+            counters = {"failovers": self.failovers, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        return {
+            **counters,
+            "hedge_delay": round(self.hedge_delay(), 6),
+            "ttfb": self.ttfb.stats(),
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
@@ -0,0 +1,168 @@
+"""
+本地模拟的 OpenAI 兼容接口，用于基准测试和单元测试
+
+支持 /chat/completions（普通与流式）以及 /responses（流式），可以注入首包延迟、
+片段间隔和错误状态码，并统计建立过的 TCP 连接数。
+"""
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 关闭 Nagle 算法，避免小片段与延迟确认叠加产生额外等待
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_event(self, payload, event=None):
+        data = b""
+        if event:
+            data += f"event: {event}\n".encode()
+        data += f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.requests += 1
+            server.last_request = request
+
+        if server.status != 200:
+            time.sleep(server.delay)
+            self._send_json(server.status, {"error": {"message": "injected error", "type": "fake"}})
+            return
+
+        time.sleep(server.delay)
+        chunks = [f"{server.text}{i}" for i in range(server.chunks)]
+        if not request.get("stream"):
+            content = "".join(chunks)
+            self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": len(chunks), "total_tokens": len(chunks) + 1},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if self.path.endswith("/responses"):
+            self._stream_responses(request, chunks)
+        else:
+            self._stream_chat(request, chunks)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _stream_chat(self, request, chunks):
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.server.chunk_delay)
+            self._send_event({
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            })
+        self._send_event("[DONE]")
+
+    def _stream_responses(self, request, chunks):
+        sequence = 0
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.server.chunk_delay)
+            if self.server.reasoning_summary:
+                self._send_event({"type": "response.reasoning_summary_text.delta", "item_id": "rs_fake",
+                                  "output_index": 0, "summary_index": 0, "delta": f"思考{i}",
+                                  "sequence_number": sequence}, "response.reasoning_summary_text.delta")
+                sequence += 1
+            self._send_event({"type": "response.output_text.delta", "item_id": "msg_fake", "output_index": 1,
+                              "content_index": 0, "delta": text, "sequence_number": sequence},
+                             "response.output_text.delta")
+            sequence += 1
+        self._send_event({"type": "response.completed", "sequence_number": sequence, "response": {
+            "id": "resp_fake", "object": "response", "created_at": int(time.time()), "status": "completed",
+            "model": request.get("model", "fake"), "output": [], "parallel_tool_calls": False,
+            "tool_choice": "auto", "tools": [],
+            "usage": {"input_tokens": 1, "output_tokens": len(chunks), "total_tokens": len(chunks) + 1,
+                      "input_tokens_details": {"cached_tokens": 0},
+                      "output_tokens_details": {"reasoning_tokens": 0}},
+        }}, "response.completed")
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    在后台线程运行的模拟接口
+
+    Args:
+        delay: 首包前的延迟（秒）
+        chunks: 每次响应的片段数
+        chunk_delay: 流式片段之间的间隔（秒）
+        status: 返回的 HTTP 状态码，非 200 时返回错误
+        text: 片段文本前缀
+        reasoning_summary: /responses 流中是否同时发送推理摘要事件
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, chunks=5, chunk_delay=0.0, status=200, text="片段", reasoning_summary=False):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.delay = delay
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.status = status
+        self.text = text
+        self.reasoning_summary = reasoning_summary
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.last_request = None
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # 客户端主动断开（如落败的对冲请求被取消）属于正常情况
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
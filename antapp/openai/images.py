@@ -0,0 +1,194 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from antapp.loggingMy import get_logger
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安装时只识别格式，原样上传
+    Image = None
+
+logger = get_logger('imagePipeline')
+
+# 长边超过该值时等比缩小
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '2048'))
+# 重新编码的格式：JPEG / WEBP / PNG
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG').upper()
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '4'))
+# 处理结果缓存条数，同一张图片重复上传时直接复用
+IMAGE_CACHE_ENTRIES = int(os.getenv('IMAGE_CACHE_ENTRIES', '64'))
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+    "BMP": "image/bmp",
+    "HEIC": "image/heic",
+}
+# 视觉接口可以直接接受的原图格式
+PASSTHROUGH_FORMATS = frozenset({"JPEG", "PNG", "GIF", "WEBP"})
+
+
+def detect_format(data):
+    """根据文件头识别图片格式，无法识别时返回 None"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    if data.startswith(b"BM"):
+        return "BMP"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "HEIC"
+    return None
+
+
+def preprocess_image(data, max_edge=IMAGE_MAX_EDGE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    预处理单张图片：按 EXIF 方向摆正、缩小到最大边长、去掉 EXIF 并重新编码
+
+    原图不需要缩小、重新编码后也没有变小时（小 JPEG、纯色截图 PNG 等）使用原图。
+
+    Args:
+        data: 原始图片字节
+        max_edge: 最大边长（像素）
+        fmt: 输出格式
+        quality: JPEG/WEBP 压缩质量
+
+    Returns:
+        tuple: (MIME 类型, 处理后的字节)
+    """
+    source_format = detect_format(data)
+    if Image is None:
+        return MIME_TYPES.get(source_format, "image/jpeg"), data
+
+    with Image.open(io.BytesIO(data)) as img:
+        resized = max(img.size) > max_edge
+        img = ImageOps.exif_transpose(img)
+        if resized:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            # JPEG 不支持透明通道，铺白底
+            background = Image.new("RGB", img.size, "white")
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        out = io.BytesIO()
+        # 不传 exif 参数，输出文件中不包含 EXIF
+        img.save(out, format=fmt, quality=quality, optimize=True)
+    if not resized and source_format in PASSTHROUGH_FORMATS and out.tell() >= len(data):
+        return MIME_TYPES[source_format], data
+    return MIME_TYPES[fmt], out.getvalue()
+
+
+class ImagePipeline:
+    """
+    视觉请求的图片预处理
+
+    在线程池中并行处理（Pillow 缩放和编码时会释放 GIL），同一请求内内容相同的图片只处理一次，
+    最近处理过的图片按内容哈希缓存。记录处理前后的字节数和耗时。
+    """
+
+    def __init__(self, workers=IMAGE_WORKERS, cache_entries=IMAGE_CACHE_ENTRIES):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-pipeline")
+        self._cache = OrderedDict()
+        self.cache_entries = cache_entries
+        self._lock = threading.Lock()
+        self.images = 0
+        self.duplicates = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def _process(self, data):
+        try:
+            return preprocess_image(data)
+        except Exception as e:
+            # 无法解码的文件原样上传，由模型端报错
+            logger.warning("图片预处理失败，使用原图: %s", str(e))
+            return MIME_TYPES.get(detect_format(data), "image/jpeg"), data
+
+    def data_urls(self, files):
+        """
+        读取上传文件并返回 data URL 列表，重复的图片只保留一张
+
+        Args:
+            files: 上传文件对象列表（有 read 方法）
+
+        Returns:
+            list: "data:<mime>;base64,..." 字符串
+        """
+        start = time.perf_counter()
+        unique = OrderedDict()
+        for f in files:
+            data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in unique:
+                with self._lock:
+                    self.duplicates += 1
+                continue
+            unique[digest] = data
+
+        results = {}
+        futures = {}
+        with self._lock:
+            for digest in unique:
+                if digest in self._cache:
+                    self._cache.move_to_end(digest)
+                    results[digest] = self._cache[digest]
+                    self.cache_hits += 1
+        for digest, data in unique.items():
+            if digest not in results:
+                futures[digest] = self._executor.submit(self._process, data)
+        for digest, future in futures.items():
+            results[digest] = future.result()
+
+        urls = []
+        bytes_in = sum(len(data) for data in unique.values())
+        bytes_out = 0
+        for digest in unique:
+            mime, data = results[digest]
+            bytes_out += len(data)
+            urls.append(f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}")
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            for digest in futures:
+                self._cache[digest] = results[digest]
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+            self.images += len(unique)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += elapsed
+        logger.info("图片预处理完成: %d 张，%d -> %d 字节，耗时 %.3fs",
+                    len(unique), bytes_in, bytes_out, elapsed)
+        return urls
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pillow": Image is not None,
+                "images": self.images,
+                "duplicates": self.duplicates,
+                "cache_hits": self.cache_hits,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "seconds": round(self.seconds, 6),
+            }
+
+
+# 进程级共享实例
+image_pipeline = ImagePipeline()
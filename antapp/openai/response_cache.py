@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+from antapp.loggingMy import get_logger
+
+logger = get_logger('responseCache')
+
+# memory / sqlite / off
+OPENAI_RESPONSE_CACHE = os.getenv('OPENAI_RESPONSE_CACHE', 'memory')
+OPENAI_RESPONSE_CACHE_TTL = float(os.getenv('OPENAI_RESPONSE_CACHE_TTL', '3600'))
+OPENAI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('OPENAI_RESPONSE_CACHE_MAX_ENTRIES', '2000'))
+OPENAI_RESPONSE_CACHE_PATH = os.getenv('OPENAI_RESPONSE_CACHE_PATH', 'logs/response_cache.sqlite3')
+# 命中时回放的片段大小（字符数）
+REPLAY_CHUNK_SIZE = 16
+
+
+def cache_key(model, messages, **params):
+    """
+    计算请求的规范化哈希：同样的 (模型, 消息, 参数) 总是得到同样的键
+
+    Args:
+        model: 模型名称
+        messages: 消息列表
+        **params: 其他影响输出的请求参数
+
+    Returns:
+        str: sha256 十六进制摘要
+    """
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """进程内 LRU 缓存后端"""
+
+    def __init__(self, max_entries=OPENAI_RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if time.time() - created > ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """本地 SQLite 缓存后端，多个 worker 进程共享，重启后仍然有效"""
+
+    def __init__(self, path=OPENAI_RESPONSE_CACHE_PATH, max_entries=OPENAI_RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key, ttl):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                         (key, value, now, now))
+            # 超出上限时删除最久未访问的条目
+            conn.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                         "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            conn.commit()
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    模型回复的精确匹配缓存
+
+    只缓存完整结束的回复；命中时把缓存的文本按片段回放，调用方拿到的仍是同样的流式生成器。
+    """
+
+    def __init__(self, backend, ttl=OPENAI_RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def blocking(self):
+        """读写是否会访问磁盘（SQLite 后端），异步调用方需要放到线程中执行"""
+        return isinstance(self.backend, SQLiteBackend)
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key, self.ttl)
+        except sqlite3.Error as e:
+            logger.warning("读取回复缓存失败: %s", str(e))
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_saved += len(value.encode("utf-8"))
+        return value
+
+    def set(self, key, value):
+        if not value:
+            return
+        try:
+            self.backend.set(key, value)
+        except sqlite3.Error as e:
+            logger.warning("写入回复缓存失败: %s", str(e))
+
+    @staticmethod
+    def replay(value, chunk_size=REPLAY_CHUNK_SIZE):
+        """把缓存的文本切成片段，模拟流式输出"""
+        for i in range(0, len(value), chunk_size):
+            yield value[i:i + chunk_size]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "entries": len(self.backend),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+def build_response_cache(kind=OPENAI_RESPONSE_CACHE):
+    """根据配置创建缓存，kind 为 off 时返回 None"""
+    if kind == "sqlite":
+        return ResponseCache(SQLiteBackend())
+    if kind == "memory":
+        return ResponseCache(MemoryBackend())
+    return None
+
+
+# 进程级共享实例
+response_cache = build_response_cache()
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing
+
+import numpy as np
+
+from antapp.loggingMy import get_logger
+
+logger = get_logger('similarityCache')
+
+OPENAI_SIMILARITY_CACHE = os.getenv('OPENAI_SIMILARITY_CACHE', '0') == '1'
+OPENAI_SIMILARITY_THRESHOLD = float(os.getenv('OPENAI_SIMILARITY_THRESHOLD', '0.9'))
+OPENAI_SIMILARITY_CACHE_PATH = os.getenv('OPENAI_SIMILARITY_CACHE_PATH', 'logs/similarity_cache.sqlite3')
+OPENAI_SIMILARITY_CACHE_MAX_ENTRIES = int(os.getenv('OPENAI_SIMILARITY_CACHE_MAX_ENTRIES', '100000'))
+OPENAI_SIMILARITY_CACHE_TTL = float(os.getenv('OPENAI_SIMILARITY_CACHE_TTL', '86400'))
+
+# SimHash 按 16 位分成 4 段，汉明距离不超过 3 的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = 64 // BANDS
+NGRAM_SIZES = (2, 3)
+_BIT_WEIGHTS = 1 << np.arange(64, dtype=np.uint64)
+
+
+def normalize(text):
+    """
+    统一全半角和大小写，去掉空白和控制字符
+
+    标点和符号保留：只差一个运算符的问题（如 "3+5" 与 "3-5"）答案不同，不能互相命中。
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in ("Z", "C"))
+
+
+def ngrams(text):
+    """字符 n-gram 集合，文本过短时退化为整个文本"""
+    grams = set()
+    for n in NGRAM_SIZES:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams or {text}
+
+
+def simhash(grams):
+    """64 位 SimHash 指纹"""
+    digests = b"".join(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest() for g in grams)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(grams)
+    return int((_BIT_WEIGHTS[votes > 0]).sum())
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class SimilarityCache:
+    """
+    近似重复问题的回复缓存
+
+    问题规范化后取字符 n-gram，用 SimHash 分段建立倒排（LSH），查询时只比较落在同一分段桶里的候选，
+    再用 n-gram 的 Jaccard 相似度确认，相似度不低于阈值时返回缓存的回答。
+    索引保存在内存中，同时写入本地 SQLite，重启后自动加载。
+    """
+
+    def __init__(self, path=OPENAI_SIMILARITY_CACHE_PATH, threshold=OPENAI_SIMILARITY_THRESHOLD,
+                 max_entries=OPENAI_SIMILARITY_CACHE_MAX_ENTRIES, ttl=OPENAI_SIMILARITY_CACHE_TTL):
+        self.path = str(path) if path else None
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # id -> (model, 指纹, n-gram 集合, 回答, 创建时间)
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = -1
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path:
+            self._load()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _load(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, model TEXT, "
+                         "fingerprint INTEGER, text TEXT, answer TEXT, created REAL)")
+            conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+            conn.commit()
+            rows = conn.execute("SELECT id, model, fingerprint, text, answer, created FROM entries "
+                                "ORDER BY id DESC LIMIT ?", (self.max_entries,)).fetchall()
+        for entry_id, model, fingerprint, text, answer, created in reversed(rows):
+            self._add(entry_id, model, fingerprint & ((1 << 64) - 1), ngrams(text), answer, created)
+        logger.info("相似问题缓存已加载 %d 条", len(self._entries))
+
+    def _bucket_keys(self, model, fingerprint):
+        mask = (1 << BAND_BITS) - 1
+        return [(model, band, (fingerprint >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+    def _add(self, entry_id, model, fingerprint, grams, answer, created):
+        self._entries[entry_id] = (model, fingerprint, grams, answer, created)
+        for key in self._bucket_keys(model, fingerprint):
+            self._buckets.setdefault(key, []).append(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        model, fingerprint, _, _, _ = self._entries.pop(entry_id)
+        for key in self._bucket_keys(model, fingerprint):
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.remove(entry_id)
+                if not ids:
+                    del self._buckets[key]
+
+    def lookup(self, model, text):
+        """
+        查找相似问题的缓存回答
+
+        Args:
+            model: 模型名称，只在同一模型的回答中查找
+            text: 用户问题
+
+        Returns:
+            tuple: (回答, 相似度)，未命中时为 (None, 最高相似度)
+        """
+        grams = ngrams(normalize(text))
+        fingerprint = simhash(grams)
+        now = time.time()
+        best, best_score = None, 0.0
+        with self._lock:
+            candidates = set()
+            for key in self._bucket_keys(model, fingerprint):
+                candidates.update(self._buckets.get(key, ()))
+            for entry_id in candidates:
+                _, _, entry_grams, answer, created = self._entries[entry_id]
+                if now - created > self.ttl:
+                    continue
+                score = jaccard(grams, entry_grams)
+                if score > best_score:
+                    best, best_score = answer, score
+            if best is not None and best_score >= self.threshold:
+                self.hits += 1
+                return best, best_score
+            self.misses += 1
+        return None, best_score
+
+    def add(self, model, text, answer):
+        """保存问题和完整回答"""
+        if not answer:
+            return
+        normalized = normalize(text)
+        grams = ngrams(normalized)
+        fingerprint = simhash(grams)
+        created = time.time()
+        entry_id = None
+        if self.path:
+            # 编号由 SQLite 分配，多个 worker 共用同一个文件时不会冲突
+            try:
+                with closing(self._connect()) as conn:
+                    entry_id = conn.execute("INSERT INTO entries (model, fingerprint, text, answer, created) "
+                                            "VALUES (?, ?, ?, ?, ?)",
+                                            (model, _to_signed(fingerprint), normalized, answer, created)).lastrowid
+                    conn.execute("DELETE FROM entries WHERE id <= ?", (entry_id - self.max_entries,))
+                    conn.commit()
+            except sqlite3.Error as e:
+                logger.warning("写入相似问题缓存失败: %s", str(e))
+                entry_id = None
+        with self._lock:
+            if entry_id is None:
+                # 未持久化的条目用负数编号，不会与 SQLite 分配的编号重复
+                entry_id = self._next_id
+                self._next_id -= 1
+            self._add(entry_id, model, fingerprint, grams, answer, created)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
+
+
+# 可选功能，默认关闭
+similarity_cache = SimilarityCache() if OPENAI_SIMILARITY_CACHE else None
@@ -0,0 +1,179 @@
+import contextvars
+import os
+import threading
+
+from antapp.loggingMy import get_logger
+
+logger = get_logger('singleFlight')
+
+OPENAI_SINGLE_FLIGHT = os.getenv('OPENAI_SINGLE_FLIGHT', '1') == '1'
+
+
+class Flight:
+    """一次进行中的上游流式请求，已收到的片段全部保留，供后加入的订阅者补发"""
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def leave(self):
+        """
+        注销一个订阅者，返回是否还有其他订阅者
+
+        所有订阅者都断开后标记取消，读取上游的一方随即停止
+        """
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.cancelled = True
+            return self.subscribers > 0
+
+    def join(self):
+        """登记一个订阅者，已取消的请求不能再加入"""
+        with self._cond:
+            if self.cancelled:
+                return False
+            self.subscribers += 1
+            return True
+
+    def subscribe(self):
+        """
+        订阅者各自维护游标：先补发已经收到的片段，再等待新片段
+        """
+        cursor = 0
+        try:
+            while True:
+                with self._cond:
+                    while cursor >= len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    pending = self.chunks[cursor:]
+                    cursor += len(pending)
+                    finished = self.done and cursor >= len(self.chunks)
+                    error = self.error
+                yield from pending
+                if finished:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.leave()
+
+
+class SingleFlight:
+    """
+    相同请求的单飞合并
+
+    同一个键已有请求在进行时，后来的调用者直接订阅它，而不是再开一个上游流。
+    第一个调用者（领头者）在自己的线程里读取上游并发布给其他订阅者，不额外开线程；
+    只有领头者中途断开而仍有其他订阅者时，才把剩余部分交给后台线程继续读取。
+    请求结束后即从表中移除，之后的相同请求交给回复缓存处理。
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def stream(self, key, producer):
+        """
+        获取键对应的流式输出
+
+        Args:
+            key: 请求键，通常是 cache_key 的结果
+            producer: 无参函数，返回上游片段的生成器，只在没有进行中的请求时调用
+
+        Returns:
+            generator: 当前调用者自己的片段生成器，领头者拿到后需立即迭代
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or not flight.join()
+            if leader:
+                flight = Flight(key)
+                flight.join()
+                self._flights[key] = flight
+                self.started += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            return self._lead(flight, producer)
+        logger.info("合并进行中的相同请求: %s", key[:12])
+        return flight.subscribe()
+
+    def _lead(self, flight, producer):
+        """领头者的生成器：边读上游边发布"""
+        upstream = None
+        error = None
+        handed_off = False
+        try:
+            upstream = producer()
+            for chunk in upstream:
+                flight.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            if flight.leave():
+                # 领头者断开但还有其他订阅者，剩余部分交给后台线程读取（沿用当前的 contextvars）
+                handed_off = True
+                threading.Thread(target=contextvars.copy_context().run, args=(self._pump, flight, upstream),
+                                 name="single-flight", daemon=True).start()
+            raise
+        except Exception as e:
+            error = e
+            flight.leave()
+            raise
+        else:
+            flight.leave()
+        finally:
+            if not handed_off:
+                self._finish(flight, upstream, error)
+
+    def _pump(self, flight, upstream):
+        error = None
+        try:
+            for chunk in upstream:
+                if flight.cancelled:
+                    logger.info("订阅者已全部断开，停止上游请求: %s", flight.key[:12])
+                    break
+                flight.publish(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            self._finish(flight, upstream, error)
+
+    def _finish(self, flight, upstream, error):
+        if upstream is not None:
+            upstream.close()
+        # 先移出表再通知订阅者，结束后到达的请求不会再订阅到这次结果
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.finish(error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "started": self.started,
+                "coalesced": self.coalesced,
+            }
+
+
+# 进程级共享实例
+single_flight = SingleFlight() if OPENAI_SINGLE_FLIGHT else None
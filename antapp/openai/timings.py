@@ -0,0 +1,53 @@
+import threading
+from collections import deque
+
+# 计算分位数时保留的最近样本数
+DEFAULT_WINDOW = 1000
+
+
+def _quantile(samples, q):
+    """已排序样本的 q 分位数（最近秩法）"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, max(0, int(round(q * len(samples))) - 1))]
+
+
+def _rounded(value):
+    return None if value is None else round(value, 6)
+
+
+class LatencyStats:
+    """延迟统计：累计次数、总耗时、最大值，以及基于最近样本的分位数"""
+
+    def __init__(self, name, window=DEFAULT_WINDOW):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+
+    def percentile(self, q):
+        """最近样本的 q 分位数（0-1），没有样本时返回 None"""
+        with self._lock:
+            samples = sorted(self._recent)
+        return _quantile(samples, q)
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._recent)
+            count, total, maximum = self.count, self.total, self.max
+        return {
+            "count": count,
+            "avg": round(total / count, 6) if count else None,
+            "p50": _rounded(_quantile(samples, 0.5)),
+            "p95": _rounded(_quantile(samples, 0.95)),
+            "max": round(maximum, 6),
+        }
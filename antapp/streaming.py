@@ -0,0 +1,68 @@
+"""
+流式视图的公共处理
+
+返回 StreamingHttpResponse 之前先取出第一个片段：上游准入被拒绝时还能返回 503，
+而不是在已经开始的 200 响应里中断。之后的片段经过合并层再写出。
+"""
+from django.http import HttpResponse, StreamingHttpResponse
+
+from antapp.openai.admission import AdmissionRejected
+from antapp.openai.coalesce import acoalesce, coalesce
+
+# 建议客户端重试的等待秒数
+RETRY_AFTER = 1
+
+
+def overloaded_response(error):
+    """上游繁忙时的 503 响应"""
+    response = HttpResponse(str(error), status=503, content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+
+def _resume(first, chunks):
+    try:
+        yield first
+        yield from chunks
+    finally:
+        chunks.close()
+
+
+async def _aresume(first, chunks):
+    try:
+        yield first
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+def stream_response(chunks, **kwargs):
+    """
+    同步生成器的流式响应
+
+    Args:
+        chunks: 文本片段生成器
+        **kwargs: 传给 StreamingHttpResponse 的参数，如 content_type
+
+    Returns:
+        HttpResponse: 流式响应，准入被拒绝时为 503
+    """
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return StreamingHttpResponse(iter(()), **kwargs)
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    return StreamingHttpResponse(coalesce(_resume(first, chunks)), **kwargs)
+
+
+async def astream_response(chunks, **kwargs):
+    """异步生成器的流式响应，ASGI 视图使用"""
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return StreamingHttpResponse(iter(()), **kwargs)
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    return StreamingHttpResponse(acoalesce(_aresume(first, chunks)), **kwargs)
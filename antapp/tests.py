@@ -1,3 +1,1059 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import gc
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from openai import AsyncOpenAI, OpenAI
+
+from antapp import tracing
+from antapp.datasets import watcher as watcher_module
+from antapp.datasets.cache import DatasetCache, dataset_cache
+from antapp.datasets.downsample import downsample, lttb
+from antapp.datasets.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate, parse_page_size,
+                                        sorted_positions)
+from antapp.datasets.products import AggregationError, ProductCatalog
+from antapp.datasets.query import QueryError, run_query
+from antapp.datasets.search_index import CellSearchIndex
+from antapp.datasets.sidecar import read_dataset, sidecar_path
+from antapp.datasets.text_index import NgramIndex
+from antapp.datasets.weather import WeatherRollups
+from antapp.loggingMy import BoundedQueueHandler, PayloadFilter, SharedRotatingFileHandler
+from antapp.metrics import Registry
+from antapp.openai.admission import AdmissionController, AdmissionRejected, ModelLimiter
+from antapp.openai import aiClient as ai_client_module
+from antapp.openai.aiClient import AiClient, build_http_client
+from antapp.openai.asyncAiClient import AsyncAiClient
+from antapp.openai.coalesce import acoalesce, coalesce
+from antapp.openai.conversations import Conversation, ConversationStore, conversation_id_for, estimate_tokens
+from antapp.openai.endpoints import EndpointPool
+from antapp.openai.fake_server import FakeOpenAIServer
+from antapp.openai.images import Image, ImagePipeline, detect_format, preprocess_image
+from antapp.openai.response_cache import MemoryBackend, ResponseCache, SQLiteBackend, cache_key
+from antapp.openai.similarity_cache import SimilarityCache
+from antapp.openai.single_flight import SingleFlight
+from antapp.tracing import JSONLSink, SQLiteSink, TraceExporter, start_span, traced
 
 # Create your tests here.
+
+
+def make_pool(*servers, **options):
+    """为每个本地模拟接口创建一个不重试的客户端"""
+    return EndpointPool([
+        (server.base_url, OpenAI(api_key="test", base_url=server.base_url,
+                                 http_client=build_http_client(), max_retries=0))
+        for server in servers
+    ], **options)
+
+
+def make_client(pool):
+    return AiClient(endpoints=pool)
+
+
+class EndpointPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def server(self, **options):
+        server = FakeOpenAIServer(**options).start()
+        self.servers.append(server)
+        return server
+
+    def test_stream_fails_over_before_first_chunk(self):
+        broken = self.server(status=500)
+        healthy = self.server(chunks=3, text="备用")
+        pool = make_pool(broken, healthy, hedge=False)
+
+        text = "".join(make_client(pool)._stream_chat([{"role": "user", "content": "你好"}]))
+
+        self.assertEqual(text, "备用0备用1备用2")
+        self.assertEqual(pool.failovers, 1)
+        self.assertEqual(pool.endpoints[0].errors, 1)
+
+    def test_unhealthy_endpoint_is_ranked_last(self):
+        broken = self.server(status=500)
+        healthy = self.server(chunks=1)
+        pool = make_pool(broken, healthy, hedge=False)
+        client = make_client(pool)
+
+        "".join(client._stream_chat([{"role": "user", "content": "你好"}]))
+        "".join(client._stream_chat([{"role": "user", "content": "你好"}]))
+
+        self.assertIs(pool.best(), pool.endpoints[1])
+        self.assertEqual(broken.requests, 1)
+        self.assertEqual(healthy.requests, 2)
+
+    def test_complete_fails_over(self):
+        broken = self.server(status=503)
+        healthy = self.server(chunks=2)
+        pool = make_pool(broken, healthy)
+
+        response = pool.complete(lambda client: client.chat.completions.create(
+            model="test", messages=[{"role": "user", "content": "你好"}]))
+
+        self.assertEqual(response.choices[0].message.content, "片段0片段1")
+        self.assertEqual(pool.failovers, 1)
+
+    def test_hedge_wins_when_primary_is_slow(self):
+        slow = self.server(delay=2.0, text="慢")
+        fast = self.server(delay=0.05, text="快")
+        pool = make_pool(slow, fast, hedge_delay=0.2)
+
+        start = time.perf_counter()
+        text = "".join(make_client(pool)._stream_chat([{"role": "user", "content": "你好"}]))
+        elapsed = time.perf_counter() - start
+
+        self.assertTrue(text.startswith("快"))
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual((pool.hedges, pool.hedge_wins), (1, 1))
+        self.assertEqual(fast.requests, 1)
+
+    def test_no_hedge_when_primary_answers_in_time(self):
+        primary = self.server(delay=0.0, text="主")
+        secondary = self.server(text="备")
+        pool = make_pool(primary, secondary, hedge_delay=0.5)
+
+        text = "".join(make_client(pool)._stream_chat([{"role": "user", "content": "你好"}]))
+
+        self.assertTrue(text.startswith("主"))
+        self.assertEqual(pool.hedges, 0)
+        self.assertEqual(secondary.requests, 0)
+
+    def test_hedge_deadline_follows_observed_percentile(self):
+        pool = make_pool(hedge_delay=2.0, hedge_min_delay=0.01, hedge_percentile=0.95)
+        self.assertEqual(pool.hedge_delay(), 2.0)
+        for i in range(100):
+            pool.ttfb.observe((i + 1) / 100)
+        self.assertAlmostEqual(pool.hedge_delay(), 0.95)
+
+
+class MetricsRegistryTests(SimpleTestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = Registry(multiproc_dir="")
+        histogram = registry.histogram("demo_seconds", "示例", ("view",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, view="a")
+
+        text = registry.render()
+
+        self.assertIn('demo_seconds_bucket{view="a",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{view="a",le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{view="a",le="+Inf"} 3', text)
+        self.assertIn('demo_seconds_count{view="a"} 3', text)
+
+    def test_counter_sums_thread_shards(self):
+        registry = Registry(multiproc_dir="")
+        counter = registry.counter("demo_total", "示例", ("kind",))
+        threads = [threading.Thread(target=lambda: [counter.inc(kind="x") for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn('demo_total{kind="x"} 4000', registry.render())
+
+    def test_multiprocess_snapshots_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(multiproc_dir=directory)
+            counter = registry.counter("demo_total", "示例")
+            counter.inc(2)
+            # 模拟另一个 worker 写出的快照
+            Path(directory, "metrics_999999.json").write_text(
+                json.dumps({"demo_total": [[[], [3]]]}), encoding="utf-8")
+
+            self.assertIn("demo_total 5", registry.render())
+
+    def test_finished_thread_shards_are_merged(self):
+        registry = Registry(multiproc_dir="")
+        counter = registry.counter("demo_total", "示例")
+        for _ in range(50):
+            thread = threading.Thread(target=counter.inc)
+            thread.start()
+            thread.join()
+        counter.inc()
+        gc.collect()
+
+        self.assertEqual(len(registry._shards), 1)
+        self.assertIn("demo_total 51", registry.render())
+
+
+class TracingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def export_with(self, sink):
+        patcher = mock.patch.object(tracing, "exporter", TraceExporter(sink))
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_nested_spans_share_trace(self):
+        sink = JSONLSink(Path(self.directory.name, "traces.jsonl"))
+        exporter = self.export_with(sink)
+
+        @traced("tool")
+        def tool():
+            with start_span("remote", bytes=10):
+                pass
+
+        async def pipeline():
+            with start_span("main") as root:
+                await asyncio.to_thread(tool)
+                with start_span("agent") as span:
+                    span.set(input_tokens=5)
+            return root
+
+        root = asyncio.run(pipeline())
+        exporter.flush()
+
+        tree = exporter.trace(root.trace_id)
+        self.assertEqual(tree["name"], "main")
+        self.assertEqual([child["name"] for child in tree["children"]], ["tool", "agent"])
+        self.assertEqual(tree["children"][0]["children"][0]["attributes"], {"bytes": 10})
+        self.assertEqual(tree["children"][1]["attributes"], {"input_tokens": 5})
+
+    def test_error_is_recorded_and_slowest_sorted(self):
+        exporter = self.export_with(SQLiteSink(Path(self.directory.name, "traces.sqlite3")))
+
+        with start_span("fast"):
+            pass
+        with self.assertRaises(ValueError):
+            with start_span("slow"):
+                time.sleep(0.02)
+                raise ValueError("坏数据")
+        exporter.flush()
+
+        slowest = exporter.slowest(10)
+        self.assertEqual([span["name"] for span in slowest], ["slow", "fast"])
+        self.assertEqual(slowest[0]["status"], "error")
+        self.assertEqual(slowest[0]["error"], "ValueError: 坏数据")
+        self.assertEqual([span["name"] for span in exporter.slowest(10, name="fast")], ["fast"])
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+class AdmissionTests(SimpleTestCase):
+
+    def limiter(self, **options):
+        options.setdefault("max_in_flight", 4)
+        options.setdefault("min_in_flight", 1)
+        return ModelLimiter("test", **options)
+
+    @override_settings(OPENAI_MAX_IN_FLIGHT=8, OPENAI_ASYNC_MAX_IN_FLIGHT=300)
+    def test_sync_and_async_callers_have_separate_limits(self):
+        controller = AdmissionController(model_limits={"small": 2})
+
+        async def run():
+            async with controller.aslot("big"):
+                return controller.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats["big:async"]["in_flight"], 1)
+        self.assertEqual(controller.limiter("big").max_in_flight, 8)
+        self.assertEqual(controller.limiter("big", asynchronous=True).max_in_flight, 300)
+        self.assertEqual(controller.limiter("small", asynchronous=True).max_in_flight, 2)
+
+    def test_long_run_without_first_response_keeps_limit(self):
+        limiter = self.limiter(latency_target=0.01)
+        ticket = limiter.acquire()
+        time.sleep(0.03)
+        limiter.release(ticket)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_slow_first_response_decreases_limit(self):
+        limiter = self.limiter(latency_target=0.01)
+        ticket = limiter.acquire()
+        time.sleep(0.03)
+        ticket.responded()
+        limiter.release(ticket)
+
+        self.assertAlmostEqual(limiter.limit, 3.6)
+
+    def test_throttle_halves_and_success_grows_back(self):
+        limiter = self.limiter()
+        limiter.release(limiter.acquire(), Throttled())
+        self.assertEqual((limiter.limit, limiter.throttled), (2, 1))
+
+        limiter.release(limiter.acquire())
+        self.assertAlmostEqual(limiter.limit, 2.5)
+
+    def test_async_waiter_is_granted_on_release(self):
+        limiter = self.limiter(max_in_flight=1)
+
+        async def run():
+            first = await limiter.aacquire()
+            waiter = asyncio.ensure_future(limiter.aacquire())
+            await asyncio.sleep(0.01)
+            self.assertEqual((limiter.in_flight, limiter.waiting), (1, 1))
+            limiter.release(first)
+            second = await waiter
+            self.assertEqual((limiter.in_flight, limiter.waiting), (1, 0))
+            limiter.release(second)
+
+        asyncio.run(run())
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_async_waiter_cancel_and_timeout_leave_no_slot(self):
+        limiter = self.limiter(max_in_flight=1, queue_timeout=0.05)
+
+        async def run():
+            first = await limiter.aacquire()
+            waiter = asyncio.ensure_future(limiter.aacquire())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            with self.assertRaises(AdmissionRejected):
+                await limiter.aacquire()
+            limiter.release(first)
+
+        asyncio.run(run())
+        self.assertEqual((limiter.in_flight, limiter.waiting, limiter.timeouts), (0, 0, 1))
+
+    def test_async_queue_full_is_rejected(self):
+        limiter = self.limiter(max_in_flight=1, max_queue=0)
+
+        async def run():
+            ticket = await limiter.aacquire()
+            with self.assertRaises(AdmissionRejected):
+                await limiter.aacquire()
+            limiter.release(ticket)
+
+        asyncio.run(run())
+        self.assertEqual(limiter.rejected, 1)
+
+
+class SimilarityCacheTests(SimpleTestCase):
+
+    def test_near_duplicate_hits_and_other_model_misses(self):
+        cache = SimilarityCache(path=None, threshold=0.8)
+        cache.add("m", "请介绍一下 PRDA 基本存款账户的开户流程", "答案")
+
+        self.assertEqual(cache.lookup("m", "请介绍一下ｐｒｄａ基本存款账户的开户流程")[0], "答案")
+        self.assertEqual(cache.lookup("m", "  请介绍一下 prda 基本存款账户的开户流程  ")[0], "答案")
+        self.assertIsNone(cache.lookup("other", "请介绍一下 PRDA 基本存款账户的开户流程")[0])
+        self.assertIsNone(cache.lookup("m", "外币账户如何销户")[0])
+
+    def test_symbols_are_significant(self):
+        cache = SimilarityCache(path=None, threshold=0.8)
+        cache.add("m", "3+5", "8")
+
+        self.assertEqual(cache.lookup("m", "3+5")[0], "8")
+        self.assertIsNone(cache.lookup("m", "3-5")[0])
+        self.assertIsNone(cache.lookup("m", "3%5")[0])
+
+    def test_workers_sharing_file_keep_all_entries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "similarity.sqlite3")
+            first, second = SimilarityCache(path=path), SimilarityCache(path=path)
+            first.add("m", "第一个问题", "一")
+            second.add("m", "第二个问题", "二")
+
+            reloaded = SimilarityCache(path=path)
+            self.assertEqual(reloaded.stats()["entries"], 2)
+            self.assertEqual(reloaded.lookup("m", "第二个问题")[0], "二")
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def producer(self, calls, gate, chunks=("a", "b", "c")):
+        def produce():
+            calls.append(threading.current_thread().name)
+            for i, chunk in enumerate(chunks):
+                if i == 1:
+                    gate.wait(2)
+                yield chunk
+        return produce
+
+    def test_follower_joins_inline_leader(self):
+        flights, calls, gate = SingleFlight(), [], threading.Event()
+        leader = flights.stream("k", self.producer(calls, gate))
+        self.assertEqual(next(leader), "a")
+
+        follower = flights.stream("k", self.producer(calls, gate))
+        result = {}
+        thread = threading.Thread(target=lambda: result.setdefault("text", "".join(follower)))
+        thread.start()
+        gate.set()
+        rest = "".join(leader)
+        thread.join(2)
+
+        self.assertEqual(rest, "bc")
+        self.assertEqual(result["text"], "abc")
+        self.assertEqual(calls, [threading.current_thread().name])
+        self.assertEqual(flights.stats(), {"in_flight": 0, "started": 1, "coalesced": 1})
+
+    def test_follower_finishes_after_leader_disconnects(self):
+        flights, calls, gate = SingleFlight(), [], threading.Event()
+        leader = flights.stream("k", self.producer(calls, gate))
+        next(leader)
+        follower = flights.stream("k", self.producer(calls, gate))
+        self.assertEqual(next(follower), "a")
+
+        leader.close()
+        gate.set()
+
+        self.assertEqual("".join(follower), "bc")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+    def test_single_subscriber_keeps_context(self):
+        flights, seen = SingleFlight(), []
+        var = contextvars.ContextVar("var", default=None)
+
+        def produce():
+            seen.append(var.get())
+            yield "x"
+
+        var.set("请求")
+        self.assertEqual("".join(flights.stream("k", produce)), "x")
+        self.assertEqual(seen, ["请求"])
+
+    def test_error_reaches_leader_and_next_call_starts_fresh(self):
+        flights = SingleFlight()
+
+        def broken():
+            yield "a"
+            raise RuntimeError("上游出错")
+
+        with self.assertRaises(RuntimeError):
+            "".join(flights.stream("k", broken))
+        self.assertEqual("".join(flights.stream("k", lambda: (chunk for chunk in ["ok"]))), "ok")
+
+
+class CoalesceTests(SimpleTestCase):
+
+    def test_small_chunks_are_merged_and_first_is_immediate(self):
+        chunks = list(coalesce((f"{i}," for i in range(50)), max_bytes=20, max_delay_ms=1000))
+
+        self.assertEqual(chunks[0], "0,")
+        self.assertEqual("".join(chunks), "".join(f"{i}," for i in range(50)))
+        self.assertLess(len(chunks), 15)
+
+    def test_deadline_flushes_slow_stream(self):
+        def slow():
+            for chunk in "abcd":
+                time.sleep(0.02)
+                yield chunk
+
+        self.assertEqual(list(coalesce(slow(), max_bytes=1024, max_delay_ms=5)), ["a", "b", "c", "d"])
+
+    def test_event_boundary_is_not_held_across_upstream_pause(self):
+        received = []
+
+        def paused():
+            yield "data: 0\n\n"
+            yield "data: 1"
+            yield "\n\n"
+            # 上游停顿期间，已结束的事件应当已经输出
+            self.assertEqual("".join(received), "data: 0\n\ndata: 1\n\n")
+            yield "data: 2\n\n"
+
+        for chunk in coalesce(paused(), max_bytes=1024, max_delay_ms=1000):
+            received.append(chunk)
+        self.assertEqual(received, ["data: 0\n\n", "data: 1\n\n", "data: 2\n\n"])
+
+    def test_buffer_is_flushed_before_error_and_upstream_closed(self):
+        closed = []
+
+        def broken():
+            try:
+                yield "a"
+                yield "b"
+                raise RuntimeError("断开")
+            finally:
+                closed.append(True)
+
+        output = []
+        with self.assertRaises(RuntimeError):
+            for chunk in coalesce(broken(), max_bytes=1024, max_delay_ms=1000):
+                output.append(chunk)
+        self.assertEqual(output, ["a", "b"])
+        self.assertEqual(closed, [True])
+
+    def test_async_merges_chunks(self):
+        async def upstream():
+            for i in range(50):
+                yield f"{i},"
+
+        async def run():
+            return [chunk async for chunk in acoalesce(upstream(), max_bytes=20, max_delay_ms=1000)]
+
+        chunks = asyncio.run(run())
+        self.assertEqual("".join(chunks), "".join(f"{i}," for i in range(50)))
+        self.assertLess(len(chunks), 15)
+
+    def test_async_disconnect_with_full_queue_closes_upstream(self):
+        closed = []
+
+        async def upstream():
+            try:
+                for i in range(50):
+                    yield f"{i},"
+            finally:
+                closed.append(True)
+
+        async def run():
+            stream = acoalesce(upstream(), max_bytes=1024, max_delay_ms=1000)
+            await stream.__anext__()
+            # 让读取任务填满队列并停在 put 上，再模拟客户端断开
+            await asyncio.sleep(0.01)
+            await asyncio.wait_for(stream.aclose(), 1)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        with mock.patch("antapp.openai.coalesce.STREAM_COALESCE_QUEUE", 4):
+            pending = asyncio.run(run())
+        self.assertEqual(pending, [])
+        self.assertEqual(closed, [True])
+
+
+class SidecarTests(SimpleTestCase):
+
+    def test_mixed_type_column_falls_back_to_workbook(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "混合.xlsx")
+            pd.DataFrame({"编号": [1, "A-2", 3.5], "名称": ["甲", "乙", "丙"]}).to_excel(path, index=False)
+
+            df = read_dataset(path)
+
+            self.assertEqual(df["编号"].tolist(), [1, "A-2", 3.5])
+            self.assertFalse(sidecar_path(path.resolve()).exists())
+
+
+class QueryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name, "mixed.xlsx")
+        pd.DataFrame({
+            "名称": ["甲", "乙", "丙", "丁", "戊"],
+            "编号": [3, "B-1", 1, "A-9", None],
+        }).to_excel(self.path, index=False)
+
+    def test_sort_mixed_column(self):
+        result = run_query(self.path, {"sort": ["编号"], "columns": ["名称"]})
+        self.assertEqual([row[0] for row in result["rows"]], ["丙", "甲", "丁", "乙", "戊"])
+
+        result = run_query(self.path, {"sort": ["-编号"], "columns": ["名称"]})
+        self.assertEqual([row[0] for row in result["rows"]], ["乙", "丁", "甲", "丙", "戊"])
+
+    def test_numeric_range_on_mixed_column(self):
+        result = run_query(self.path, {"filters": {"编号__between": "0,2"}, "columns": ["名称"]})
+        self.assertEqual(result["rows"], [["丙"]])
+
+        result = run_query(self.path, {"filters": {"编号__gte": "2"}, "columns": ["名称"]})
+        self.assertEqual(result["rows"], [["甲"]])
+
+    def test_incomparable_condition_is_a_query_error(self):
+        with self.assertRaises(QueryError):
+            run_query(self.path, {"filters": {"编号__gt": "B"}})
+
+
+class ProductCatalogTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def write(self, category, rows):
+        pd.DataFrame(rows, columns=["产品名称", "销售数量", "销售利润"]).to_excel(
+            self.root / f"产品统计表-{category}.xlsx", index=False)
+
+    def test_empty_directory_is_an_aggregation_error(self):
+        with self.assertRaises(AggregationError):
+            ProductCatalog(directory=self.root).aggregate(["品类"], ["销售利润"])
+
+    def test_default_pivot_lists_measures_per_category(self):
+        self.write("背包", [["背包", 2, 10], ["背包", 3, 20]])
+        self.write("钱包", [["钱包", 1, 5]])
+
+        result = ProductCatalog(directory=self.root, max_workers=2).pivot("品类", None, ["销售数量", "销售利润"])
+
+        self.assertEqual(result.index.tolist(), ["背包", "钱包"])
+        self.assertEqual(result.columns.tolist(), ["销售数量", "销售利润"])
+        self.assertEqual(result.values.tolist(), [[5, 30], [1, 5]])
+
+
+class DownsampleTests(SimpleTestCase):
+
+    def test_lttb_keeps_endpoints_and_peak(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[500] = 100
+
+        selected = lttb(x, y, 20)
+
+        self.assertEqual(len(selected), 20)
+        self.assertEqual((selected[0], selected[-1]), (0, 999))
+        self.assertIn(500, selected)
+
+    def test_too_few_points_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "series.xlsx")
+            pd.DataFrame({"x": range(10), "y": range(10)}).to_excel(path, index=False)
+
+            with self.assertRaises(ValueError):
+                downsample(path, "x", "y", 2)
+            self.assertEqual(len(downsample(path, "x", "y", 3)["x"]), 3)
+
+
+class WatcherTests(SimpleTestCase):
+
+    def test_not_started_outside_request_entry_points(self):
+        self.assertIsNone(watcher_module.watcher)
+
+    def test_forked_child_stops_serving_stale(self):
+        with mock.patch.object(watcher_module, "watcher", object()), \
+                mock.patch.object(dataset_cache, "serve_stale", True):
+            watcher_module._reset_after_fork()
+
+            self.assertIsNone(watcher_module.watcher)
+            self.assertFalse(dataset_cache.serve_stale)
+
+
+class CellSearchIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings_patch = self.settings(DATASETS_DIR=self.root / "datas")
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        (self.root / "datas").mkdir()
+        self.book = self.root / "datas" / "名单.xlsx"
+        pd.DataFrame({"姓名": ["张伟", "李娜"]}).to_excel(self.book, index=False)
+        self.index = CellSearchIndex(db_path=self.root / "search.sqlite3")
+
+    def test_refresh_only_reindexes_after_change(self):
+        self.assertEqual(self.index.refresh(), 1)
+        with mock.patch.object(self.index, "update") as update:
+            self.index.refresh()
+            update.assert_not_called()
+        self.assertEqual([hit["value"] for hit in self.index.search("张伟")], ["张伟"])
+
+        pd.DataFrame({"姓名": ["王芳"]}).to_excel(self.book, index=False)
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertEqual(self.index.search("张伟"), [])
+
+    def test_watched_index_skips_refresh_after_first_sync(self):
+        self.index.watched = True
+        self.index.refresh()
+        pd.DataFrame({"姓名": ["王芳"]}).to_excel(self.book, index=False)
+
+        self.assertEqual(self.index.refresh(), 0)
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def test_memory_lru_and_ttl(self):
+        cache = ResponseCache(MemoryBackend(max_entries=2), ttl=60)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), ("1", None, "3"))
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache_key("m", [{"role": "user", "content": "你好"}]),
+                         cache_key("m", [{"content": "你好", "role": "user"}]))
+
+    def test_async_client_reads_sqlite_cache_off_the_event_loop(self):
+        server = FakeOpenAIServer(chunks=2).start()
+        self.addCleanup(server.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = ResponseCache(SQLiteBackend(Path(directory.name, "cache.sqlite3")))
+        threads = []
+        original_get = cache.backend.get
+
+        def get(key, ttl):
+            threads.append(threading.current_thread())
+            return original_get(key, ttl)
+
+        async def ask():
+            client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            text = "".join([chunk async for chunk in
+                            AsyncAiClient(client=client, cache=cache).get_stream_response("你好")])
+            await client.close()
+            return text
+
+        with mock.patch.object(cache.backend, "get", get):
+            first, second = asyncio.run(ask()), asyncio.run(ask())
+
+        self.assertEqual(first, second)
+        self.assertEqual(server.requests, 1)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+def make_record(msg, *args):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args or None, None)
+
+
+class LoggingTests(SimpleTestCase):
+
+    def test_sensitive_fields_are_masked(self):
+        payload_filter = PayloadFilter()
+        record = make_record("请求: %s", {"uscc": "91310000123456789X", "name": "蚂蚁"})
+        payload_filter.filter(record)
+        message = record.getMessage()
+        self.assertIn("91**************9X", message)
+        self.assertNotIn("91310000123456789X", message)
+        self.assertIn("蚂蚁", message)
+
+        record = make_record("响应: %s", json.dumps({"legalIdcardNo": "310101199001011234"}))
+        payload_filter.filter(record)
+        self.assertNotIn("310101199001011234", record.getMessage())
+        self.assertIn("31**************34", record.getMessage())
+
+        record = make_record("证件号 %(legalIdcardNo)s", {"legalIdcardNo": "310101199001011234"})
+        payload_filter.filter(record)
+        self.assertEqual(record.getMessage(), "证件号 31**************34")
+
+    def test_large_dict_renders_only_first_items(self):
+        class Counting(dict):
+            visited = 0
+
+            def items(self):
+                for item in super().items():
+                    Counting.visited += 1
+                    yield item
+
+        payload = Counting({"uscc": "91310000123456789X"})
+        payload.update((f"k{i}", i) for i in range(10000))
+        record = make_record("请求: %s", payload)
+        PayloadFilter().filter(record)
+        self.assertIn("'uscc': '91**************9X'", record.getMessage())
+        self.assertLess(Counting.visited, 100)
+
+    def test_long_arguments_are_truncated(self):
+        record = make_record("%s", "x" * 5000)
+        PayloadFilter(max_chars=100).filter(record)
+        self.assertIn("(共 5000 字符)", record.getMessage())
+        self.assertLess(len(record.getMessage()), 200)
+
+    def test_format_string_and_numbers_survive_filtering(self):
+        record = make_record("x" * 200 + " %s 耗时 %.3fs 共 %d 条", "参数" * 200, np.float32(1.5), np.int64(7))
+        PayloadFilter(max_chars=100).filter(record)
+        message = record.getMessage()
+        self.assertTrue(message.endswith(" 耗时 1.500s 共 7 条"))
+        self.assertIn("(共 400 字符)", message)
+
+    def test_overflow_keeps_stop_sentinel(self):
+        release = threading.Event()
+
+        class Slow(logging.Handler):
+            def emit(self, record):
+                release.wait(5)
+
+        handler = BoundedQueueHandler([Slow()], maxsize=2, overflow="drop_oldest")
+        handler.emit(make_record("a"))
+        time.sleep(0.05)
+        # 后台线程卡在第一条记录上，停止标记入队后继续写日志不能把它挤掉
+        stopper = threading.Thread(target=handler.stop, daemon=True)
+        handler.queue.put(make_record("b"))
+        stopper.start()
+        time.sleep(0.05)
+        for i in range(5):
+            handler.emit(make_record(f"c{i}"))
+        release.set()
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+        self.assertGreater(handler.dropped, 0)
+
+    def test_processes_sharing_a_file_rotate_without_losing_lines(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = Path(workdir) / "app.log"
+            # 两个处理器各自打开文件，相当于两个进程
+            writers = [SharedRotatingFileHandler(path, maxBytes=300, backupCount=50, encoding="utf-8")
+                       for _ in range(2)]
+            lines = [f"第 {i:03d} 行" for i in range(60)]
+            for i, line in enumerate(lines):
+                writers[i % 2].handle(make_record(line))
+            for writer in writers:
+                writer.close()
+
+            files = [f for f in Path(workdir).glob("app.log*") if not f.name.endswith(".lock")]
+            written = [line for f in files for line in f.read_text(encoding="utf-8").splitlines()]
+            self.assertEqual(sorted(written), lines)
+            self.assertTrue(all(f.stat().st_size <= 300 for f in files))
+            self.assertGreaterEqual(len(files), 3)
+            # 另一个进程轮转后，两边都写到新文件
+            self.assertEqual(path.read_text(encoding="utf-8").splitlines()[-2:], lines[-2:])
+
+
+class DatasetCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.loaded = []
+
+    def loader(self, path):
+        self.loaded.append(path.name)
+        return pd.read_csv(path)
+
+    def write(self, name, rows):
+        path = self.root / name
+        pd.DataFrame({"值": rows}).to_csv(path, index=False)
+        return path
+
+    def test_parsed_once_per_file_version(self):
+        cache = DatasetCache(loader=self.loader)
+        path = self.write("a.csv", [1, 2])
+        cache.get(path)
+        self.assertEqual(cache.get_derived(path, "sum", lambda df: int(df["值"].sum())), 3)
+        self.assertEqual(self.loaded, ["a.csv"])
+
+        self.write("a.csv", [1, 2, 3])
+        self.assertEqual(cache.get(path)["值"].tolist(), [1, 2, 3])
+        # 派生数据随文件版本失效
+        self.assertEqual(cache.get_derived(path, "sum", lambda df: int(df["值"].sum())), 6)
+        self.assertEqual(self.loaded, ["a.csv", "a.csv"])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_least_recently_used_is_evicted_over_budget(self):
+        first, second = self.write("a.csv", list(range(100))), self.write("b.csv", list(range(100)))
+        cache = DatasetCache(max_bytes=1, loader=self.loader)
+        cache.get(first)
+        cache.get(second)
+        self.assertFalse(cache.is_cached(first))
+        self.assertTrue(cache.is_cached(second))
+        self.assertEqual(cache.evictions, 1)
+
+
+class NgramIndexTests(SimpleTestCase):
+
+    names = ["张三", "张三丰", "李四", "王小张", None, "欧阳张三", "a.b(c)", "abc"]
+
+    def expected(self, keyword):
+        return [i for i, name in enumerate(self.names) if name is not None and keyword in name]
+
+    def test_matches_substring_scan(self):
+        index = NgramIndex(self.names)
+        for keyword in ["张", "张三", "张三丰", "欧阳张三", "三丰", "李", "赵", "张四", "b(c"]:
+            self.assertEqual(index.search(keyword).tolist(), self.expected(keyword), keyword)
+
+    def test_keyword_is_literal(self):
+        index = NgramIndex(self.names)
+        self.assertEqual(index.search("a.b").tolist(), [6])
+        self.assertEqual(index.search("(").tolist(), [6])
+        self.assertEqual(index.search("").tolist(), list(range(len(self.names))))
+
+
+class PaginationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.frame = pd.DataFrame({"姓名": ["丙", "甲", "乙", "丁"], "成绩": [70, 90, 80, 60]})
+        cache = DatasetCache(loader=lambda path: self.frame)
+        patcher = mock.patch("antapp.datasets.pagination.dataset_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = __file__
+
+    def test_sorted_positions_of_subset(self):
+        self.assertEqual(sorted_positions(self.path, "成绩").tolist(), [3, 0, 2, 1])
+        self.assertEqual(sorted_positions(self.path, "成绩", descending=True).tolist(), [1, 2, 0, 3])
+        self.assertEqual(sorted_positions(self.path, "成绩", rows=[0, 1, 3]).tolist(), [3, 0, 1])
+
+    def test_missing_last_and_ties_stable_in_both_directions(self):
+        self.frame = pd.DataFrame({"成绩": [70, None, 90, 70, None, 60]})
+        self.assertEqual(sorted_positions(self.path, "成绩").tolist(), [5, 0, 3, 2, 1, 4])
+        self.assertEqual(sorted_positions(self.path, "成绩", descending=True).tolist(), [2, 0, 3, 5, 1, 4])
+        self.assertEqual(sorted_positions(self.path, "成绩", rows=[4, 3, 1, 0], descending=True).tolist(),
+                         [0, 3, 1, 4])
+
+    def test_only_current_page_is_materialized(self):
+        positions = sorted_positions(self.path, "成绩", descending=True)
+        page, records = paginate(self.frame, positions, 2, 3)
+        self.assertEqual(records, [{"姓名": "丁", "成绩": 60}])
+        self.assertEqual(page.paginator.num_pages, 2)
+
+        page, records = paginate(self.frame, positions, "99", 3)
+        self.assertEqual(page.number, 2)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(parse_page_size("0"), 1)
+        self.assertEqual(parse_page_size("100000"), MAX_PAGE_SIZE)
+        self.assertEqual(parse_page_size("abc"), DEFAULT_PAGE_SIZE)
+
+
+class WeatherRollupsTests(SimpleTestCase):
+
+    def setUp(self):
+        dates = pd.date_range("2014-01-01", "2015-12-31", freq="D").drop(pd.Timestamp("2015-03-02"))
+        self.rollups = WeatherRollups.build(pd.DataFrame({
+            "日期": dates.strftime("%Y-%m-%d"),
+            "最高温": [10.0 + (d.year - 2014) * 2 for d in dates],
+            "最低温": [0.0] * len(dates),
+        }))
+
+    def test_monthly_and_year_over_year(self):
+        march = self.rollups.range("monthly", "2015-03", "2015-03")
+        self.assertEqual(len(march), 1)
+        self.assertEqual(march["天数"].iloc[0], 30)
+        self.assertEqual(march["平均温"].iloc[0], 6.0)
+        self.assertEqual(march["平均温同比"].iloc[0], 1.0)
+
+        years = self.rollups.range("yearly")
+        self.assertEqual(years["平均温"].tolist(), [5.0, 6.0])
+        self.assertTrue(np.isnan(years["平均温同比"].iloc[0]))
+
+    def test_daily_range_is_inclusive(self):
+        days = self.rollups.range("daily", "2015-03-01", "2015-03-03")
+        self.assertEqual(len(days), 2)
+        with self.assertRaises(ValueError):
+            self.rollups.range("weekly")
+        with self.assertRaises(ValueError):
+            self.rollups.range("daily", "不是日期")
+
+
+class SharedClientTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(ai_client_module, _endpoint_pool=None, _endpoint_pool_pid=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_instances_share_one_client(self):
+        first, second = AiClient(), AiClient()
+        self.assertIs(first.client, second.client)
+        self.assertIs(first.client, ai_client_module.get_shared_client())
+
+    def test_forked_process_builds_its_own_pool(self):
+        pool = ai_client_module.get_endpoint_pool()
+        with mock.patch.object(ai_client_module.os, "getpid", return_value=os.getpid() + 1):
+            self.assertIsNot(ai_client_module.get_endpoint_pool(), pool)
+
+
+class ConversationStoreTests(SimpleTestCase):
+
+    def test_history_trimmed_to_budget_keeping_system_and_latest(self):
+        system = {"role": "system", "content": "你是助手"}
+        budget = estimate_tokens(system) + 2 * estimate_tokens({"content": "问" * 10})
+        conversation = Conversation(max_tokens=budget, messages=[system])
+        for i in range(5):
+            conversation.append({"role": "user", "content": f"问{i}" + "问" * 8})
+        self.assertEqual(conversation.messages[0], system)
+        self.assertEqual([m["content"][:2] for m in conversation.messages[1:]], ["问3", "问4"])
+
+        conversation.append({"role": "user", "content": "长" * 1000})
+        self.assertEqual(len(conversation.messages), 2)
+
+    def test_sessions_are_isolated_and_bounded(self):
+        store = ConversationStore(max_conversations=2, system_prompt="提示")
+        store.get("a").append({"role": "user", "content": "甲"})
+        self.assertEqual(len(store.get("b").messages), 1)
+        store.get("a")
+        store.get("c")
+        self.assertEqual(store.stats()["evicted"], 1)
+        # b 最久未使用，被淘汰后重新创建
+        self.assertEqual(len(store.get("a").messages), 2)
+        self.assertEqual(len(store.get("b").messages), 1)
+
+    def test_explicit_id_is_scoped_to_session(self):
+        factory = RequestFactory()
+
+        def request_from(session):
+            request = factory.get("/", {"conversation_id": "demo"})
+            request.session = session
+            return request
+
+        alice, bob = CacheSessionStore(), CacheSessionStore()
+        store = ConversationStore()
+        store.get(conversation_id_for(request_from(alice))).append({"role": "user", "content": "甲的问题"})
+
+        self.assertEqual(store.get(conversation_id_for(request_from(bob))).messages, [])
+        self.assertEqual(len(store.get(conversation_id_for(request_from(alice))).messages), 1)
+
+    def test_idle_sessions_expire(self):
+        store = ConversationStore(ttl=60)
+        with mock.patch("antapp.openai.conversations.time.monotonic", return_value=1000.0):
+            store.get("a").append({"role": "user", "content": "甲"})
+        with mock.patch("antapp.openai.conversations.time.monotonic", return_value=1100.0):
+            self.assertEqual(store.get("a").messages, [])
+        self.assertEqual(store.stats()["expired"], 1)
+
+
+def png_bytes(size, mode="RGBA"):
+    out = BytesIO()
+    Image.new(mode, size, (255, 0, 0, 128) if mode == "RGBA" else "red").save(out, format="PNG")
+    return out.getvalue()
+
+
+@unittest.skipIf(Image is None, "未安装 Pillow")
+class ImagePipelineTests(SimpleTestCase):
+
+    def test_large_image_is_shrunk_and_reencoded(self):
+        mime, data = preprocess_image(png_bytes((4000, 1000)), max_edge=1000, fmt="JPEG")
+        self.assertEqual((mime, detect_format(data)), ("image/jpeg", "JPEG"))
+        with Image.open(BytesIO(data)) as img:
+            self.assertEqual(img.size, (1000, 250))
+            self.assertNotIn("exif", img.info)
+
+    def test_original_kept_when_reencoding_is_not_smaller(self):
+        image = png_bytes((64, 64), mode="RGB")
+        self.assertEqual(preprocess_image(image, max_edge=1000, fmt="JPEG"), ("image/png", image))
+
+    def test_duplicates_and_repeats_are_processed_once(self):
+        pipeline = ImagePipeline(workers=2)
+        image = png_bytes((10, 10), mode="RGB")
+        with mock.patch("antapp.openai.images.preprocess_image", wraps=preprocess_image) as process:
+            urls = pipeline.data_urls([BytesIO(image), BytesIO(image), BytesIO(b"not an image")])
+            again = pipeline.data_urls([BytesIO(image)])
+        self.assertEqual(len(urls), 2)
+        self.assertEqual(again, urls[:1])
+        # 纯色小图重新编码不会更小，保留原图
+        self.assertTrue(urls[0].startswith("data:image/png;base64,"))
+        # 无法解码的文件原样上传
+        self.assertEqual(urls[1], "data:image/jpeg;base64,bm90IGFuIGltYWdl")
+        self.assertEqual(process.call_count, 2)
+        self.assertEqual((pipeline.stats()["duplicates"], pipeline.stats()["cache_hits"]), (1, 1))
+
+
+class ReasoningStreamTests(SimpleTestCase):
+
+    def test_text_deltas_are_yielded_as_they_arrive(self):
+        with FakeOpenAIServer(chunks=3, text="片段", chunk_delay=0.5) as server:
+            client = OpenAI(api_key="test", base_url=server.base_url, http_client=build_http_client(),
+                            max_retries=0)
+            stream = AiClient(client=client).get_reasoning("为什么")
+            start = time.perf_counter()
+            first = next(stream)
+            # 第一个片段不等整个响应结束
+            self.assertLess(time.perf_counter() - start, 0.5)
+            self.assertEqual(first + "".join(stream), "片段0片段1片段2")
+
+    def test_summary_is_sent_as_reasoning_events(self):
+        with FakeOpenAIServer(chunks=2, text="片段", reasoning_summary=True) as server:
+            client = OpenAI(api_key="test", base_url=server.base_url, http_client=build_http_client(),
+                            max_retries=0)
+            events = list(AiClient(client=client).get_reasoning("为什么", summary=True))
+        self.assertEqual(events[0], "event: reasoning\ndata: 思考0\n\n")
+        self.assertEqual(len(events), 4)
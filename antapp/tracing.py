@@ -0,0 +1,328 @@
+"""
+轻量的分段追踪：记录一次请求内各阶段的耗时、父子关系和属性，导出到本地
+
+用法：
+    with start_span("ams.license_agent", images=2) as span:
+        ...
+        span.set(input_tokens=123)
+
+    @traced("tool.check_blacklist")
+    def check_blacklist(...): ...
+
+当前 span 保存在 contextvars 中，同一个协程/线程内嵌套的 span 自动成为子 span，
+asyncio.to_thread 和任务也会继承。根 span 结束时整条 trace 交给后台线程写出，不阻塞请求。
+TRACE_EXPORTER 可选 sqlite（默认）/ jsonl / off。
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+from antapp.loggingMy import get_logger
+
+logger = get_logger('tracing')
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'sqlite')
+TRACE_PATH = os.getenv('TRACE_PATH', 'logs/traces.sqlite3' if TRACE_EXPORTER == 'sqlite' else 'logs/traces.jsonl')
+# 等待写出的 trace 上限，超出时丢弃新的 trace
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '1000'))
+# 属性值转成字符串后的最大长度
+TRACE_MAX_ATTR_CHARS = int(os.getenv('TRACE_MAX_ATTR_CHARS', '500'))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _attr_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= TRACE_MAX_ATTR_CHARS else text[:TRACE_MAX_ATTR_CHARS] + "..."
+
+
+class Span:
+    """一个阶段：开始/结束时间、父 span、属性和状态"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        # 同一条 trace 的 span 共用一个列表，根 span 结束时一起导出
+        self.spans = parent.spans if parent else []
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+        self.attributes = {}
+        self.set(**(attributes or {}))
+
+    def set(self, **attributes):
+        """设置属性，值为 None 的忽略"""
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = _attr_value(value)
+        return self
+
+    def record_error(self, error):
+        self.status = "error"
+        self.error = _attr_value(f"{type(error).__name__}: {error}")
+
+    def end(self):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.spans.append(self)
+        if self.parent is None and exporter is not None:
+            exporter.export(self.spans)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name, **attributes):
+    """开始一个 span，当前有 span 时作为其子 span"""
+    span = Span(name, parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name=None, **attributes):
+    """把整个函数/协程作为一个 span 的装饰器"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(span, result):
+    """把 Runner.run 结果中的 token 用量写到 span 上"""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    if usage is not None:
+        span.set(requests=usage.requests, input_tokens=usage.input_tokens,
+                 output_tokens=usage.output_tokens, total_tokens=usage.total_tokens)
+
+
+def _build_tree(spans):
+    """平铺的 span 列表转成以根 span 为起点的树"""
+    nodes = {span["span_id"]: dict(span, children=[]) for span in spans}
+    root = None
+    for node in sorted(nodes.values(), key=lambda n: n["start_time"]):
+        parent = nodes.get(node["parent_id"])
+        if parent is not None:
+            parent["children"].append(node)
+        elif root is None or node["parent_id"] is None:
+            root = node
+    return root
+
+
+class SQLiteSink:
+    """spans 表：每个 span 一行，根 span 的 parent_id 为空"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS spans ("
+                         "span_id TEXT PRIMARY KEY, trace_id TEXT, parent_id TEXT, name TEXT, "
+                         "start_time REAL, duration REAL, status TEXT, error TEXT, attributes TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS spans_trace ON spans (trace_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS spans_root_duration ON spans (parent_id, duration)")
+            conn.commit()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def write(self, spans):
+        with closing(self._connect()) as conn:
+            conn.executemany("INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (s["span_id"], s["trace_id"], s["parent_id"], s["name"], s["start_time"], s["duration"],
+                 s["status"], s["error"], json.dumps(s["attributes"], ensure_ascii=False))
+                for s in spans
+            ])
+            conn.commit()
+
+    def _rows(self, conn, sql, params):
+        columns = ("span_id", "trace_id", "parent_id", "name", "start_time", "duration", "status", "error",
+                   "attributes")
+        rows = []
+        for row in conn.execute(sql, params):
+            span = dict(zip(columns, row))
+            span["attributes"] = json.loads(span["attributes"] or "{}")
+            rows.append(span)
+        return rows
+
+    def slowest(self, limit, name=None):
+        sql = "SELECT * FROM spans WHERE parent_id IS NULL"
+        params = []
+        if name:
+            sql += " AND name = ?"
+            params.append(name)
+        sql += " ORDER BY duration DESC LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            return self._rows(conn, sql, params)
+
+    def trace(self, trace_id):
+        with closing(self._connect()) as conn:
+            return self._rows(conn, "SELECT * FROM spans WHERE trace_id = ?", (trace_id,))
+
+
+class JSONLSink:
+    """每个 span 一行 JSON，便于 grep/jq；查询时全量扫描，适合开发环境"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+    def write(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    def _spans(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+
+    def slowest(self, limit, name=None):
+        roots = [s for s in self._spans() if s["parent_id"] is None and (not name or s["name"] == name)]
+        return sorted(roots, key=lambda s: s["duration"] or 0, reverse=True)[:limit]
+
+    def trace(self, trace_id):
+        return [s for s in self._spans() if s["trace_id"] == trace_id]
+
+
+class TraceExporter:
+    """在后台线程中把结束的 trace 写到本地存储，队列满时丢弃并计数"""
+
+    def __init__(self, sink, maxsize=TRACE_QUEUE_SIZE):
+        self.sink = sink
+        self.dropped = 0
+        self.exported = 0
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # fork 出的 worker 进程里需要重新启动写出线程
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def export(self, spans):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait([span.to_dict() for span in spans])
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                self._queue.task_done()
+                return
+            try:
+                self.sink.write(spans)
+                with self._lock:
+                    self.exported += 1
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("写出 trace 失败: %s", str(e))
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的 trace 全部写出"""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def slowest(self, limit=20, name=None):
+        """最慢的若干条 trace（根 span），按耗时降序"""
+        return self.sink.slowest(limit, name)
+
+    def trace(self, trace_id):
+        """一条 trace 的 span 树，不存在时返回 None"""
+        spans = self.sink.trace(trace_id)
+        return _build_tree(spans) if spans else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sink": type(self.sink).__name__,
+                "path": self.sink.path,
+                "exported": self.exported,
+                "dropped": self.dropped,
+                "pending": self._queue.qsize(),
+            }
+
+
+def build_exporter(kind=TRACE_EXPORTER, path=TRACE_PATH):
+    """根据配置创建导出器，kind 为 off 时返回 None"""
+    if kind == "sqlite":
+        return TraceExporter(SQLiteSink(path))
+    if kind == "jsonl":
+        return TraceExporter(JSONLSink(path))
+    return None
+
+
+# 进程级共享实例
+exporter = build_exporter()
+if exporter is not None:
+    atexit.register(exporter.flush)
@@ -1,21 +1,46 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import views, views_async
 from .views import deepseek_agent_stream
 from .views_bank import bank_business, ams_agent
+from . import views_datasets
+
+# ASGI 部署时流式接口切换为异步视图
+stream_views = views_async if getattr(settings, "ASYNC_STREAMING", False) else views
 
 urlpatterns = [
     path("hello/", views.hello),
     path("", views.index),
     path("show_excel/", views.show_excel),
     path("userManage/", views.userManage),
-    path("deepseek/", views.deepseek),
-    path("deepseek_old/", views.deepseek_old),
-    path("deepseek_ams/", views.deepseek_ams),
+    path("deepseek/", stream_views.deepseek),
+    path("deepseek_old/", stream_views.deepseek_old),
+    path("deepseek_ams/", stream_views.deepseek_ams),
     path("deepseek_reasoning/", views.deepseek_reasoning),
-    path("deepseek_agent_stream/", deepseek_agent_stream),
+    path("deepseek_agent_stream/", stream_views.deepseek_agent_stream),
+    path("api/ai/stats/", views.ai_stats),
+    path("metrics", views.metrics),
+    path("api/traces/slowest/", views.slowest_traces),
+    path("api/traces/<str:trace_id>/", views.trace_detail),
+
+    # 异步流式接口（需要 ASGI）
+    path("async/deepseek/", views_async.deepseek),
+    path("async/deepseek_old/", views_async.deepseek_old),
+    path("async/deepseek_ams/", views_async.deepseek_ams),
+    path("async/deepseek_agent_stream/", views_async.deepseek_agent_stream),
     
     # 银行业务代理系统路由 - 统一入口
     path('api/bank/business/', bank_business),
     path('api/bank/ams/', ams_agent),
+
+    # 数据集接口
+    path('api/datasets/', views_datasets.dataset_list),
+    path('api/datasets/stats/', views_datasets.dataset_stats),
+    path('api/datasets/search/', views_datasets.dataset_search),
+    path('api/datasets/products/aggregate/', views_datasets.product_aggregate),
+    path('api/datasets/products/pivot/', views_datasets.product_pivot),
+    path('api/datasets/<path:name>/query/', views_datasets.dataset_query),
+    path('api/datasets/<path:name>/downsample/', views_datasets.dataset_downsample),
+    path('api/weather/rollups/', views_datasets.weather_rollups_view),
 ]
@@ -1,12 +1,23 @@
 from django.shortcuts import render
 from django.http import HttpResponse
-import pandas as pd
+import numpy as np
 from antproject.settings import BASE_DIR
 from django.views.decorators.csrf import csrf_exempt
 from django.http import StreamingHttpResponse
-from antapp.openai.aiClient import AiClient  # type: ignore
+from antapp.openai.aiClient import AiClient, get_endpoint_pool, reasoning_ttfb  # type: ignore
+from antapp.openai.conversations import conversation_id_for, conversation_store
+from antapp.openai.response_cache import response_cache
+from antapp.metrics import REGISTRY
+from antapp.openai.admission import admission
+from antapp.openai.images import image_pipeline
+from antapp.openai.similarity_cache import similarity_cache
+from antapp.openai.single_flight import single_flight
 import base64
 from antapp.openai.agents.stream import main
+from antapp.datasets import load_dataset, text_index
+from antapp.streaming import stream_response
+from antapp.tracing import exporter as trace_exporter
+from antapp.datasets.pagination import paginate, parse_page_size, sorted_positions
 import json
 import os
 import logging
@@ -19,8 +30,6 @@ logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-aiClient = AiClient()
-
 # 保存业务状态的简单存储（实际应用中应使用数据库）
 business_data = {
     "license_info": None,
@@ -33,14 +42,33 @@ def hello(request):
 def index(request):
     return render(request,"index.html")
 
+STUDENT_SCORES = "数据-学生成绩表.xlsx"
+SCORE_COLUMNS = ["语文", "数学", "英语"]
+
 def show_excel(request):
-    df = pd.read_excel(BASE_DIR /"datas/数据-学生成绩表.xlsx")
-    if request.method == "POST":
-        keyword = request.POST.get("keyword")
-        df = df[df["姓名"].str.contains(keyword.strip())]
-        return render(request, "show_excel.html", {"df": df,"keyword": keyword})
+    df = load_dataset(STUDENT_SCORES)
+    params = request.POST if request.method == "POST" else request.GET
+    keyword = (params.get("keyword") or "").strip()
+    sort = params.get("sort") if params.get("sort") in SCORE_COLUMNS else ""
+    order = "asc" if params.get("order") == "asc" else "desc"
+
+    rows = text_index(STUDENT_SCORES, "姓名").search(keyword) if keyword else None
+    if sort:
+        positions = sorted_positions(STUDENT_SCORES, sort, rows, descending=order == "desc")
     else:
-        return render(request, "show_excel.html", {"df": df})
+        positions = rows if rows is not None else np.arange(len(df))
+
+    page_obj, records = paginate(df, positions, params.get("page"), parse_page_size(params.get("page_size")))
+    return render(request, "show_excel.html", {
+        "rows": records,
+        "page_obj": page_obj,
+        "total": page_obj.paginator.count,
+        "keyword": keyword,
+        "sort": sort,
+        "order": order,
+        "page_size": page_obj.paginator.per_page,
+        "score_columns": SCORE_COLUMNS,
+    })
 
 def userManage(request):
     return render(request, "userManage.html")
@@ -57,7 +85,7 @@ def deepseek(request):
         for image in images:
             print(image.name)
 
-        return StreamingHttpResponse(content)
+        return stream_response(content)
     
     return HttpResponse("清除成功")
 
@@ -66,14 +94,15 @@ def deepseek_old(request):
     if request.method == "POST":
         images = request.FILES.getlist('images')
         keyword = request.POST.get("content")
+        aiClient = AiClient(conversation=conversation_store.get(conversation_id_for(request)))
         content = aiClient.get_stream_response_old(keyword)
         
         # 处理图片（如果需要的话）
         for image in images:
             print(image.name)
 
-        return StreamingHttpResponse(content)
-    aiClient.clear_messages()
+        return stream_response(content)
+    conversation_store.clear(conversation_id_for(request))
     return HttpResponse("清除成功")
 
 @csrf_exempt
@@ -81,9 +110,9 @@ def deepseek_ams(request):
     if request.method == "POST":
         images = request.FILES.getlist('images')
         keyword = request.POST.get("content")
-        content = aiClient.get_file_image(keyword, images)
-        return StreamingHttpResponse(content)
-    aiClient.clear_messages()
+        content = AiClient().get_file_image(keyword, images)
+        return stream_response(content)
+    conversation_store.clear(conversation_id_for(request))
     return HttpResponse("清除成功")
 
 @csrf_exempt
@@ -92,8 +121,12 @@ def deepseek_reasoning(request):
     if request.method == "POST":
         images = request.FILES.getlist('images')
         keyword = request.POST.get("content")
-        content = aiClient.get_reasoning(keyword)
-        return StreamingHttpResponse(content)
+        # summary=1 时以 SSE 返回，推理摘要使用单独的 reasoning 事件
+        summary = request.POST.get("summary") == "1"
+        content = aiClient.get_reasoning(keyword, summary=summary)
+        if summary:
+            return stream_response(content, content_type="text/event-stream")
+        return stream_response(content)
     
     return HttpResponse("清除成功")
 
@@ -104,5 +137,41 @@ def deepseek_agent_stream(request):
         keyword = request.POST.get("content")
         content = main(keyword)
         return StreamingHttpResponse(content)
-    aiClient.clear_messages()
+    conversation_store.clear(conversation_id_for(request))
     return HttpResponse("清除成功")
+
+def ai_stats(request):
+    """模型调用相关的缓存统计"""
+    return JsonResponse({
+        "response_cache": response_cache.stats() if response_cache else None,
+        "similarity_cache": similarity_cache.stats() if similarity_cache else None,
+        "single_flight": single_flight.stats() if single_flight else None,
+        "conversations": conversation_store.stats(),
+        "images": image_pipeline.stats(),
+        "reasoning_ttfb": reasoning_ttfb.stats(),
+        "admission": admission.stats(),
+        "endpoints": get_endpoint_pool().stats(),
+        "traces": trace_exporter.stats() if trace_exporter else None,
+    }, json_dumps_params={"ensure_ascii": False})
+
+def metrics(request):
+    """Prometheus 文本格式的指标"""
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def slowest_traces(request):
+    """最慢的若干条 trace（根 span），可按名称过滤，如 ?name=ams.main&limit=20"""
+    if trace_exporter is None:
+        return JsonResponse({"error": "未启用追踪（TRACE_EXPORTER=off）"}, status=404)
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 200)
+    except ValueError:
+        limit = 20
+    traces = trace_exporter.slowest(limit, request.GET.get("name") or None)
+    return JsonResponse({"traces": traces}, json_dumps_params={"ensure_ascii": False})
+
+def trace_detail(request, trace_id):
+    """一条 trace 的 span 树"""
+    tree = trace_exporter.trace(trace_id) if trace_exporter else None
+    if tree is None:
+        return JsonResponse({"error": "trace 不存在"}, status=404)
+    return JsonResponse(tree, json_dumps_params={"ensure_ascii": False})
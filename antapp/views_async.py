@@ -0,0 +1,60 @@
+"""
+流式接口的异步版本，在 ASGI（antproject/asgi.py）下使用
+
+StreamingHttpResponse 直接消费异步生成器，等待模型输出时不占用 worker 线程，
+一个 worker 可以同时保持数百个流式连接。WSGI 下异步迭代器会被整体缓冲后才返回，
+因此只有设置 ASYNC_STREAMING 时 /deepseek/ 等默认路由才会切换到这里的视图。
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from antapp.openai.asyncAiClient import AsyncAiClient
+from antapp.openai.conversations import conversation_id_for, conversation_store
+from antapp.openai.agents.stream import async_main
+from antapp.streaming import astream_response
+
+logger = logging.getLogger(__name__)
+
+# session 可能需要写数据库，在线程中执行
+aconversation_id_for = sync_to_async(conversation_id_for)
+
+def _csrf_exempt(view):
+    # csrf_exempt 在 Django 5.0 之前会把异步视图包装成同步函数，这里直接设置标记
+    view.csrf_exempt = True
+    return view
+
+@_csrf_exempt
+async def deepseek(request):
+    if request.method == "POST":
+        keyword = request.POST.get("content")
+        content = AsyncAiClient().get_stream_response(keyword)
+        return await astream_response(content)
+    return HttpResponse("清除成功")
+
+@_csrf_exempt
+async def deepseek_old(request):
+    if request.method == "POST":
+        keyword = request.POST.get("content")
+        conversation = conversation_store.get(await aconversation_id_for(request))
+        content = AsyncAiClient(conversation=conversation).get_stream_response_old(keyword)
+        return await astream_response(content)
+    conversation_store.clear(await aconversation_id_for(request))
+    return HttpResponse("清除成功")
+
+@_csrf_exempt
+async def deepseek_ams(request):
+    if request.method == "POST":
+        images = request.FILES.getlist('images')
+        keyword = request.POST.get("content")
+        content = AsyncAiClient().get_file_image(keyword, images)
+        return await astream_response(content)
+    conversation_store.clear(await aconversation_id_for(request))
+    return HttpResponse("清除成功")
+
+@_csrf_exempt
+async def deepseek_agent_stream(request):
+    if request.method == "POST":
+        keyword = request.POST.get("content")
+        return async_main(keyword)
+    conversation_store.clear(await aconversation_id_for(request))
+    return HttpResponse("清除成功")
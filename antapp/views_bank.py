@@ -3,6 +3,8 @@ import asyncio
 from django.http import StreamingHttpResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .agents.ams import main
+from .openai.admission import AdmissionRejected
+from .streaming import overloaded_response
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +14,10 @@ def bank_business(request):
         images = request.FILES.getlist('images')
         keyword = request.POST.get("content")
         # 使用 asyncio.run 运行异步函数
-        content = asyncio.run(main(keyword, images))
+        try:
+            content = asyncio.run(main(keyword, images))
+        except AdmissionRejected as e:
+            return overloaded_response(e)
         return HttpResponse(content)
     return HttpResponse("清除成功")
 
@@ -22,6 +27,9 @@ def ams_agent(request):
         images = request.FILES.getlist('images')
         keyword = request.POST.get("content")
         # 使用 asyncio.run 运行异步函数
-        content = asyncio.run(main(keyword, images))
+        try:
+            content = asyncio.run(main(keyword, images))
+        except AdmissionRejected as e:
+            return overloaded_response(e)
         return HttpResponse(content)
     return HttpResponse("清除成功")
\ No newline at end of file
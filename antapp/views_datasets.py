@@ -0,0 +1,135 @@
+import logging
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from .datasets import dataset_cache
+from .datasets.downsample import downsample
+from .datasets.paths import datas_dir
+from .datasets.products import CATEGORY_COLUMN, AggregationError, product_catalog
+from .datasets.query import QueryError, parse_query_body, parse_query_params, run_query
+from .datasets.weather import weather_rollups
+from .datasets.search_index import cell_index
+from .datasets.registry import DatasetNotFound, dataset_path, registered_datasets
+
+logger = logging.getLogger(__name__)
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False, "separators": (",", ":")})
+
+def dataset_stats(request):
+    """数据集缓存命中/未命中及加载耗时计数"""
+    return _json(dataset_cache.stats())
+
+def dataset_list(request):
+    """已注册的数据集列表"""
+    root = datas_dir()
+    return _json({"datasets": [
+        {"name": name, "path": str(path.relative_to(root)) if path.is_relative_to(root) else path.name}
+        for name, path in registered_datasets().items()
+    ]})
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def dataset_query(request, name):
+    """
+    数据集查询接口
+
+    GET 参数形式：?数学__gte=80&姓名__contains=伟&columns=学号,姓名&sort=-数学&limit=10&offset=0&orient=columns
+    POST JSON 形式：{"filters": {"数学__gte": 80}, "columns": [...], "sort": ["-数学"], "limit": 10, "orient": "columns"}
+    """
+    try:
+        path = dataset_path(name)
+        spec = parse_query_body(request.body) if request.method == "POST" else parse_query_params(request.GET)
+        result = run_query(path, spec)
+    except DatasetNotFound:
+        return _json({"error": f"数据集不存在: {name}"}, status=404)
+    except QueryError as e:
+        return _json({"error": str(e)}, status=400)
+    result["dataset"] = name
+    return _json(result)
+
+def _split(value):
+    return [v for v in (value or "").split(",") if v]
+
+def product_aggregate(request):
+    """
+    产品统计表分组聚合
+
+    ?by=品类&values=销售收入,销售利润&agg=sum
+    """
+    by = _split(request.GET.get("by")) or [CATEGORY_COLUMN]
+    values = _split(request.GET.get("values")) or ["销售数量", "销售收入", "销售利润"]
+    try:
+        result = product_catalog.aggregate(by, values, request.GET.get("agg", "sum"))
+    except AggregationError as e:
+        return _json({"error": str(e)}, status=400)
+    return _json({"columns": list(result.columns), "rows": result.values.tolist()})
+
+def product_pivot(request):
+    """
+    产品统计表透视
+
+    ?index=品类&columns=销售价&values=销售利润&agg=sum
+
+    默认不拆分列，按品类列出销量、收入、利润（每个品类只有一种产品，按产品名称拆分只会得到对角表）
+    """
+    index = request.GET.get("index", CATEGORY_COLUMN)
+    columns = request.GET.get("columns") or None
+    values = _split(request.GET.get("values")) or ["销售数量", "销售收入", "销售利润"]
+    try:
+        result = product_catalog.pivot(index, columns, values, request.GET.get("agg", "sum"))
+    except AggregationError as e:
+        return _json({"error": str(e)}, status=400)
+    return _json({
+        "index": result.index.tolist(),
+        "columns": result.columns.tolist(),
+        "data": result.values.tolist(),
+    })
+
+def weather_rollups_view(request):
+    """
+    北京天气汇总数据
+
+    ?freq=monthly&start=2015-01&end=2016-12，freq 可选 daily / monthly / yearly
+    """
+    try:
+        frame = weather_rollups().range(request.GET.get("freq", "monthly"),
+                                        request.GET.get("start"), request.GET.get("end"))
+    except ValueError as e:
+        return _json({"error": str(e)}, status=400)
+    frame = frame.assign(日期=frame["日期"].dt.strftime("%Y-%m-%d")).round(2)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return _json({"columns": list(frame.columns), "rows": frame.values.tolist()})
+
+def dataset_downsample(request, name):
+    """
+    序列降采样（LTTB），用于前端绘制大数据量图表
+
+    ?x=日期&y=最高温&n=500&start=2015-01-01&end=2018-12-31
+    """
+    try:
+        result = downsample(dataset_path(name), request.GET.get("x", "日期"), request.GET.get("y", ""),
+                            request.GET.get("n", 500), request.GET.get("start"), request.GET.get("end"))
+    except DatasetNotFound:
+        return _json({"error": f"数据集不存在: {name}"}, status=404)
+    except KeyError as e:
+        return _json({"error": f"未知列: {e.args[0]}"}, status=400)
+    except ValueError as e:
+        return _json({"error": str(e)}, status=400)
+    result["dataset"] = name
+    return _json(result)
+
+def dataset_search(request):
+    """
+    跨工作簿单元格搜索
+
+    ?q=张伟&limit=50，返回命中的文件、工作表、行、列
+    """
+    try:
+        limit = int(request.GET.get("limit", 50))
+    except ValueError:
+        return _json({"error": "limit 必须是整数"}, status=400)
+    # 只重新索引变化过的文件，通常只是一次 stat 比较
+    cell_index.refresh()
+    hits = cell_index.search(request.GET.get("q", ""), limit)
+    return _json({"hits": hits, "count": len(hits)})
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "antproject.settings")
 
 application = get_asgi_application()
+
+# 只在处理请求的进程中监听 datas/ 目录，文件替换后在后台预热数据集缓存
+from antapp.datasets.watcher import start_watcher  # noqa: E402
+
+start_watcher()
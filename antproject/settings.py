@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "antapp.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -70,6 +72,19 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "antproject.wsgi.application"
 
+ASGI_APPLICATION = "antproject.asgi.application"
+
+# 以 ASGI 部署（如 uvicorn antproject.asgi:application）时开启，
+# /deepseek/ 等流式接口改用 views_async 中基于异步生成器的视图
+ASYNC_STREAMING = os.getenv("ASYNC_STREAMING", "0") == "1"
+
+# 每个模型同时进行的上游请求数上限（见 antapp/openai/admission.py），超出的请求排队，排满后返回 503。
+# 同步视图的并发本来就受 worker 线程数限制，上限与线程数相当即可；
+# ASGI 异步视图每个流只占一个协程，上限决定单个进程能同时保持多少个流，需要按上游配额调大或调小。
+# OPENAI_MODEL_LIMITS（如 "gpt-4.1-mini=32,o4-mini=4"）可以按模型覆盖，对同步和异步调用都生效
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "16"))
+OPENAI_ASYNC_MAX_IN_FLIGHT = int(os.getenv("OPENAI_ASYNC_MAX_IN_FLIGHT", "256"))
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
@@ -118,6 +133,37 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# 数据集文件目录及进程内数据集缓存的内存预算（字节）
+DATASETS_DIR = BASE_DIR / "datas"
+
+DATASET_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# 数据集别名，/api/datasets/<name>/query/ 中可以直接使用
+DATASET_ALIASES = {
+    "students": "数据-学生成绩表.xlsx",
+    "weather": "北京10年天气数据.xlsx",
+}
+
+# 是否为工作簿生成 Arrow 列式 sidecar 文件（需要安装 pyarrow）
+DATASET_SIDECARS = True
+
+# 跨工作簿单元格全文索引（SQLite FTS5）
+DATASET_SEARCH_DB = BASE_DIR / "dataset_search.sqlite3"
+
+# 是否在后台监听 datas/ 目录，文件变化后重建 sidecar 并预热缓存
+DATASET_WATCHER = True
+
+# 日志经有界队列由后台线程写出（见 antapp/loggingMy.py），Django 自身的日志走同一个队列
+if os.getenv("LOG_ASYNC", "1") == "1":
+    LOGGING = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "handlers": {
+            "queue": {"()": "antapp.loggingMy.queue_handler"},
+        },
+        "root": {"handlers": ["queue"], "level": "INFO"},
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
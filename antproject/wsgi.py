@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "antproject.settings")
 
 application = get_wsgi_application()
+
+# 只在处理请求的进程中监听 datas/ 目录，文件替换后在后台预热数据集缓存
+from antapp.datasets.watcher import start_watcher  # noqa: E402
+
+start_watcher()